@@ -3,6 +3,12 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Servidor recomendado para o login assíncrono (core/autenticacao.py):
+    WEB_CONCURRENCY=2 CACHE_BACKEND=redis RELATORIO_CACHE_BACKEND=redis uvicorn config.asgi:application
+Com mais de um worker, os caches precisam ser compartilhados (config/settings.py).
+No ASGI, o padrão é o pool de conexões do psycopg (DB_POOL) em vez de conexões
+persistentes (DB_CONN_MAX_AGE=0), como recomenda a documentação do Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +18,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Conexões do banco pelo pool, sem conexões persistentes (config/settings.py)
+os.environ.setdefault('SERVIDOR_ASGI', 'True')
 
 application = get_asgi_application()
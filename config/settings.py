@@ -12,7 +12,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+import sys
+import copy
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,25 +42,31 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Apps do projeto
     'core',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.ReplicaLeituraMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.UsuarioLogadoMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PerfiladorMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates com medição do tempo de renderização (Server-Timing)
+        'BACKEND': 'core.instrumentacao.DjangoTemplatesInstrumentado',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,23 +82,293 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+# Servidor ASGI (uvicorn config.asgi:application): login assíncrono, ver core/autenticacao.py
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME', default='lumon_db'),
-        'USER': config('DB_USER', default='lumon_user'),
-        'PASSWORD': config('DB_PASSWORD', default='lumon123'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='5432'),
+# DB_ENGINE=sqlite permite rodar o projeto e os testes sem PostgreSQL
+# (a busca por similaridade cai para busca simples por substring)
+DB_ENGINE = config('DB_ENGINE', default='postgresql')
+
+# Definida por config/asgi.py. No servidor ASGI o Django recomenda desativar as
+# conexões persistentes (cada requisição síncrona pode rodar em outra thread, que
+# abriria e manteria a própria conexão) e usar o pool do backend: lá o padrão é
+# DB_POOL=True e DB_CONN_MAX_AGE=0.
+SERVIDOR_ASGI = config('SERVIDOR_ASGI', default=False, cast=bool)
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='lumon_db'),
+            'USER': config('DB_USER', default='lumon_user'),
+            'PASSWORD': config('DB_PASSWORD', default='lumon123'),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # Conexões persistentes: reaproveitadas entre requisições por até
+            # DB_CONN_MAX_AGE segundos, verificadas antes do reuso (health check)
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0 if SERVIDOR_ASGI else 60, cast=int),
+            'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+            'OPTIONS': {},
+        }
+    }
+
+    # Pool de conexões do psycopg 3 (psycopg_pool), compartilhado pelas threads
+    # do processo. Substitui as conexões persistentes (o Django exige CONN_MAX_AGE=0).
+    if config('DB_POOL', default=SERVIDOR_ASGI, cast=bool):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            # Espera máxima (s) por uma conexão livre antes de erro
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+            # Conexões ociosas acima de min_size são fechadas após max_idle (s)
+            'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+            # Toda conexão é renovada após max_lifetime (s)
+            'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800, cast=float),
+        }
+
+# Réplicas de leitura (core.roteador.RoteadorReplicas), separadas por vírgula:
+# no PostgreSQL, host[:porta][/banco] (usuário, senha e pool iguais aos do primário);
+# no SQLite, o caminho do arquivo. Sem réplicas, tudo vai para o primário.
+DATABASE_REPLICAS = []
+for indice, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    alias = f'replica{indice}'
+    DATABASES[alias] = copy.deepcopy(DATABASES['default'])
+    if DB_ENGINE == 'sqlite':
+        DATABASES[alias]['NAME'] = replica
+    else:
+        endereco, _, banco = replica.partition('/')
+        host, _, porta = endereco.partition(':')
+        DATABASES[alias].update({
+            'HOST': host,
+            'PORT': porta or DATABASES['default']['PORT'],
+            'NAME': banco or DATABASES['default']['NAME'],
+        })
+    # Nos testes a réplica usa o mesmo banco de teste do primário
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# Em "manage.py test" sem DB_REPLICAS: alias espelho do primário, para que os testes
+# do roteamento (core.tests.ReplicasBancoTests) leiam de um segundo banco de verdade.
+# Fica fora de DATABASE_REPLICAS: os demais testes continuam sem réplicas
+if not DATABASE_REPLICAS and sys.argv[1:2] == ['test']:
+    DATABASES['replica_teste'] = copy.deepcopy(DATABASES['default'])
+    DATABASES['replica_teste']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.roteador.RoteadorReplicas']
+
+# Os índices de cobertura (include) de Usuario valem só no PostgreSQL;
+# no SQLite as colunas incluídas são ignoradas
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Após um POST, a sessão lê do primário por este tempo (segundos), para que o
+# redirect depois de criar/alterar não mostre dados ainda não replicados
+REPLICA_FIXACAO_SEGUNDOS = config('DB_REPLICA_FIXACAO', default=5, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Backends: locmem (padrão; um processo), arquivo (mesmo servidor) ou redis (pacote
+# redis e um servidor local ou compatível; cada alias usa um banco do redis, pois
+# clear() apaga o banco inteiro).
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+SESSAO_CACHE_BACKEND = config('SESSAO_CACHE_BACKEND', default='locmem')
+RELATORIO_CACHE_BACKEND = config('RELATORIO_CACHE_BACKEND', default='locmem')
+BACKENDS_CACHE = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'arquivo': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+
+def configurar_cache(backend, variavel_location, nome, banco_redis):
+    """
+    Configuração de um alias de CACHES; LOCATION vem da variável do .env ou,
+    sem ela, de um padrão conforme o backend.
+    """
+    return {
+        'BACKEND': BACKENDS_CACHE[backend],
+        'LOCATION': config(variavel_location, default={
+            'arquivo': str(BASE_DIR / 'cache' / nome),
+            'redis': f'redis://127.0.0.1:6379/{banco_redis}',
+        }.get(backend, f'lumon-{nome}')),
+    }
+
+
+CACHES = {
+    # Cache geral: usuário logado, versões das tabelas (ETags e chaves dos relatórios),
+    # perfis e departamentos e limite de tentativas de login. Com vários workers
+    # precisa ser compartilhado (arquivo ou redis), senão uma escrita em um worker
+    # não renova as versões vistas pelos demais. No backend arquivo, incr() e add()
+    # não são atômicos entre processos; em produção prefira redis.
+    'default': configurar_cache(CACHE_BACKEND, 'CACHE_LOCATION', 'geral', 0),
+    # Sessões (SESSAO_ARMAZENAMENTO=cache ou cached_db), separadas do cache
+    # geral para que um cache.clear() não desconecte ninguém.
+    'sessoes': configurar_cache(SESSAO_CACHE_BACKEND, 'SESSAO_CACHE_LOCATION', 'sessoes', 1),
+    # Corpo renderizado do relatório (core.relatorios.corpo_relatorio), separado
+    # do cache geral: páginas grandes não expulsam usuários e versões do locmem.
+    'relatorios': configurar_cache(RELATORIO_CACHE_BACKEND, 'RELATORIO_CACHE_LOCATION', 'relatorios', 2),
 }
 
 
+# Sessões e mensagens
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#configuring-the-session-engine
+
+# SESSAO_ARMAZENAMENTO:
+#   db        - tabela django_session (uma escrita por login/alteração da sessão);
+#   cached_db - grava no banco e no cache, lê do cache (menos leituras, mesmas escritas);
+#   cache     - apenas no cache, sem tráfego no banco (sessões somem se o cache for limpo).
+# O padrão é db: cached_db e cache exigem um cache 'sessoes' compartilhado entre
+# os processos, senão um logout em um worker não vale para os demais.
+SESSAO_ARMAZENAMENTO = config('SESSAO_ARMAZENAMENTO', default='db')
+MOTORES_SESSAO = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+}
+SESSION_ENGINE = MOTORES_SESSAO[SESSAO_ARMAZENAMENTO]
+SESSION_CACHE_ALIAS = 'sessoes'
+
+# Processos do servidor (WEB_CONCURRENCY, lida também pelo uvicorn e pelo gunicorn
+# como número de workers). Com mais de um, os caches que guardam estado entre
+# requisições não podem ser locmem, que é separado em cada processo.
+WORKERS = config('WEB_CONCURRENCY', default=1, cast=int)
+if WORKERS > 1:
+    caches_locais = [
+        alias for alias, backend in (
+            ('CACHE_BACKEND', CACHE_BACKEND),
+            ('RELATORIO_CACHE_BACKEND', RELATORIO_CACHE_BACKEND),
+            ('SESSAO_CACHE_BACKEND', SESSAO_CACHE_BACKEND if SESSAO_ARMAZENAMENTO != 'db' else None),
+        ) if backend == 'locmem'
+    ]
+    if caches_locais:
+        raise ImproperlyConfigured(
+            f'WEB_CONCURRENCY={WORKERS} exige caches compartilhados: defina '
+            f'{", ".join(caches_locais)} como arquivo ou redis'
+        )
+
+# MENSAGENS_ARMAZENAMENTO:
+#   fallback - cookie e, se não couber (~2 KB), sessão (padrão do Django);
+#   cookie   - apenas cookie assinado; mensagens grandes demais são descartadas;
+#   session  - sempre na sessão (uma gravação da sessão por mensagem).
+MENSAGENS_ARMAZENAMENTO = config('MENSAGENS_ARMAZENAMENTO', default='fallback')
+ARMAZENAMENTOS_MENSAGENS = {
+    'fallback': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    'cookie': 'django.contrib.messages.storage.cookie.CookieStorage',
+    'session': 'django.contrib.messages.storage.session.SessionStorage',
+}
+MESSAGE_STORAGE = ARMAZENAMENTOS_MENSAGENS[MENSAGENS_ARMAZENAMENTO]
+
+# Instrumentação das requisições (core.middleware.InstrumentacaoMiddleware):
+# cabeçalho Server-Timing e log das requisições acima de REQUISICAO_LENTA_MS
+INSTRUMENTACAO_ATIVA = config('INSTRUMENTACAO_ATIVA', default=True, cast=bool)
+REQUISICAO_LENTA_MS = config('REQUISICAO_LENTA_MS', default=500, cast=int)
+
+# Perfilador por amostragem (core.middleware.PerfiladorMiddleware), sob demanda
+PERFILADOR_ATIVO = config('PERFILADOR_ATIVO', default=True, cast=bool)
+PERFILADOR_DIR = config('PERFILADOR_DIR', default=str(BASE_DIR / 'perfis'))
+PERFILADOR_INTERVALO_MS = config('PERFILADOR_INTERVALO_MS', default=5, cast=float)
+PERFILADOR_MAXIMO_ARQUIVOS = config('PERFILADOR_MAXIMO_ARQUIVOS', default=200, cast=int)
+PERFILADOR_VALIDADE_TOKEN = config('PERFILADOR_VALIDADE_TOKEN', default=3600, cast=int)
+
+# Métricas do Prometheus em /metrics (core.metricas). Com vários processos
+# (gunicorn), definir PROMETHEUS_MULTIPROC_DIR com uma pasta vazia a cada início
+# do servidor: os valores de todos os workers são somados a partir dela.
+METRICAS_MULTIPROCESSO_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if METRICAS_MULTIPROCESSO_DIR:
+    # O prometheus_client lê a variável de ambiente ao criar as métricas
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = METRICAS_MULTIPROCESSO_DIR
+# Se definido, /metrics exige o cabeçalho "Authorization: Bearer <token>"
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.lentidao': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Login (core.autenticacao): a senha é verificada em um pool de processos,
+# fora das threads que atendem as páginas. 0 verifica em uma thread do próprio processo.
+LOGIN_PROCESSOS = config('LOGIN_PROCESSOS', default=max(1, (os.cpu_count() or 2) // 2), cast=int)
+# Verificações aguardando o pool; acima disso o login responde "sistema ocupado"
+LOGIN_FILA_MAXIMA = config('LOGIN_FILA_MAXIMA', default=32, cast=int)
+# Limite de tentativas (token bucket no cache), aplicado antes de qualquer hash:
+# (capacidade do balde, tokens repostos por minuto), por IP e por e-mail
+LOGIN_LIMITE_ATIVO = config('LOGIN_LIMITE_ATIVO', default=True, cast=bool)
+LOGIN_LIMITE_IP = (
+    config('LOGIN_LIMITE_IP_CAPACIDADE', default=30, cast=int),
+    config('LOGIN_LIMITE_IP_POR_MINUTO', default=30, cast=float),
+)
+LOGIN_LIMITE_EMAIL = (
+    config('LOGIN_LIMITE_EMAIL_CAPACIDADE', default=5, cast=int),
+    config('LOGIN_LIMITE_EMAIL_POR_MINUTO', default=2, cast=float),
+)
+
+# Importação em massa (core.importacao): processos que calculam os hashes das senhas.
+# Vale para a tela de usuários; o comando importar_usuarios usa --processos (padrão: CPUs)
+IMPORTACAO_PROCESSOS = config('IMPORTACAO_PROCESSOS', default=max(1, (os.cpu_count() or 2) // 2), cast=int)
+
+# Tempo (em segundos) que o usuário logado fica em cache
+USUARIO_CACHE_TIMEOUT = config('USUARIO_CACHE_TIMEOUT', default=300, cast=int)
+
+# Perfis e departamentos em cache (core.cache.obter_referencia), invalidados pelos signals.
+# Cópia local de cada processo: segundos até confirmar a versão no cache compartilhado
+REFERENCIA_CACHE_LOCAL_SEGUNDOS = config('REFERENCIA_CACHE_LOCAL_SEGUNDOS', default=5, cast=float)
+# Tempo de cada versão no cache compartilhado e espera máxima por quem a está carregando
+REFERENCIA_CACHE_TIMEOUT = config('REFERENCIA_CACHE_TIMEOUT', default=86400, cast=int)
+REFERENCIA_TRAVA_SEGUNDOS = config('REFERENCIA_TRAVA_SEGUNDOS', default=5, cast=int)
+
+# Corpo do relatório em cache por filtro de departamento, sob as versões das tabelas.
+# Tempo de cada versão no cache e espera máxima por quem a está renderizando
+RELATORIO_CACHE_TIMEOUT = config('RELATORIO_CACHE_TIMEOUT', default=3600, cast=int)
+RELATORIO_TRAVA_SEGUNDOS = config('RELATORIO_TRAVA_SEGUNDOS', default=30, cast=int)
+
+# Parte dos ETags da listagem de usuários e do relatório (core.decorators.etag_por_versao):
+# altere a cada deploy que mude os templates, para que o navegador não reaproveite a página antiga
+ETAG_VERSAO = config('ETAG_VERSAO', default='1')
+
+
+# Hash de senhas (core/hashers.py): SENHA_HASHER gera os novos hashes; os demais
+# continuam verificando os antigos, que são regravados no próximo login.
+# argon2 requer o pacote argon2-cffi. Custos: python manage.py benchmark_hashers
+HASHERS_SENHA = {
+    'pbkdf2_sha256': 'core.hashers.PBKDF2LumonHasher',
+    'scrypt': 'core.hashers.ScryptLumonHasher',
+    'argon2': 'core.hashers.Argon2LumonHasher',
+}
+SENHA_HASHER = config('SENHA_HASHER', default='pbkdf2_sha256')
+PASSWORD_HASHERS = [HASHERS_SENHA[SENHA_HASHER]] + [
+    caminho for nome, caminho in HASHERS_SENHA.items() if nome != SENHA_HASHER
+]
+# Padrão do Django 5.2
+SENHA_PBKDF2_ITERACOES = config('SENHA_PBKDF2_ITERACOES', default=1_000_000, cast=int)
+SENHA_SCRYPT_N = config('SENHA_SCRYPT_N', default=2**14, cast=int)
+SENHA_ARGON2_TEMPO = config('SENHA_ARGON2_TEMPO', default=2, cast=int)
+SENHA_ARGON2_MEMORIA = config('SENHA_ARGON2_MEMORIA', default=102400, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 # Validadores desabilitados para fins didáticos (senhas simples como "1234")
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Perfil, Departamento, Usuario
+from .models import Perfil, Departamento, Usuario, QuadroFuncionarios
 
 
 @admin.register(Perfil)
@@ -33,3 +33,17 @@ class UsuarioAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         """Sobrescreve o save do admin para garantir hash da senha se necessário"""
         super().save_model(request, obj, form, change)
+
+
+@admin.register(QuadroFuncionarios)
+class QuadroFuncionariosAdmin(admin.ModelAdmin):
+    """Configuração do admin para o quadro de funcionários (somente leitura)"""
+    list_display = ('id_departamento', 'id_perfil', 'total')
+    list_filter = ('id_perfil', 'id_departamento')
+    ordering = ('id_departamento', 'id_perfil')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,94 @@
+"""
+Verificação de senha do login fora das threads de requisição - Sistema Lumon.
+
+O PBKDF2 é caro de propósito (centenas de ms de CPU por senha). Verificado
+na própria requisição, uma rajada de logins (início de turno) ocupa todos os
+workers e as demais páginas esperam. Aqui a verificação roda em um pool de
+LOGIN_PROCESSOS processos: a view assíncrona (login_view, servida por
+config/asgi.py) aguarda o resultado sem ocupar uma thread, e no máximo
+LOGIN_PROCESSOS núcleos ficam com hashing, sobrando CPU para as páginas.
+
+Também fica aqui o limite de tentativas por IP e por e-mail
+(core/limitador.py), verificado antes de qualquer hash.
+"""
+
+import asyncio
+import hashlib
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from . import limitador
+from .hashers import criar_pool_hash
+
+_executor = None
+_trava_executor = threading.Lock()
+_verificacoes = 0
+_trava_verificacoes = threading.Lock()
+
+
+class LoginSobrecarregado(Exception):
+    """Há mais de LOGIN_FILA_MAXIMA verificações de senha aguardando o pool."""
+
+
+def _executor_senhas():
+    """
+    Pool criado no primeiro login de cada processo do servidor
+    (core.hashers.criar_pool_hash, com spawn).
+    """
+    global _executor
+    with _trava_executor:
+        if _executor is None:
+            _executor = criar_pool_hash(settings.LOGIN_PROCESSOS)
+        return _executor
+
+
+def _verificar(senha, senha_hash):
+    """
+    Executada no pool (ou na thread). Se a senha confere e o hash está
+    desatualizado (must_update), o setter do check_password gera o novo hash
+    aqui mesmo, fora das threads de requisição.
+    """
+    novo_hash = []
+    valida = check_password(senha, senha_hash, setter=lambda senha: novo_hash.append(make_password(senha)))
+    return valida, (novo_hash[0] if novo_hash else None)
+
+
+async def verificar_senha(senha, senha_hash):
+    """
+    Verifica a senha no pool de processos (ou em uma thread, com LOGIN_PROCESSOS=0).
+    Retorna (valida, novo_hash): novo_hash é o hash com a política atual
+    (core/hashers.py) quando o antigo precisa ser regravado, ou None.
+    Levanta LoginSobrecarregado se a fila estiver cheia, em vez de acumular
+    requisições esperando indefinidamente.
+    """
+    global _verificacoes
+    with _trava_verificacoes:
+        if _verificacoes >= settings.LOGIN_FILA_MAXIMA:
+            raise LoginSobrecarregado
+        _verificacoes += 1
+    try:
+        if not settings.LOGIN_PROCESSOS:
+            return await sync_to_async(_verificar, thread_sensitive=False)(senha, senha_hash)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor_senhas(), _verificar, senha, senha_hash)
+    finally:
+        with _trava_verificacoes:
+            _verificacoes -= 1
+
+
+async def espera_limite_login(ip, email):
+    """
+    Consome uma tentativa dos baldes do IP e do e-mail.
+    Retorna 0 se o login pode prosseguir, ou quantos segundos esperar.
+    O e-mail entra na chave como hash (tamanho fixo, sem caracteres inválidos).
+    """
+    if not settings.LOGIN_LIMITE_ATIVO:
+        return 0
+    espera = await limitador.aconsumir(limitador.chave_limite('login_ip', ip), *settings.LOGIN_LIMITE_IP)
+    if espera:
+        return espera
+    email_hash = hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+    return await limitador.aconsumir(
+        limitador.chave_limite('login_email', email_hash), *settings.LOGIN_LIMITE_EMAIL
+    )
@@ -0,0 +1,73 @@
+"""
+Busca de funcionários por nome e e-mail - Sistema Lumon.
+
+No PostgreSQL, a busca usa as extensões pg_trgm e unaccent:
+- os índices GIN (gin_trgm_ops) em f_unaccent(lower(nome)) e
+  f_unaccent(lower(email)) atendem tanto o LIKE '%termo%' quanto o
+  operador de similaridade (%>), sem varrer a tabela usuario;
+- os resultados são ordenados pela similaridade com o termo;
+- acentos e maiúsculas são ignorados ("otica" encontra "Ótica").
+
+Em outros bancos (ex.: SQLite), a busca cai para um filtro simples por
+substring (icontains) em nome e e-mail, ordenado por nome.
+Os índices e a função f_unaccent são criados na migration 0004.
+"""
+
+import unicodedata
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Func, Q, TextField
+from django.db.models.functions import Greatest, Lower
+
+
+class Unaccent(Func):
+    """
+    Chama a função imutável f_unaccent (wrapper de unaccent criado na
+    migration 0004), a mesma expressão usada nos índices GIN.
+    """
+    function = 'f_unaccent'
+    output_field = TextField()
+
+
+def normalizar_termo(termo):
+    """
+    Remove acentos e converte para minúsculas, como f_unaccent(lower(...)).
+    Ex.: 'Ótica' -> 'otica'
+    """
+    decomposto = unicodedata.normalize('NFKD', termo.lower())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def busca_por_similaridade():
+    """
+    Indica se o banco atual suporta a busca por similaridade (PostgreSQL).
+    """
+    return connection.vendor == 'postgresql'
+
+
+def buscar_usuarios(queryset, termo):
+    """
+    Filtra o queryset de usuários pelo termo em nome ou e-mail.
+    Retorna (queryset, campo_de_ordenacao, decrescente), para ser usado
+    diretamente na paginação keyset:
+    - PostgreSQL: anota 'similaridade' e ordena do mais parecido para o menos;
+    - outros bancos: substring simples, ordenado por nome.
+    """
+    if not busca_por_similaridade():
+        return queryset.filter(Q(nome__icontains=termo) | Q(email__icontains=termo)), 'nome', False
+
+    termo_normalizado = normalizar_termo(termo)
+    queryset = queryset.annotate(
+        nome_busca=Unaccent(Lower('nome')),
+        email_busca=Unaccent(Lower('email')),
+    ).filter(
+        Q(nome_busca__contains=termo_normalizado)
+        | Q(email_busca__contains=termo_normalizado)
+        | Q(nome_busca__trigram_word_similar=termo_normalizado)
+    ).annotate(
+        similaridade=Greatest(
+            TrigramWordSimilarity(termo_normalizado, 'nome_busca'),
+            TrigramWordSimilarity(termo_normalizado, 'email_busca'),
+        )
+    )
+    return queryset, 'similaridade', True
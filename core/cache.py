@@ -0,0 +1,315 @@
+"""
+Camada de cache do app core.
+Centraliza as chaves e o acesso ao cache do Django, para que views,
+middlewares e signals usem sempre o mesmo formato de chave.
+"""
+
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.fields.files import ImageFieldFile
+
+
+def chave_usuario(usuario_id):
+    """
+    Retorna a chave de cache do usuário logado.
+    Formato: core:usuario:<id>
+    """
+    return f'core:usuario:{usuario_id}'
+
+
+class UsuarioLogado:
+    """
+    Usuário logado (request.usuario) como fica no cache: identidade, foto,
+    perfil e departamento, sem o hash da senha, para que um dump do cache
+    compartilhado não exponha senhas. foto é um ImageFieldFile, como no model
+    (templatetags/fotos.py).
+    """
+
+    def __init__(self, id, nome, email, foto, miniaturas, id_perfil_id, perfil, id_departamento_id):
+        self.id = id
+        self.nome = nome
+        self.email = email
+        self.nome_foto = foto or ''
+        self.miniaturas = miniaturas or {}
+        self.id_perfil_id = id_perfil_id
+        self.perfil = perfil
+        self.id_departamento_id = id_departamento_id
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def foto(self):
+        from .models import Usuario
+        return ImageFieldFile(None, Usuario._meta.get_field('foto'), self.nome_foto)
+
+    @classmethod
+    def de_usuario(cls, usuario):
+        """
+        Projeção de um Usuario carregado com o perfil (select_related('id_perfil')).
+        """
+        return cls(
+            usuario.id, usuario.nome, usuario.email, usuario.foto.name, usuario.miniaturas,
+            usuario.id_perfil_id, usuario.id_perfil.perfil, usuario.id_departamento_id,
+        )
+
+
+def obter_usuario(usuario_id):
+    """
+    Retorna o UsuarioLogado do cache ou, se não estiver em cache, busca no
+    banco (uma consulta, com o nome do perfil) e armazena o resultado.
+    Retorna None se o usuário não existir mais.
+    """
+    from .models import Usuario
+
+    chave = chave_usuario(usuario_id)
+    usuario = cache.get(chave)
+    if usuario is not None:
+        return usuario
+
+    # Lido do primário: uma réplica atrasada deixaria dados antigos no cache
+    try:
+        campos = (
+            Usuario.objects.using(DEFAULT_DB_ALIAS)
+            .filter(id=usuario_id)
+            .values_list(
+                'id', 'nome', 'email', 'foto', 'miniaturas',
+                'id_perfil_id', F('id_perfil__perfil'), 'id_departamento_id',
+            )
+            .first()
+        )
+    except (ValueError, TypeError):
+        return None
+    if campos is None:
+        return None
+
+    usuario = UsuarioLogado(*campos)
+    armazenar_usuario(usuario)
+    return usuario
+
+
+def armazenar_usuario(usuario):
+    """
+    Armazena o usuário (UsuarioLogado, ou Usuario com o perfil carregado)
+    no cache pelo tempo definido em USUARIO_CACHE_TIMEOUT.
+    """
+    if not isinstance(usuario, UsuarioLogado):
+        usuario = UsuarioLogado.de_usuario(usuario)
+    cache.set(chave_usuario(usuario.pk), usuario, settings.USUARIO_CACHE_TIMEOUT)
+
+
+async def aarmazenar_usuario(usuario):
+    """
+    Versão assíncrona de armazenar_usuario (usada pela login_view).
+    """
+    await cache.aset(chave_usuario(usuario.pk), UsuarioLogado.de_usuario(usuario), settings.USUARIO_CACHE_TIMEOUT)
+
+
+def invalidar_usuario(usuario_id):
+    """
+    Remove o usuário do cache (chamado pelos signals ao salvar/excluir).
+    """
+    cache.delete(chave_usuario(usuario_id))
+
+
+# Versões de dados: um contador por tabela no cache, incrementado a cada escrita
+# (signals e core/quadro.py). Usadas como parte das chaves do cache de
+# referência e dos ETags das páginas (core.decorators.etag_por_versao).
+TABELAS_VERSIONADAS = ('usuarios', 'perfis', 'departamentos')
+
+
+def chave_versao(nome):
+    """
+    Formato: core:versao:<nome>
+    """
+    return f'core:versao:{nome}'
+
+
+def versoes(*nomes):
+    """
+    Retorna as versões atuais das tabelas, na ordem pedida, em uma leitura do cache.
+    Um contador ausente (cache limpo ou reiniciado) recomeça do instante atual
+    em nanossegundos, e não de 1: uma versão já usada em um ETag não se repete.
+    """
+    chaves = [chave_versao(nome) for nome in nomes]
+    atuais = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in atuais:
+            cache.add(chave, time.time_ns(), None)
+            atuais[chave] = cache.get(chave)
+    return [atuais[chave] for chave in chaves]
+
+
+def renovar_versao(*nomes):
+    """
+    Incrementa a versão das tabelas (chamado pelos signals e pelo quadro).
+    Dentro de uma transação, a versão é incrementada de novo após o commit: uma
+    leitura feita antes do commit não pode ficar associada à versão nova.
+    A cópia local das tabelas de referência deste processo é descartada; os
+    outros processos percebem a versão nova em até REFERENCIA_CACHE_LOCAL_SEGUNDOS.
+    """
+    def renovar():
+        for nome in nomes:
+            try:
+                cache.incr(chave_versao(nome))
+            except ValueError:
+                cache.add(chave_versao(nome), time.time_ns(), None)
+            _referencias_locais.pop(nome, None)
+
+    renovar()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(renovar)
+
+
+# Tabelas de referência, que mudam poucas vezes por ano:
+# nome -> (model, ordenação usada pelas telas)
+TABELAS_REFERENCIA = {
+    'perfis': ('Perfil', 'perfil'),
+    'departamentos': ('Departamento', 'departamento'),
+}
+
+# Cópia local de cada processo: nome -> (versão, verificada_em, lista)
+_referencias_locais = {}
+
+
+def chave_referencia(nome, versao):
+    """
+    Formato: core:referencia:<nome>:<versão>
+    Uma nova versão muda a chave: listas antigas apenas expiram.
+    """
+    return f'core:referencia:{nome}:{versao}'
+
+
+def obter_referencia(nome):
+    """
+    Retorna a lista ordenada de uma tabela de referência ('perfis' ou 'departamentos').
+    Camadas:
+        1. cópia local do processo, usada sem consultar nada por até
+           REFERENCIA_CACHE_LOCAL_SEGUNDOS;
+        2. cache compartilhado, sob a versão atual da tabela (versoes(); uma leitura
+           no cache confirma a versão da cópia local);
+        3. banco, carregado por uma única requisição de cada vez (_carregar_referencia).
+    """
+    return obter_referencia_versionada(nome)[1]
+
+
+def obter_referencia_versionada(nome):
+    """
+    Como obter_referencia, mas retorna (versão, lista): a versão da tabela a que
+    a lista corresponde, que pode ser anterior à atual enquanto a cópia local
+    vale. Usada para montar chaves de cache derivadas da lista (core/relatorios.py).
+    """
+    local = _referencias_locais.get(nome)
+    agora = time.monotonic()
+    if local and agora - local[1] < settings.REFERENCIA_CACHE_LOCAL_SEGUNDOS:
+        return local[0], list(local[2])
+
+    versao, = versoes(nome)
+    if local and local[0] == versao:
+        dados = local[2]
+    else:
+        dados = cache.get(chave_referencia(nome, versao))
+        if dados is None:
+            dados = _carregar_referencia(nome, versao, local)
+            if dados is None:
+                # Outro processo está recarregando: continua com a cópia antiga
+                versao, dados = local[0], local[2]
+
+    _referencias_locais[nome] = (versao, agora, dados)
+    return versao, list(dados)
+
+
+def versoes_em_uso(*nomes):
+    """
+    Retorna as versões dos dados que este processo usará ao renderizar: a da
+    cópia local, se houver, para as tabelas de referência, e a atual para as
+    demais. Usada nos ETags (core.decorators.etag_por_versao), para que um ETag
+    nunca seja mais novo que os dados da página (no máximo mais antigo, o que
+    só custa uma renderização). Não carrega as tabelas de referência.
+    """
+    return [
+        _referencias_locais[nome][0] if nome in _referencias_locais else versao
+        for nome, versao in zip(nomes, versoes(*nomes))
+    ]
+
+
+async def aobter_referencia(nome):
+    """
+    Versão assíncrona de obter_referencia (usada pela login_view).
+    A cópia local válida é devolvida sem passar por uma thread.
+    """
+    local = _referencias_locais.get(nome)
+    if local and time.monotonic() - local[1] < settings.REFERENCIA_CACHE_LOCAL_SEGUNDOS:
+        return list(local[2])
+    return await sync_to_async(obter_referencia)(nome)
+
+
+def obter_ou_gerar(backend, chave, gerar, timeout, trava, espera):
+    """
+    Retorna o valor da chave no backend de cache ou o gera com gerar() e o grava
+    por timeout segundos, protegido contra estouro de requisições (cache stampede):
+    quem consegue a trava (backend.add de <chave>:trava, por até trava segundos)
+    gera o valor, e os demais aguardam o resultado por até espera segundos.
+    Retorna None se a espera termina sem o valor em cache (ou com espera=0).
+    O add do backend de arquivo não é atômico entre processos: ali a trava
+    apenas reduz as gerações simultâneas.
+    """
+    valor = backend.get(chave)
+    if valor is not None:
+        return valor
+
+    chave_trava = f'{chave}:trava'
+    if not backend.add(chave_trava, 1, trava):
+        limite = time.monotonic() + espera
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            valor = backend.get(chave)
+            if valor is not None:
+                return valor
+        return None
+
+    try:
+        valor = gerar()
+        backend.set(chave, valor, timeout)
+    finally:
+        backend.delete(chave_trava)
+    return valor
+
+
+def _carregar_referencia(nome, versao, local):
+    """
+    Carrega a tabela do banco e grava no cache, uma requisição de cada vez
+    (obter_ou_gerar): com cópia antiga, quem não consegue a trava continua com
+    ela; sem cópia, aguarda até REFERENCIA_TRAVA_SEGUNDOS pelo resultado e,
+    se ele não vier, consulta o banco sem gravar.
+    Retorna None se outro processo está carregando e há cópia antiga.
+    """
+    from django.apps import apps
+
+    modelo, ordenacao = TABELAS_REFERENCIA[nome]
+
+    def carregar():
+        # Lido do primário: uma réplica atrasada deixaria dados antigos no cache
+        return list(apps.get_model('core', modelo).objects.using(DEFAULT_DB_ALIAS).order_by(ordenacao))
+
+    dados = obter_ou_gerar(
+        cache, chave_referencia(nome, versao), carregar, settings.REFERENCIA_CACHE_TIMEOUT,
+        trava=settings.REFERENCIA_TRAVA_SEGUNDOS,
+        espera=0 if local else settings.REFERENCIA_TRAVA_SEGUNDOS,
+    )
+    if dados is None and not local:
+        dados = carregar()
+    return dados
+
+
+def limpar_referencias_locais():
+    """
+    Descarta as cópias locais do processo (usado pelos testes, cujo rollback
+    não dispara os signals).
+    """
+    _referencias_locais.clear()
@@ -0,0 +1,113 @@
+"""
+Decorators de views do app core - Sistema Lumon.
+"""
+
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from .cache import versoes_em_uso
+from .roteador import replica_atual
+
+
+def login_obrigatorio(view_func):
+    """
+    Garante que exista um usuário logado antes de executar a view.
+    Usa request.usuario, definido pelo UsuarioLogadoMiddleware.
+    Uso:
+        @login_obrigatorio
+        def minha_view(request): ...
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        # Verificar se usuário está logado
+        if 'usuario_id' not in request.session:
+            messages.warning(request, 'Você precisa fazer login primeiro.')
+            return redirect('login')
+
+        # Usuário da sessão foi excluído
+        if not request.usuario:
+            request.session.flush()
+            messages.error(request, 'Sessão inválida. Faça login novamente.')
+            return redirect('login')
+
+        return view_func(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
+def gerente_obrigatorio(view_func):
+    """
+    Garante que o usuário logado tenha o perfil Gerente (inclui login_obrigatorio).
+    O perfil vem da sessão, gravado no login, sem consultar o banco.
+    Uso:
+        @gerente_obrigatorio
+        def minha_view(request): ...
+    """
+    @login_obrigatorio
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if request.session.get('usuario_perfil') != 'Gerente':
+            messages.error(request, 'Acesso restrito a gerentes.')
+            return redirect('home')
+
+        return view_func(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
+def etag_por_versao(*tabelas):
+    """
+    Responde 304 Not Modified (sem executar a view, o ORM e os templates)
+    quando o ETag enviado pelo navegador ainda é o atual. O ETag combina:
+        - as versões de dados das tabelas (core.cache.versoes, incrementadas pelos signals);
+        - a URL com os parâmetros, o usuário da sessão e o cabeçalho HX-Request;
+        - o segredo CSRF (cookie), pois a página contém o token dos formulários;
+        - ETAG_VERSAO, que muda a cada deploy que altere os templates.
+    Com mensagens pendentes a página é sempre renderizada, para exibi-las.
+    Para que o ETag corresponda aos dados da página, a view lê do primário (e não
+    de uma réplica atrasada) e as tabelas de referência entram com a versão da
+    cópia local em uso (core.cache.versoes_em_uso).
+    Deve ficar abaixo do login_obrigatorio.
+    Uso:
+        @login_obrigatorio
+        @etag_por_versao('usuarios', 'perfis', 'departamentos')
+        def minha_view(request): ...
+    """
+    def calcular_etag(request, *args, **kwargs):
+        if len(messages.get_messages(request)):
+            return None
+        # Garante o cookie CSRF já na primeira resposta: o segredo entra no ETag
+        get_token(request)
+        partes = [
+            settings.ETAG_VERSAO,
+            request.get_full_path(),
+            request.session.get('usuario_id'),
+            request.headers.get('HX-Request', ''),
+            request.META['CSRF_COOKIE'],
+            *versoes_em_uso(*tabelas),
+        ]
+        return hashlib.sha256('|'.join(map(str, partes)).encode()).hexdigest()[:32]
+
+    def decorator(view_func):
+        view_condicional = condition(etag_func=calcular_etag)(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            token = replica_atual.set(None)
+            try:
+                response = view_condicional(request, *args, **kwargs)
+            finally:
+                replica_atual.reset(token)
+            if response.has_header('ETag'):
+                # Página de um usuário: só o navegador guarda, e sempre revalida
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return _wrapped_view
+
+    return decorator
@@ -0,0 +1,205 @@
+"""
+Exportação em streaming do relatório de usuários por departamento.
+
+As linhas são lidas do banco em blocos (QuerySet.iterator com cursor no
+servidor) e enviadas ao cliente à medida que são geradas, por isso a
+memória do worker não cresce com o número de funcionários exportados.
+
+- CSV: separado por ';' e com BOM, para abrir direto no Excel em pt-BR.
+- XLSX: o arquivo zip é escrito de forma incremental com zipfile (sem
+  dependências externas); a planilha usa strings inline, dispensando a
+  tabela sharedStrings, que exigiria manter todos os textos em memória.
+
+No servidor ASGI, o Django consome um iterador síncrono de
+StreamingHttpResponse com list(), juntando o arquivo inteiro em memória:
+lá a view entrega iterar_assincrono(), que lê os geradores aos poucos.
+"""
+
+import csv
+import zipfile
+from xml.sax.saxutils import escape
+from asgiref.sync import sync_to_async
+
+CABECALHO = ['Nome do Funcionário', 'E-mail', 'Perfil (Cargo)', 'Departamento']
+
+# Quantidade de linhas buscadas por vez no cursor do servidor
+TAMANHO_BLOCO = 2000
+
+# Tamanho mínimo (bytes ou caracteres) de cada parte enviada por iterar_assincrono
+TAMANHO_PARTE = 64 * 1024
+
+
+def linhas_relatorio(usuarios):
+    """
+    Gera as linhas do relatório (listas de textos) a partir do queryset
+    de consultar_usuarios_relatorio(), lendo do banco em blocos de TAMANHO_BLOCO.
+    """
+    for user in usuarios.iterator(chunk_size=TAMANHO_BLOCO):
+        yield [
+            user.nome,
+            user.email,
+            user.perfil,
+            user.sigla or user.departamento,
+        ]
+
+
+class _Eco:
+    """
+    Pseudo-arquivo que devolve o que recebe em write(), usado pelo
+    csv.writer para gerar as linhas sem acumular o arquivo em memória.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(linhas):
+    """
+    Gera o CSV linha a linha (para StreamingHttpResponse).
+    """
+    writer = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff' + writer.writerow(CABECALHO)
+    for linha in linhas:
+        yield writer.writerow(linha)
+
+
+class _BufferZip:
+    """
+    Destino do zipfile que só acumula os bytes escritos desde a última
+    leitura. Como não é seekable, o zipfile grava os tamanhos de cada
+    arquivo em data descriptors, permitindo o streaming.
+    """
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self._partes)
+        self._partes = []
+        return dados
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Relatório" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_SHEET_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+
+_SHEET_FIM = '</sheetData></worksheet>'
+
+
+def _linha_xml(numero, valores):
+    """
+    Monta o XML de uma linha da planilha com strings inline.
+    """
+    celulas = ''.join(
+        f'<c t="inlineStr"><is><t>{escape(valor or "")}</t></is></c>'
+        for valor in valores
+    )
+    return f'<row r="{numero}">{celulas}</row>'
+
+
+def gerar_xlsx(linhas):
+    """
+    Gera o arquivo XLSX em blocos de bytes (para StreamingHttpResponse).
+    """
+    buffer = _BufferZip()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        arquivo_zip.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        arquivo_zip.writestr('_rels/.rels', _RELS)
+        arquivo_zip.writestr('xl/workbook.xml', _WORKBOOK)
+        arquivo_zip.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield buffer.esvaziar()
+
+        with arquivo_zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write((_SHEET_INICIO + _linha_xml(1, CABECALHO)).encode('utf-8'))
+            for numero, linha in enumerate(linhas, start=2):
+                planilha.write(_linha_xml(numero, linha).encode('utf-8'))
+                if numero % TAMANHO_BLOCO == 0:
+                    dados = buffer.esvaziar()
+                    if dados:
+                        yield dados
+            planilha.write(_SHEET_FIM.encode('utf-8'))
+
+    yield buffer.esvaziar()
+
+
+def _proxima_parte(gerador):
+    """
+    Lê do gerador até juntar TAMANHO_PARTE (ou até o fim) e retorna a parte;
+    vazia quando o gerador terminou.
+    """
+    pedacos = []
+    tamanho = 0
+    for pedaco in gerador:
+        pedacos.append(pedaco)
+        tamanho += len(pedaco)
+        if tamanho >= TAMANHO_PARTE:
+            break
+    return pedacos[0][:0].join(pedacos) if pedacos else None
+
+
+async def iterar_assincrono(gerador):
+    """
+    Iterador assíncrono sobre gerar_csv()/gerar_xlsx(), para StreamingHttpResponse
+    no servidor ASGI. O gerador avança sempre na mesma thread (sync_to_async com
+    thread_sensitive), onde está a conexão com o cursor do banco, uma parte de
+    TAMANHO_PARTE por vez, para não pagar a troca de thread a cada linha.
+    """
+    proxima_parte = sync_to_async(_proxima_parte)
+    try:
+        while (parte := await proxima_parte(gerador)) is not None:
+            yield parte
+    finally:
+        # Cliente desconectado: fecha o cursor no servidor sem esperar o fim da conexão
+        await sync_to_async(gerador.close)()
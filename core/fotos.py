@@ -0,0 +1,110 @@
+"""
+Miniaturas (renditions) das fotos dos usuários - Sistema Lumon.
+
+Ao salvar uma foto nova, são geradas versões quadradas em tamanhos fixos,
+em WebP e em JPEG (para navegadores sem WebP). Os caminhos ficam no campo
+Usuario.miniaturas, no formato:
+    {
+        'origem': 'usuarios/fotos/<uuid>.png',
+        '48': {'webp': 'usuarios/fotos/miniaturas/<uuid>_48.webp',
+               'jpg': 'usuarios/fotos/miniaturas/<uuid>_48.jpg'},
+        '128': {...},
+        '512': {...},
+    }
+Os templates usam essas versões com srcset (ver templatetags/fotos.py), em vez
+de baixar a foto original para cada avatar de 48 px.
+"""
+
+import io
+import logging
+import os
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Tamanhos (em px) das miniaturas geradas
+TAMANHOS_MINIATURA = (48, 128, 512)
+
+QUALIDADE_WEBP = 80
+QUALIDADE_JPEG = 85
+
+# Erros do Pillow com arquivos que não são imagens válidas: formato desconhecido
+# ou truncado (OSError), cabeçalhos malformados (ValueError, SyntaxError) e
+# imagens acima de Image.MAX_IMAGE_PIXELS (DecompressionBombError)
+ERROS_IMAGEM = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+logger = logging.getLogger(__name__)
+
+
+def _caminho_miniatura(nome_foto, tamanho, extensao):
+    """
+    Ex.: usuarios/fotos/<uuid>.png -> usuarios/fotos/miniaturas/<uuid>_48.webp
+    """
+    pasta, arquivo = os.path.split(nome_foto)
+    base = os.path.splitext(arquivo)[0]
+    return os.path.join(pasta, 'miniaturas', f'{base}_{tamanho}.{extensao}')
+
+
+def _codificar(imagem, formato, **opcoes):
+    buffer = io.BytesIO()
+    imagem.save(buffer, format=formato, **opcoes)
+    return ContentFile(buffer.getvalue())
+
+
+def gerar_miniaturas(foto):
+    """
+    Gera as miniaturas da foto (FieldFile já salvo no storage) e retorna o
+    dicionário a ser gravado em Usuario.miniaturas.
+    Retorna {} se o arquivo não puder ser lido como imagem (ERROS_IMAGEM): a
+    foto é salva e exibida sem miniaturas, sem derrubar o cadastro.
+    """
+    try:
+        with foto.open('rb') as arquivo:
+            original = Image.open(arquivo)
+            original = ImageOps.exif_transpose(original)
+            original.load()
+    except ERROS_IMAGEM as e:
+        logger.warning('Erro ao gerar miniaturas de %s: %r', foto.name, e)
+        return {}
+
+    # WebP mantém transparência; JPEG recebe fundo branco
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+    if original.mode == 'RGBA':
+        opaca = Image.new('RGB', original.size, (255, 255, 255))
+        opaca.paste(original, mask=original.getchannel('A'))
+    else:
+        opaca = original
+
+    miniaturas = {'origem': foto.name}
+    for tamanho in TAMANHOS_MINIATURA:
+        # Não ampliar fotos menores que o tamanho pedido
+        lado = min(tamanho, *original.size)
+        webp = ImageOps.fit(original, (lado, lado), Image.Resampling.LANCZOS)
+        jpg = ImageOps.fit(opaca, (lado, lado), Image.Resampling.LANCZOS)
+
+        miniaturas[str(tamanho)] = {
+            'webp': default_storage.save(
+                _caminho_miniatura(foto.name, tamanho, 'webp'),
+                _codificar(webp, 'WEBP', quality=QUALIDADE_WEBP, method=4),
+            ),
+            'jpg': default_storage.save(
+                _caminho_miniatura(foto.name, tamanho, 'jpg'),
+                _codificar(jpg, 'JPEG', quality=QUALIDADE_JPEG, optimize=True, progressive=True),
+            ),
+        }
+    return miniaturas
+
+
+def remover_miniaturas(miniaturas):
+    """
+    Remove do storage os arquivos listados em Usuario.miniaturas.
+    """
+    for chave, formatos in (miniaturas or {}).items():
+        if chave == 'origem':
+            continue
+        for caminho in formatos.values():
+            try:
+                default_storage.delete(caminho)
+            except Exception as e:
+                print(f'Erro ao remover miniatura {caminho}: {e}')
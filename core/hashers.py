@@ -0,0 +1,110 @@
+"""
+Política de hash de senhas - Sistema Lumon.
+
+PASSWORD_HASHERS (config/settings.py) lista os hashers abaixo com o de
+SENHA_HASHER em primeiro: novos hashes usam esse algoritmo, e os demais
+continuam verificando os hashes antigos. Os custos (iterações do PBKDF2,
+work factor do scrypt, memória do Argon2) vêm das configurações SENHA_*,
+lidas a cada uso. Um hash com algoritmo ou custo diferente do atual é
+detectado por must_update(), e a senha é regravada no próximo login
+(core/autenticacao.py e Usuario.verificar_senha).
+
+O Argon2 exige o pacote opcional argon2-cffi. Para escolher os custos
+conforme a meta de latência do login, use o comando benchmark_hashers.
+
+criar_pool_hash() cria o pool de processos usado para calcular e verificar
+hashes fora das threads de requisição (login e importação em massa).
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX,
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+    identify_hasher,
+)
+
+
+class PBKDF2LumonHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 com SENHA_PBKDF2_ITERACOES iterações (mesmo formato pbkdf2_sha256$)."""
+
+    @property
+    def iterations(self):
+        return settings.SENHA_PBKDF2_ITERACOES
+
+
+class ScryptLumonHasher(ScryptPasswordHasher):
+    """scrypt com work factor SENHA_SCRYPT_N (potência de 2)."""
+
+    block_size = 8
+    parallelism = 1
+
+    @property
+    def work_factor(self):
+        return settings.SENHA_SCRYPT_N
+
+    @property
+    def maxmem(self):
+        # O scrypt usa ~128 * n * r bytes; o limite padrão do OpenSSL (32 MiB) barra n >= 2**15
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+class Argon2LumonHasher(Argon2PasswordHasher):
+    """Argon2id com SENHA_ARGON2_TEMPO passagens e SENHA_ARGON2_MEMORIA KiB (requer argon2-cffi)."""
+
+    parallelism = 1
+
+    @property
+    def time_cost(self):
+        return settings.SENHA_ARGON2_TEMPO
+
+    @property
+    def memory_cost(self):
+        return settings.SENHA_ARGON2_MEMORIA
+
+
+def senha_hasheada(valor):
+    """
+    True se o valor já é um hash reconhecido por PASSWORD_HASHERS (ou uma
+    senha inutilizável); False se é uma senha em texto puro.
+    """
+    if valor.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return True
+    try:
+        identify_hasher(valor)
+    except ValueError:
+        return False
+    return True
+
+
+# Configurações de hash copiadas para os processos do pool: valem as do processo
+# que o criou (inclusive as alteradas em tempo de execução, como nos testes)
+CONFIGURACOES_HASH = (
+    'PASSWORD_HASHERS', 'SENHA_HASHER', 'SENHA_PBKDF2_ITERACOES', 'SENHA_SCRYPT_N',
+    'SENHA_ARGON2_TEMPO', 'SENHA_ARGON2_MEMORIA',
+)
+
+
+def _inicializar_processo(configuracoes):
+    import django
+    django.setup()
+    for nome, valor in configuracoes.items():
+        setattr(settings, nome, valor)
+
+
+def criar_pool_hash(processos):
+    """
+    ProcessPoolExecutor com até `processos` processos para make_password e
+    check_password. spawn em vez de fork: o servidor tem threads, e um fork
+    copiaria locks possivelmente presos. Os processos filhos carregam o mesmo
+    settings (DJANGO_SETTINGS_MODULE) e recebem as CONFIGURACOES_HASH atuais.
+    """
+    return ProcessPoolExecutor(
+        max_workers=processos,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_inicializar_processo,
+        initargs=({nome: getattr(settings, nome) for nome in CONFIGURACOES_HASH},),
+    )
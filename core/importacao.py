@@ -0,0 +1,310 @@
+"""
+Importação em massa de funcionários a partir de CSV - Sistema Lumon.
+
+Formato (cabeçalho obrigatório, separador ';' ou ','):
+    nome;email;senha;perfil;departamento
+O perfil é o nome do perfil e o departamento pode ser a sigla ou o nome.
+
+Em vez de validar e salvar um usuário por vez (como o cadastro da tela),
+a importação:
+    - carrega perfis, departamentos e e-mails existentes uma única vez, em memória;
+    - valida todas as linhas, guardando os erros por linha sem abortar o lote;
+    - calcula os hashes das senhas em paralelo (pool de IMPORTACAO_PROCESSOS
+      processos criados com spawn, core.hashers.criar_pool_hash);
+    - grava com COPY no PostgreSQL (ou bulk_create nos demais bancos), em uma
+      transação, com upsert opcional pelo e-mail.
+Como os signals não são disparados, o quadro de funcionários recebe ao final o
+saldo de cada (departamento, perfil) das linhas gravadas, com UPDATE ... F() como
+os signals, sem recontar a tabela de usuários.
+"""
+
+import csv
+import io
+import json
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from . import quadro
+from .cache import invalidar_usuario, renovar_versao
+from .hashers import criar_pool_hash
+from .models import Perfil, Departamento, Usuario
+
+COLUNAS_CSV = ('nome', 'email', 'senha', 'perfil', 'departamento')
+
+TAMANHOS_MAXIMOS = {
+    campo: Usuario._meta.get_field(campo).max_length for campo in ('nome', 'email')
+}
+
+# Abaixo disso, abrir processos custa mais que calcular os hashes em sequência
+MINIMO_HASH_PARALELO = 50
+
+
+class ResultadoImportacao:
+    """
+    Resumo de uma importação: quantidades gravadas e erros por linha.
+    erros é uma lista de (número da linha no arquivo, mensagem).
+    """
+
+    def __init__(self):
+        self.inseridos = 0
+        self.atualizados = 0
+        self.erros = []
+
+    @property
+    def total_gravados(self):
+        return self.inseridos + self.atualizados
+
+
+def copiar_para_tabela(tabela, colunas, linhas):
+    """
+    Grava as linhas (tuplas na ordem de colunas) com COPY ... FROM STDIN,
+    bem mais rápido que INSERT para milhares de linhas. Apenas PostgreSQL.
+    Dicionários são gravados como JSON.
+    """
+    def valor(v):
+        if v is None:
+            return '\\N'
+        if isinstance(v, dict):
+            v = json.dumps(v)
+        return str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    dados = io.StringIO()
+    for linha in linhas:
+        dados.write('\t'.join(valor(v) for v in linha))
+        dados.write('\n')
+    dados.seek(0)
+
+    sql = f'COPY {tabela} ({", ".join(colunas)}) FROM STDIN'
+    with connection.cursor() as cursor:
+        if hasattr(cursor.cursor, 'copy_expert'):
+            # psycopg2
+            cursor.cursor.copy_expert(sql, dados)
+        else:
+            # psycopg 3
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(dados.getvalue())
+
+
+def _ler_csv(arquivo):
+    """
+    Lê o arquivo (texto) e retorna um DictReader com as colunas em minúsculas.
+    Detecta o separador ';' (padrão do Excel em português) ou ','.
+    """
+    cabecalho = arquivo.readline()
+    separador = ';' if cabecalho.count(';') >= cabecalho.count(',') else ','
+    colunas = [c.strip().lower() for c in next(csv.reader([cabecalho], delimiter=separador), [])]
+    return colunas, csv.DictReader(arquivo, fieldnames=colunas, delimiter=separador)
+
+
+def _hash_senhas(senhas, processos=None):
+    """
+    Calcula os hashes das senhas, em paralelo quando há muitas.
+    O PBKDF2 é proposital e caro (centenas de ms por senha): em um lote de
+    milhares de funcionários é a maior parte do tempo da importação.
+    Sem `processos`, usa IMPORTACAO_PROCESSOS: a importação pela tela roda
+    dentro de uma requisição e não deve ocupar todos os núcleos do servidor.
+    """
+    processos = processos or settings.IMPORTACAO_PROCESSOS
+    if processos <= 1 or len(senhas) < MINIMO_HASH_PARALELO:
+        return [make_password(senha) for senha in senhas]
+
+    chunksize = max(1, len(senhas) // (processos * 4))
+    with criar_pool_hash(processos) as executor:
+        return list(executor.map(make_password, senhas, chunksize=chunksize))
+
+
+def importar_usuarios(arquivo, atualizar=False, processos=None):
+    """
+    Importa os funcionários do CSV (arquivo texto já aberto).
+    Se atualizar for True, e-mails já cadastrados têm nome, senha, perfil e
+    departamento atualizados (upsert); senão, são reportados como erro.
+    Retorna um ResultadoImportacao.
+    """
+    resultado = ResultadoImportacao()
+
+    colunas, leitor = _ler_csv(arquivo)
+    faltando = [c for c in COLUNAS_CSV if c not in colunas]
+    if faltando:
+        resultado.erros.append((1, f'Colunas obrigatórias ausentes: {", ".join(faltando)}'))
+        return resultado
+
+    # Dados de referência, carregados uma única vez
+    perfis = {nome.strip().lower(): id for id, nome in Perfil.objects.values_list('id', 'perfil')}
+    departamentos = {}
+    for id, nome, sigla in Departamento.objects.values_list('id', 'departamento', 'sigla'):
+        departamentos[nome.strip().lower()] = id
+        if sigla:
+            departamentos[sigla.strip().lower()] = id
+    emails_existentes = set(Usuario.objects.values_list('email', flat=True))
+
+    validas = []
+    emails_arquivo = set()
+    for numero, linha in enumerate(leitor, start=2):
+        dados = {c: (linha.get(c) or '').strip() for c in COLUNAS_CSV}
+        if not any(dados.values()):
+            continue
+
+        vazios = [c for c in COLUNAS_CSV if not dados[c]]
+        if vazios:
+            resultado.erros.append((numero, f'Campos obrigatórios vazios: {", ".join(vazios)}'))
+            continue
+
+        longos = [c for c in ('nome', 'email') if len(dados[c]) > TAMANHOS_MAXIMOS[c]]
+        if longos:
+            resultado.erros.append((numero, f'Campos acima do tamanho máximo: {", ".join(longos)}'))
+            continue
+
+        email = dados['email']
+        try:
+            validate_email(email)
+        except ValidationError:
+            resultado.erros.append((numero, f'E-mail inválido: {email}'))
+            continue
+
+        if email in emails_arquivo:
+            resultado.erros.append((numero, f'E-mail repetido no arquivo: {email}'))
+            continue
+        if email in emails_existentes and not atualizar:
+            resultado.erros.append((numero, f'Já existe um usuário com este e-mail: {email}'))
+            continue
+
+        perfil_id = perfis.get(dados['perfil'].lower())
+        if perfil_id is None:
+            resultado.erros.append((numero, f'Perfil inválido: {dados["perfil"]}'))
+            continue
+        departamento_id = departamentos.get(dados['departamento'].lower())
+        if departamento_id is None:
+            resultado.erros.append((numero, f'Departamento inválido: {dados["departamento"]}'))
+            continue
+
+        emails_arquivo.add(email)
+        validas.append((dados['nome'], email, dados['senha'], perfil_id, departamento_id))
+
+    if not validas:
+        return resultado
+
+    hashes = _hash_senhas([senha for _, _, senha, _, _ in validas], processos)
+    linhas = [
+        (nome, email, hash_senha, perfil_id, departamento_id)
+        for (nome, email, _, perfil_id, departamento_id), hash_senha in zip(validas, hashes)
+    ]
+
+    with transaction.atomic():
+        # Perfil e departamento atuais dos e-mails do arquivo, travados até o commit
+        anteriores = {
+            email: (departamento_id, perfil_id)
+            for email, departamento_id, perfil_id in Usuario.objects.select_for_update()
+            .filter(email__in=[email for _, email, _, _, _ in linhas])
+            .values_list('email', 'id_departamento_id', 'id_perfil_id')
+            .iterator()
+        }
+        if connection.vendor == 'postgresql':
+            inseridos = _gravar_copy(linhas, atualizar)
+        else:
+            inseridos = _gravar_bulk(linhas, atualizar, anteriores)
+        _ajustar_quadro(linhas, anteriores, inseridos, atualizar)
+    renovar_versao('usuarios')
+
+    atualizados = list(anteriores) if atualizar else []
+    resultado.atualizados = len(atualizados)
+    resultado.inseridos = len(inseridos)
+
+    # Usuários atualizados podem estar no cache da navbar
+    for id in Usuario.objects.filter(email__in=atualizados).values_list('id', flat=True).iterator():
+        invalidar_usuario(id)
+
+    return resultado
+
+
+def _ajustar_quadro(linhas, anteriores, inseridos, atualizar):
+    """
+    Aplica ao quadro o saldo por (departamento, perfil) das linhas gravadas:
+    +1 para cada e-mail inserido e, no upsert, -1/+1 para quem mudou de
+    departamento ou perfil. Um UPDATE por par, e não por linha.
+    """
+    saldos = {}
+    for _, email, _, perfil_id, departamento_id in linhas:
+        atual = (departamento_id, perfil_id)
+        if email in inseridos:
+            saldos[atual] = saldos.get(atual, 0) + 1
+        elif atualizar and email in anteriores and anteriores[email] != atual:
+            saldos[anteriores[email]] = saldos.get(anteriores[email], 0) - 1
+            saldos[atual] = saldos.get(atual, 0) + 1
+
+    departamentos = {}
+    for (departamento_id, perfil_id), saldo in saldos.items():
+        if saldo:
+            quadro.ajustar(departamento_id, perfil_id, saldo)
+            departamentos[departamento_id] = departamentos.get(departamento_id, 0) + saldo
+    quadro.ajustar_departamentos(departamentos)
+
+
+def _gravar_copy(linhas, atualizar):
+    """
+    COPY para uma tabela temporária e INSERT ... ON CONFLICT (email) a partir dela:
+    o COPY sozinho não faz upsert.
+    Retorna o conjunto de e-mails inseridos (RETURNING; xmax = 0 apenas nas
+    linhas novas, e não nas atualizadas pelo upsert).
+    """
+    if atualizar:
+        conflito = (
+            'DO UPDATE SET nome = EXCLUDED.nome, senha = EXCLUDED.senha, '
+            'id_perfil = EXCLUDED.id_perfil, id_departamento = EXCLUDED.id_departamento'
+        )
+    else:
+        # E-mails já validados; protege apenas contra cadastros simultâneos
+        conflito = 'DO NOTHING'
+
+    tabela = Usuario._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS usuario_importacao')
+        cursor.execute(
+            'CREATE TEMP TABLE usuario_importacao '
+            '(nome varchar(500), email varchar(300), senha varchar(128), id_perfil bigint, id_departamento bigint) '
+            'ON COMMIT DROP'
+        )
+    copiar_para_tabela(
+        'usuario_importacao', ('nome', 'email', 'senha', 'id_perfil', 'id_departamento'), linhas
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {tabela} (nome, email, senha, foto, miniaturas, id_perfil, id_departamento) '
+            "SELECT nome, email, senha, '', '{}', id_perfil, id_departamento FROM usuario_importacao "
+            f'ON CONFLICT (email) {conflito} '
+            'RETURNING email, xmax = 0'
+        )
+        return {email for email, inserido in cursor.fetchall() if inserido}
+
+
+def _gravar_bulk(linhas, atualizar, anteriores, tamanho_lote=1000):
+    """
+    bulk_create com upsert (ou ignorando conflitos) pelo e-mail.
+    Retorna o conjunto de e-mails inseridos: os que não estavam em anteriores.
+    O bulk_create não informa os conflitos ignorados, mas fora do PostgreSQL
+    (SQLite) as escritas são serializadas, e anteriores foi lido na mesma
+    transação: nenhum outro cadastro grava esses e-mails até o commit.
+    """
+    if atualizar:
+        conflito = {
+            'update_conflicts': True,
+            'unique_fields': ['email'],
+            'update_fields': ['nome', 'senha', 'id_perfil', 'id_departamento'],
+        }
+    else:
+        conflito = {'ignore_conflicts': True}
+
+    Usuario.objects.bulk_create(
+        [
+            Usuario(
+                nome=nome, email=email, senha=senha,
+                id_perfil_id=perfil_id, id_departamento_id=departamento_id,
+            )
+            for nome, email, senha, perfil_id, departamento_id in linhas
+        ],
+        batch_size=tamanho_lote,
+        **conflito,
+    )
+
+    return {email for _, email, _, _, _ in linhas if email not in anteriores}
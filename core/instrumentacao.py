@@ -0,0 +1,124 @@
+"""
+Instrumentação de consultas SQL e renderização de templates - Sistema Lumon.
+
+MedidorConsultas conta e cronometra as consultas de uma conexão; Medicao junta
+o medidor ao tempo de templates de uma requisição e é usada pelo
+InstrumentacaoMiddleware (cabeçalho Server-Timing e log de requisições lentas).
+O tempo de templates vem do backend DjangoTemplatesInstrumentado, configurado
+em TEMPLATES no settings.
+"""
+
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from django.template.backends.django import DjangoTemplates, Template
+
+# Medição da requisição em andamento (definida pelo InstrumentacaoMiddleware)
+medicao_atual = ContextVar('medicao_atual', default=None)
+
+
+class MedidorConsultas:
+    """
+    Conta e cronometra as consultas SQL executadas em uma conexão.
+    Uso:
+        medidor = MedidorConsultas()
+        with connection.execute_wrapper(medidor):
+            ...
+        medidor.quantidade, medidor.tempo
+    Diferente do CaptureQueriesContext, não liga o cursor de debug nem guarda
+    o SQL de cada consulta: com mais_lentas=N, guarda apenas o SQL (sem os
+    parâmetros) das N consultas mais demoradas. Observação: mede o execute();
+    no SQLite parte da leitura das linhas acontece depois, no fetch, e fica
+    fora do tempo medido.
+    """
+
+    def __init__(self, mais_lentas=0):
+        self.quantidade = 0
+        self.tempo = 0.0
+        self.limite_mais_lentas = mais_lentas
+        self._mais_lentas = []  # heap de (tempo, ordem, sql)
+        self._ordem = itertools.count()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.tempo += duracao
+            self.quantidade += 1
+            if self.limite_mais_lentas:
+                item = (duracao, next(self._ordem), sql)
+                if len(self._mais_lentas) < self.limite_mais_lentas:
+                    heapq.heappush(self._mais_lentas, item)
+                elif duracao > self._mais_lentas[0][0]:
+                    heapq.heapreplace(self._mais_lentas, item)
+
+    @property
+    def mais_lentas(self):
+        """Lista de (tempo em s, sql), da mais lenta para a mais rápida."""
+        return [(duracao, sql) for duracao, _, sql in sorted(self._mais_lentas, reverse=True)]
+
+
+class Medicao:
+    """
+    Tempos de uma requisição: SQL (todas as conexões) e renderização de templates.
+    O tempo de templates não inclui as consultas feitas durante a renderização
+    (querysets avaliados no template), que já entram no tempo de SQL.
+    """
+
+    def __init__(self, mais_lentas=3):
+        self.consultas = MedidorConsultas(mais_lentas)
+        self.tempo_template = 0.0
+        self.renderizando = False
+
+    def server_timing(self, total):
+        """
+        Valor do cabeçalho Server-Timing, exibido na aba Network do navegador.
+        app é o restante: views, middlewares, sessão, arquivos de foto etc.
+        """
+        app = max(total - self.consultas.tempo - self.tempo_template, 0)
+        return ', '.join([
+            f'sql;dur={self.consultas.tempo * 1000:.1f};desc="{self.consultas.quantidade} consultas"',
+            f'tpl;dur={self.tempo_template * 1000:.1f}',
+            f'app;dur={app * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+class _TemplateCronometrado(Template):
+    """
+    Template que soma o tempo de renderização na medição da requisição.
+    Renderizações aninhadas (ex.: render_to_string dentro de uma tag) são
+    contadas uma única vez, pela mais externa.
+    """
+
+    def render(self, context=None, request=None):
+        medicao = medicao_atual.get()
+        if medicao is None or medicao.renderizando:
+            return super().render(context, request)
+
+        medicao.renderizando = True
+        sql_antes = medicao.consultas.tempo
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            duracao = time.perf_counter() - inicio
+            medicao.tempo_template += duracao - (medicao.consultas.tempo - sql_antes)
+            medicao.renderizando = False
+
+
+class DjangoTemplatesInstrumentado(DjangoTemplates):
+    """
+    Backend de templates do Django que cronometra a renderização
+    (ver InstrumentacaoMiddleware). Fora de uma requisição instrumentada,
+    se comporta como o DjangoTemplates.
+    """
+
+    def from_string(self, template_code):
+        return _TemplateCronometrado(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return _TemplateCronometrado(super().get_template(template_name).template, self)
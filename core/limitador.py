@@ -0,0 +1,47 @@
+"""
+Limite de tentativas por token bucket, guardado no cache - Sistema Lumon.
+
+Cada chave (ex.: IP ou e-mail do login) tem um balde com até `capacidade`
+tokens, repostos continuamente à razão de `por_minuto`. Cada tentativa
+consome um token; com o balde vazio a tentativa é recusada. Assim rajadas
+curtas são aceitas e tentativas contínuas (força bruta) ficam limitadas à
+taxa de reposição.
+
+O estado é lido e gravado sem lock: sob concorrência algumas tentativas a
+mais podem passar, o que é aceitável para um limite de abuso. Com vários
+processos, o cache 'default' precisa ser compartilhado (ver CACHES).
+"""
+
+import time
+from django.core.cache import cache
+
+
+def chave_limite(escopo, valor):
+    """
+    Formato: core:limite:<escopo>:<valor>
+    """
+    return f'core:limite:{escopo}:{valor}'
+
+
+def _consumir(estado, agora, capacidade, por_segundo):
+    """
+    Aplica a reposição desde a última tentativa e tenta consumir um token.
+    Retorna (novo estado, segundos até o próximo token ou 0 se permitido).
+    """
+    tokens, instante = estado if estado else (capacidade, agora)
+    tokens = min(capacidade, tokens + (agora - instante) * por_segundo)
+    if tokens >= 1:
+        return (tokens - 1, agora), 0
+    return (tokens, agora), (1 - tokens) / por_segundo
+
+
+async def aconsumir(chave, capacidade, por_minuto):
+    """
+    Consome um token do balde da chave.
+    Retorna 0 se a tentativa é permitida, ou quantos segundos esperar.
+    """
+    por_segundo = por_minuto / 60
+    estado, espera = _consumir(await cache.aget(chave), time.time(), capacidade, por_segundo)
+    # Depois de encher de novo, o balde equivale a uma chave inexistente
+    await cache.aset(chave, estado, timeout=int(capacidade / por_segundo) + 1)
+    return espera
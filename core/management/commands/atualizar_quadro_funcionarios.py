@@ -0,0 +1,29 @@
+"""
+Management command para reconstruir o quadro de funcionários (headcount).
+Uso: python manage.py atualizar_quadro_funcionarios
+
+Necessário após inserções em massa (bulk_create, COPY, gerador de dados),
+que não disparam os signals que mantêm o quadro atualizado. Também corrige
+(e lista) os departamentos cujo total_funcionarios divergiu da tabela usuario.
+A reconstrução é feita em uma única transação: as telas continuam lendo o
+quadro anterior até o fim da atualização.
+"""
+
+from django.core.management.base import BaseCommand
+from core import quadro
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o quadro de funcionários e corrige o total de funcionários dos departamentos'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Recalculando o quadro de funcionários...')
+        linhas, corrigidos = quadro.recalcular()
+        for departamento, anterior, correto in corrigidos:
+            self.stdout.write(self.style.WARNING(
+                f'  ⚠ {departamento.departamento}: total de funcionários {anterior} -> {correto}'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'  ✓ Quadro atualizado: {linhas} combinações de departamento e perfil, '
+            f'{len(corrigidos)} departamentos corrigidos'
+        ))
@@ -0,0 +1,137 @@
+"""
+Management command para medir o custo de abrir conexões com o PostgreSQL.
+Uso: python manage.py benchmark_conexoes [--threads 8] [--requisicoes 200] [--consultas 3]
+
+Simula requisições concorrentes (uma thread por worker), cada uma com o ciclo
+de conexão de uma requisição do Django (close_old_connections no início e no
+fim) e algumas consultas curtas, nos três modos:
+    - sem_persistencia: CONN_MAX_AGE=0, uma conexão nova (TCP + autenticação) por requisição;
+    - persistente:      CONN_MAX_AGE>0 com CONN_HEALTH_CHECKS, uma conexão por thread;
+    - pool:             pool do psycopg 3 (OPTIONS['pool']), compartilhado pelas threads.
+Para cada modo exibe vazão, latência p50/p95 por requisição e quantas conexões
+físicas foram abertas. Usa apenas SELECT 1: não depende das tabelas do projeto.
+"""
+
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from .benchmark_views import percentil
+
+MODOS = ('sem_persistencia', 'persistente', 'pool')
+
+
+class Command(BaseCommand):
+    help = 'Compara conexões novas, persistentes e pool do psycopg 3 sob carga concorrente'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Requisições simultâneas (padrão: 8)')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por thread (padrão: 200)')
+        parser.add_argument('--consultas', type=int, default=3, help='Consultas por requisição (padrão: 3)')
+        parser.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Este benchmark mede conexões com o PostgreSQL (DB_ENGINE=postgresql).')
+
+        configuracao = connections.settings['default']
+        original = {
+            'CONN_MAX_AGE': configuracao['CONN_MAX_AGE'],
+            'CONN_HEALTH_CHECKS': configuracao['CONN_HEALTH_CHECKS'],
+            'pool': configuracao['OPTIONS'].get('pool'),
+        }
+
+        self.stdout.write(
+            f'{options["threads"]} threads x {options["requisicoes"]} requisições, '
+            f'{options["consultas"]} consultas cada\n'
+        )
+        self.stdout.write(
+            f'{"Modo":<18} | {"Req/s":>8} | {"p50 (ms)":>9} | {"p95 (ms)":>9} | {"Conexões abertas":>16}'
+        )
+        self.stdout.write('-' * 72)
+
+        try:
+            for modo in options['modos']:
+                self._configurar(configuracao, modo)
+                vazao, latencias, abertas = self._executar(options)
+                self.stdout.write(
+                    f'{modo:<18} | {vazao:>8.0f} | {percentil(latencias, 50):>9.2f} | '
+                    f'{percentil(latencias, 95):>9.2f} | {abertas:>16}'
+                )
+        finally:
+            self._fechar_pool()
+            configuracao['CONN_MAX_AGE'] = original['CONN_MAX_AGE']
+            configuracao['CONN_HEALTH_CHECKS'] = original['CONN_HEALTH_CHECKS']
+            configuracao['OPTIONS'].pop('pool', None)
+            if original['pool']:
+                configuracao['OPTIONS']['pool'] = original['pool']
+
+    def _configurar(self, configuracao, modo):
+        """
+        Ajusta as configurações do banco para o modo. As conexões de cada thread
+        são criadas a partir deste mesmo dicionário.
+        """
+        self._fechar_pool()
+        configuracao['OPTIONS'].pop('pool', None)
+        if modo == 'sem_persistencia':
+            configuracao['CONN_MAX_AGE'] = 0
+            configuracao['CONN_HEALTH_CHECKS'] = False
+        elif modo == 'persistente':
+            configuracao['CONN_MAX_AGE'] = 600
+            configuracao['CONN_HEALTH_CHECKS'] = True
+        else:
+            configuracao['CONN_MAX_AGE'] = 0
+            configuracao['CONN_HEALTH_CHECKS'] = False
+            configuracao['OPTIONS']['pool'] = {'min_size': 2, 'max_size': 16, 'timeout': 30}
+
+    def _fechar_pool(self):
+        connection.close()
+        if connection.settings_dict['OPTIONS'].get('pool'):
+            connection.close_pool()
+
+    def _executar(self, options):
+        """
+        Retorna (requisições por segundo, latências em ms, conexões físicas abertas).
+        """
+        latencias = []
+        abertas = [0]
+        trava = threading.Lock()
+
+        def ao_conectar(sender, connection, **kwargs):
+            with trava:
+                abertas[0] += 1
+
+        def worker():
+            minhas = []
+            for _ in range(options['requisicoes']):
+                close_old_connections()  # request_started
+                inicio = time.perf_counter()
+                with connections['default'].cursor() as cursor:
+                    for _ in range(options['consultas']):
+                        cursor.execute('SELECT 1')
+                        cursor.fetchone()
+                minhas.append((time.perf_counter() - inicio) * 1000)
+                close_old_connections()  # request_finished
+            connections['default'].close()
+            with trava:
+                latencias.extend(minhas)
+
+        connection_created.connect(ao_conectar)
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duracao = time.perf_counter() - inicio
+        finally:
+            connection_created.disconnect(ao_conectar)
+
+        # No pool, connection_created dispara a cada empréstimo: contar as conexões do pool
+        pool = connection.pool if connection.settings_dict['OPTIONS'].get('pool') else None
+        if pool is not None:
+            abertas[0] = pool.get_stats().get('connections_num', 0)
+
+        return len(latencias) / duracao, latencias, abertas[0]
@@ -0,0 +1,112 @@
+"""
+Management command que mede, nesta máquina, a latência de verificação de
+senha de cada hasher e custo, para escolher os parâmetros de core/hashers.py
+conforme a meta de latência do login.
+Uso: python manage.py benchmark_hashers [--alvo-ms 250] [--repeticoes 10]
+     [--pbkdf2-iteracoes 600000 1000000] [--scrypt-n 16384 32768] [--argon2-memoria 19456 102400]
+
+Para cada configuração, gera um hash e mede a verificação (hasher.verify)
+--repeticoes vezes, exibindo p50/p95 e quantos logins por segundo um núcleo
+verifica. Ao final, sugere o maior custo de cada algoritmo cuja p95 fica
+dentro de --alvo-ms, no formato das variáveis do .env. A configuração atual
+(SENHA_HASHER e SENHA_*) é marcada com "*".
+O Argon2 só é medido com o pacote argon2-cffi instalado.
+"""
+
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+from core.hashers import Argon2LumonHasher, PBKDF2LumonHasher, ScryptLumonHasher
+from .benchmark_views import percentil
+
+SENHA = 'senha-de-referencia'
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência de verificação de senha de cada hasher e sugere custos dentro da meta'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alvo-ms', type=float, default=250, help='Meta de p95 da verificação (padrão: 250)')
+        parser.add_argument('--repeticoes', type=int, default=10, help='Verificações por configuração (padrão: 10)')
+        parser.add_argument(
+            '--pbkdf2-iteracoes', type=int, nargs='+', default=[260000, 600000, 1000000, 1500000],
+            help='Iterações do PBKDF2 medidas'
+        )
+        parser.add_argument(
+            '--scrypt-n', type=int, nargs='+', default=[2**14, 2**15, 2**16],
+            help='Work factors do scrypt medidos (potências de 2)'
+        )
+        parser.add_argument(
+            '--argon2-memoria', type=int, nargs='+', default=[19456, 65536, 102400],
+            help='Memória do Argon2 em KiB medida (com SENHA_ARGON2_TEMPO passagens)'
+        )
+
+    def handle(self, *args, **options):
+        configuracoes = [
+            ('pbkdf2_sha256', 'SENHA_PBKDF2_ITERACOES', n, self._hasher(PBKDF2LumonHasher, iterations=n))
+            for n in options['pbkdf2_iteracoes']
+        ] + [
+            ('scrypt', 'SENHA_SCRYPT_N', n, self._hasher(ScryptLumonHasher, work_factor=n))
+            for n in options['scrypt_n']
+        ]
+        try:
+            Argon2PasswordHasher()._load_library()
+        except ValueError:
+            self.stdout.write(self.style.WARNING('argon2: pacote argon2-cffi não instalado, ignorado\n'))
+        else:
+            configuracoes += [
+                ('argon2', 'SENHA_ARGON2_MEMORIA', kib, self._hasher(
+                    Argon2LumonHasher, memory_cost=kib, time_cost=settings.SENHA_ARGON2_TEMPO
+                ))
+                for kib in options['argon2_memoria']
+            ]
+
+        atuais = {
+            'SENHA_PBKDF2_ITERACOES': settings.SENHA_PBKDF2_ITERACOES,
+            'SENHA_SCRYPT_N': settings.SENHA_SCRYPT_N,
+            'SENHA_ARGON2_MEMORIA': settings.SENHA_ARGON2_MEMORIA,
+        }
+        self.stdout.write(f'Meta: p95 <= {options["alvo_ms"]:.0f} ms, {options["repeticoes"]} verificações\n')
+        self.stdout.write(
+            f'  {"Algoritmo":<14} | {"Custo":>10} | {"p50 (ms)":>9} | {"p95 (ms)":>9} | {"Logins/s/núcleo":>15}'
+        )
+        self.stdout.write('  ' + '-' * 70)
+
+        sugestoes = {}
+        for algoritmo, variavel, custo, hasher in configuracoes:
+            latencias = self._medir(hasher, options['repeticoes'])
+            p95 = percentil(latencias, 95)
+            dentro = p95 <= options['alvo_ms']
+            if dentro:
+                sugestoes[algoritmo] = (variavel, max(custo, sugestoes.get(algoritmo, (variavel, 0))[1]))
+            atual = '*' if algoritmo == settings.SENHA_HASHER and custo == atuais[variavel] else ' '
+            linha = (
+                f'{atual} {algoritmo:<14} | {custo:>10} | {percentil(latencias, 50):>9.1f} | '
+                f'{p95:>9.1f} | {1000 / percentil(latencias, 50):>15.1f}'
+            )
+            self.stdout.write(linha if dentro else self.style.WARNING(linha))
+
+        self.stdout.write('\nMaior custo dentro da meta:')
+        if not sugestoes:
+            self.stdout.write(self.style.WARNING('  nenhuma configuração medida ficou dentro da meta'))
+        for algoritmo, (variavel, custo) in sugestoes.items():
+            self.stdout.write(f'  SENHA_HASHER={algoritmo} {variavel}={custo}')
+
+    def _hasher(self, classe, **custos):
+        """
+        Instância do hasher com custos fixos: atributos de uma subclasse
+        têm precedência sobre as propriedades que leem as configurações.
+        """
+        return type(classe.__name__, (classe,), custos)()
+
+    def _medir(self, hasher, repeticoes):
+        codificado = hasher.encode(SENHA, get_random_string(22))
+        latencias = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            if not hasher.verify(SENHA, codificado):
+                raise CommandError(f'{hasher.algorithm}: verificação falhou')
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        return latencias
@@ -0,0 +1,117 @@
+"""
+Management command para medir o relatório de usuários por departamento.
+Uso: python manage.py benchmark_relatorio [--tamanhos 10000 100000]
+
+Para cada tamanho, cria os usuários dentro de uma transação, executa a view
+do relatório ("todos") e mede o tempo total e o pico de memória alocada
+(tracemalloc) em duas situações:
+    - frio: caches limpos antes de cada execução (consulta + renderização do corpo);
+    - quente: logo em seguida, com o corpo no cache de relatórios
+      (core.relatorios.corpo_relatorio; só a página base é renderizada).
+Ao final a transação é desfeita, sem deixar dados no banco.
+"""
+
+import time
+import tracemalloc
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from core.cache import limpar_referencias_locais
+from core.models import Perfil, Departamento, Usuario
+from core.views import relatorio_usuarios_departamento_view
+
+
+class Command(BaseCommand):
+    help = 'Mede tempo de renderização e pico de memória do relatório de usuários por departamento'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanhos',
+            nargs='+',
+            type=int,
+            default=[10000, 100000],
+            help='Quantidades de usuários a medir (padrão: 10000 100000)'
+        )
+        parser.add_argument(
+            '--repeticoes',
+            type=int,
+            default=3,
+            help='Execuções por tamanho, frias e quentes; é exibido o melhor tempo (padrão: 3)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Benchmark do relatório de usuários por departamento'))
+        self.stdout.write(f'Banco: {connection.vendor}\n')
+        self.stdout.write(
+            f'{"Usuários":>10} | {"Frio (ms)":>10} | {"Quente (ms)":>11} | '
+            f'{"Pico de memória (MB)":>20} | {"Bytes HTML":>12}'
+        )
+        self.stdout.write('-' * 76)
+
+        senha = make_password('1234')
+        for tamanho in options['tamanhos']:
+            with transaction.atomic():
+                frio, quente, pico, tamanho_html = self._medir(tamanho, senha, options['repeticoes'])
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{tamanho:>10} | {frio * 1000:>10.1f} | {quente * 1000:>11.1f} | '
+                f'{pico / 1024 / 1024:>20.1f} | {tamanho_html:>12}'
+            )
+
+    def _medir(self, tamanho, senha, repeticoes):
+        """
+        Cria os dados e retorna (melhor tempo frio em s, melhor tempo quente em s,
+        pico de memória em bytes, tamanho do HTML).
+        """
+        perfil = Perfil.objects.create(perfil='Benchmark')
+        departamentos = [
+            Departamento.objects.create(departamento=f'Benchmark {i}', sigla=f'BM{i}')
+            for i in range(10)
+        ]
+        Usuario.objects.bulk_create(
+            (
+                Usuario(
+                    nome=f'Funcionário {i:07d}',
+                    email=f'benchmark{i}@lumon.com',
+                    senha=senha,
+                    id_perfil=perfil,
+                    id_departamento=departamentos[i % len(departamentos)],
+                )
+                for i in range(tamanho)
+            ),
+            batch_size=5000,
+        )
+        usuario_logado = Usuario.objects.filter(id_perfil=perfil).first()
+
+        request = RequestFactory().get(
+            reverse('relatorio_usuarios_departamento'), {'departamento': 'todos'}
+        )
+        request.session = {'usuario_id': usuario_logado.id}
+        request.usuario = usuario_logado
+
+        melhores = {'frio': None, 'quente': None}
+        pico = 0
+        tamanho_html = 0
+        for _ in range(repeticoes):
+            # O bulk_create não dispara os signals, então as versões não mudam:
+            # sem limpar, o corpo de um tamanho anterior seria reaproveitado
+            cache.clear()
+            caches['relatorios'].clear()
+            limpar_referencias_locais()
+            for situacao in ('frio', 'quente'):
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                response = relatorio_usuarios_departamento_view(request)
+                tempo = time.perf_counter() - inicio
+                pico = max(pico, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+                tamanho_html = len(response.content)
+                melhor = melhores[situacao]
+                melhores[situacao] = tempo if melhor is None else min(melhor, tempo)
+
+        return melhores['frio'], melhores['quente'], pico, tamanho_html
@@ -0,0 +1,116 @@
+"""
+Management command que compara o tráfego no banco do fluxo de login em cada
+armazenamento de sessão e de mensagens (SESSAO_ARMAZENAMENTO / MENSAGENS_ARMAZENAMENTO).
+Uso: python manage.py benchmark_sessoes [--fluxos 50]
+
+Em um banco de teste separado (como o benchmark_views), cada fluxo é:
+    GET /  ->  POST / (login, mensagem de boas-vindas)  ->  GET /home/ (exibe a mensagem)
+    ->  GET /usuarios/  ->  GET /logout/
+Para cada modo, exibe por fluxo as escritas e leituras na tabela django_session,
+o total de consultas e o tempo médio. O hasher de senha é trocado por MD5
+durante a medição, para que o PBKDF2 não esconda a diferença entre os modos, e o
+limite de tentativas de login é desligado.
+"""
+
+import io
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from core.models import Usuario
+
+# (nome, SESSAO_ARMAZENAMENTO, MENSAGENS_ARMAZENAMENTO)
+MODOS = [
+    ('db + mensagens na sessão', 'db', 'session'),
+    ('db (padrão)', 'db', 'fallback'),
+    ('cached_db', 'cached_db', 'fallback'),
+    ('cache + cookie', 'cache', 'cookie'),
+]
+
+ESCRITAS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class ContadorSessao:
+    """execute_wrapper que conta as consultas, separando as da tabela django_session."""
+
+    def __init__(self):
+        self.total = 0
+        self.escritas = 0
+        self.leituras = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        if 'django_session' in sql:
+            if sql.lstrip()[:6].upper() in ESCRITAS:
+                self.escritas += 1
+            else:
+                self.leituras += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Compara escritas e leituras da tabela de sessões no fluxo de login, por modo de armazenamento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fluxos', type=int, default=50, help='Fluxos de login medidos por modo (padrão: 50)')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Sem o limite de tentativas: todos os fluxos usam o mesmo e-mail e, a
+            # partir do sexto login, seriam barrados com "Muitas tentativas"
+            with override_settings(
+                PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                LOGIN_LIMITE_ATIVO=False,
+            ):
+                call_command('gerar_dados_sinteticos', usuarios=10, stdout=io.StringIO())
+                usuario = Usuario.objects.filter(email__startswith='sintetico.').order_by('id').first()
+
+                self.stdout.write(
+                    f'{"Modo":<26} | {"Escritas sessão":>15} | {"Leituras sessão":>15} | '
+                    f'{"Consultas":>9} | {"ms/fluxo":>8}'
+                )
+                self.stdout.write('-' * 86)
+                for nome, sessao, mensagens in MODOS:
+                    with override_settings(
+                        SESSION_ENGINE=settings.MOTORES_SESSAO[sessao],
+                        MESSAGE_STORAGE=settings.ARMAZENAMENTOS_MENSAGENS[mensagens],
+                    ):
+                        self._medir(nome, usuario, options['fluxos'])
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+    def _fluxo(self, client, usuario):
+        client.get(reverse('login'))
+        response = client.post(reverse('login'), {
+            'email': usuario.email, 'senha': '1234', 'perfil': usuario.id_perfil_id,
+        }, follow=True)
+        if response.redirect_chain[-1][0] != reverse('home'):
+            raise CommandError('O login do usuário sintético falhou')
+        client.get(reverse('usuarios'))
+        client.get(reverse('logout'))
+
+    def _medir(self, nome, usuario, fluxos):
+        caches['sessoes'].clear()
+        client = Client()
+        self._fluxo(client, usuario)  # aquecimento
+
+        contador = ContadorSessao()
+        with connection.execute_wrapper(contador):
+            inicio = time.perf_counter()
+            for _ in range(fluxos):
+                self._fluxo(client, usuario)
+            duracao = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f'{nome:<26} | {contador.escritas / fluxos:>15.1f} | {contador.leituras / fluxos:>15.1f} | '
+            f'{contador.total / fluxos:>9.1f} | {duracao / fluxos * 1000:>8.2f}'
+        )
@@ -0,0 +1,351 @@
+"""
+Management command com o benchmark de latência e consultas de todas as telas.
+Uso: python manage.py benchmark_views [--tamanhos 1000 100000 1000000] [--saida resultado.json]
+                                      [--baseline baseline.json] [--tolerancia 0.25]
+
+Para cada tamanho de massa, gera os usuários sintéticos (gerar_dados_sinteticos)
+em um banco de teste separado (como o do manage.py test, sem tocar nos dados
+do banco configurado) e percorre todas as URLs de core/urls.py com o test
+client, medindo por cenário:
+    - latência p50 e p95 (ms);
+    - quantidade de consultas SQL e tempo total de SQL (ms; no SQLite a leitura
+      das linhas fica fora, ver MedidorConsultas);
+    - pico de memória alocada durante a requisição (KB, tracemalloc).
+As medições usam os caches já aquecidos; os cenários de CENARIOS_FRIOS são
+medidos também com os caches limpos a cada requisição (variante <nome>_frio).
+Funciona com SQLite e PostgreSQL (DB_ENGINE no .env). Como a massa é
+incremental, os tamanhos são medidos em ordem crescente sobre o mesmo banco.
+
+Com --baseline, os resultados são comparados com um JSON gerado antes por
+--saida: consultas a mais ou latência/memória acima da tolerância fazem o
+comando terminar com erro, listando as regressões.
+"""
+
+import io
+import json
+import math
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+from core.cache import limpar_referencias_locais
+from core.instrumentacao import MedidorConsultas
+from core.models import Departamento, Usuario
+from core.paginacao import PROXIMA, codificar_cursor
+from core.perfilador import PerfiladorAmostragem, salvar_perfil
+from core.urls import urlpatterns
+
+# Métricas comparadas com o baseline com tolerância relativa, mais uma folga
+# absoluta para que o ruído em medidas pequenas (ex.: 1,5 ms -> 2 ms) não
+# seja tratado como regressão. Consultas não têm tolerância.
+FOLGA_METRICAS = {'p95_ms': 5, 'pico_memoria_kb': 64}
+
+# Cenários servidos pelos caches (usuário logado, perfis e departamentos, corpo
+# do relatório): além da medição com cache quente, têm a variante <nome>_frio,
+# com todos os caches limpos antes de cada requisição medida, para que o
+# baseline também acompanhe as consultas e a renderização sem cache
+CENARIOS_FRIOS = (
+    'departamentos', 'usuarios', 'usuarios_htmx', 'usuarios_pagina', 'usuarios_busca',
+    'relatorio_departamento', 'relatorio_todos',
+)
+
+# Destino obrigatório do redirecionamento de cenários que respondem 302: um
+# login recusado também redireciona, e mediria a resposta rápida de erro
+DESTINOS_ESPERADOS = {'login_post': 'home'}
+
+
+def percentil(valores, p):
+    """
+    Percentil p (0-100) pelo método nearest-rank.
+    """
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+@contextmanager
+def ambiente_cenarios():
+    """
+    Configuração em que os cenários são executados (benchmark_views e verificar_planos):
+        - sem o limite de tentativas de login: as repetições do login_post usam o
+          mesmo e-mail e, a partir da sexta, mediriam o redirecionamento de
+          "Muitas tentativas";
+        - PERFILADOR_DIR temporário, onde cenarios() grava o perfil baixado pelo
+          cenário baixar_perfil, sem misturar os perfis gravados do projeto.
+    """
+    with tempfile.TemporaryDirectory() as pasta_perfis:
+        with override_settings(LOGIN_LIMITE_ATIVO=False, PERFILADOR_DIR=pasta_perfis):
+            yield
+
+
+def cenarios():
+    """
+    Retorna a lista de (nome, url, método, kwargs do client, logado, repetições)
+    e o usuário usado nos cenários logados (também usada por verificar_planos).
+    logado é False, True ou 'gerente' (a sessão recebe o perfil Gerente).
+    repetições None usa o padrão; o POST de login é limitado pelo custo do PBKDF2.
+    Deve ser chamada dentro de ambiente_cenarios().
+    """
+    usuario = Usuario.objects.filter(email='sintetico.0000001@lumon.com').first()
+    departamento_id = Departamento.objects.order_by('id').values_list('id', flat=True).first()
+    cursor_pagina = codificar_cursor(PROXIMA, usuario.nome, usuario.id)
+    csv_invalido = 'nome;email;senha;perfil;departamento\nX;sintetico.0000001@lumon.com;1;Nenhum;Nenhum\n'
+
+    # Perfil de poucas amostras para o download
+    with PerfiladorAmostragem(0.001) as perfil:
+        time.sleep(0.02)
+    nome_perfil = salvar_perfil(perfil, RequestFactory().get(reverse('home')), 0.02)
+
+    return [
+        ('login_get', reverse('login'), 'get', {}, False, None),
+        ('login_post', reverse('login'), 'post', {'data': {
+            'email': usuario.email, 'senha': '1234', 'perfil': usuario.id_perfil_id,
+        }}, False, 5),
+        ('logout', reverse('logout'), 'get', {}, True, None),
+        ('home', reverse('home'), 'get', {}, True, None),
+        ('departamentos', reverse('departamentos'), 'get', {}, True, None),
+        ('usuarios', reverse('usuarios'), 'get', {}, True, None),
+        ('usuarios_htmx', reverse('usuarios'), 'get', {'headers': {'HX-Request': 'true'}}, True, None),
+        ('usuarios_pagina', reverse('usuarios'), 'get', {'data': {'cursor': cursor_pagina}}, True, None),
+        ('usuarios_busca', reverse('usuarios'), 'get', {'data': {'nome': 'silva'}}, True, None),
+        ('relatorio_departamento', reverse('relatorio_usuarios_departamento'), 'get',
+         {'data': {'departamento': departamento_id}}, True, 5),
+        ('relatorio_todos', reverse('relatorio_usuarios_departamento'), 'get',
+         {'data': {'departamento': 'todos'}}, True, 3),
+        ('exportar_csv', reverse('exportar_usuarios_departamento'), 'get',
+         {'data': {'departamento': 'todos', 'formato': 'csv'}}, True, 3),
+        ('metricas', reverse('metricas'), 'get', {}, False, None),
+        # Apenas validação (perfil e departamento inválidos): nada é gravado
+        ('importar_validacao', reverse('importar_usuarios'), 'post',
+         {'data': {'arquivo': _ArquivoCsv(csv_invalido)}}, True, 5),
+        ('perfis', reverse('perfis'), 'get', {}, 'gerente', None),
+        ('baixar_perfil', reverse('baixar_perfil', args=[nome_perfil]), 'get', {}, 'gerente', None),
+    ], usuario
+
+
+def limpar_caches():
+    """
+    Limpa o cache geral (usuário logado, versões, perfis e departamentos),
+    o corpo dos relatórios e as cópias locais das tabelas de referência.
+    """
+    cache.clear()
+    caches['relatorios'].clear()
+    limpar_referencias_locais()
+
+
+def logar(client, usuario, logado=True):
+    """
+    Coloca o usuário na sessão do client, sem passar pelo hash de senha.
+    Com logado='gerente', a sessão recebe o perfil Gerente (gerente_obrigatorio).
+    """
+    if client.session.get('usuario_id') != usuario.id:
+        session = client.session
+        session['usuario_id'] = usuario.id
+        session['usuario_nome'] = usuario.nome
+        if logado == 'gerente':
+            session['usuario_perfil'] = 'Gerente'
+        session.save()
+        client.cookies['sessionid'] = session.session_key
+
+
+class Command(BaseCommand):
+    help = 'Mede latência (p50/p95), consultas SQL e memória de todas as telas com massas crescentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanhos',
+            nargs='+',
+            type=int,
+            default=[1000, 100000],
+            help='Quantidades de usuários, em ordem crescente (padrão: 1000 100000; use 1000000 para produção)'
+        )
+        parser.add_argument(
+            '--repeticoes',
+            type=int,
+            default=20,
+            help='Requisições medidas por cenário (padrão: 20)'
+        )
+        parser.add_argument(
+            '--saida',
+            help='Arquivo JSON para gravar os resultados (pode servir de baseline depois)'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Arquivo JSON de uma execução anterior para comparação'
+        )
+        parser.add_argument(
+            '--tolerancia',
+            type=float,
+            default=0.25,
+            help='Aumento relativo aceito de p95 e memória em relação ao baseline (padrão: 0.25 = 25%%)'
+        )
+        parser.add_argument(
+            '--manter-banco',
+            action='store_true',
+            help='Reaproveita o banco de teste (e a massa já gerada) entre execuções, no PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        tamanhos = sorted(options['tamanhos'])
+        resultados = {
+            'banco': connection.vendor,
+            'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeticoes': options['repeticoes'],
+            'tamanhos': {},
+        }
+
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['manter_banco'])
+        try:
+            for tamanho in tamanhos:
+                self.stdout.write(self.style.SUCCESS(f'\n{tamanho} usuários ({connection.vendor})'))
+                call_command('gerar_dados_sinteticos', usuarios=tamanho, stdout=io.StringIO())
+                resultados['tamanhos'][str(tamanho)] = self._medir_cenarios(options['repeticoes'])
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=options['manter_banco'])
+            teardown_test_environment()
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f'\nResultados gravados em {options["saida"]}')
+
+        if options['baseline']:
+            self._comparar(resultados, options['baseline'], options['tolerancia'])
+
+    @ambiente_cenarios()
+    def _medir_cenarios(self, repeticoes):
+        lista, usuario = cenarios()
+
+        cobertas = {resolve(url).url_name for _, url, *_ in lista}
+        for padrao in urlpatterns:
+            if padrao.name not in cobertas:
+                self.stdout.write(self.style.WARNING(f'  ⚠ URL sem cenário de benchmark: {padrao.name}'))
+
+        self.stdout.write(
+            f'  {"Cenário":<28} | {"p50 (ms)":>9} | {"p95 (ms)":>9} | {"Consultas":>9} | '
+            f'{"SQL (ms)":>9} | {"Memória (KB)":>12}'
+        )
+        self.stdout.write('  ' + '-' * 90)
+
+        resultados = {}
+        for nome, url, metodo, kwargs, logado, repeticoes_cenario in lista:
+            variantes = [(nome, False)] + ([(f'{nome}_frio', True)] if nome in CENARIOS_FRIOS else [])
+            for nome_variante, frio in variantes:
+                resultados[nome_variante] = r = self._medir(
+                    nome, url, metodo, kwargs, usuario, logado, repeticoes_cenario or repeticoes, frio,
+                )
+                self.stdout.write(
+                    f'  {nome_variante:<28} | {r["p50_ms"]:>9.1f} | {r["p95_ms"]:>9.1f} | {r["consultas"]:>9} | '
+                    f'{r["sql_ms"]:>9.1f} | {r["pico_memoria_kb"]:>12}'
+                )
+        return resultados
+
+    def _medir(self, nome, url, metodo, kwargs, usuario, logado, repeticoes, frio):
+        """
+        Mede um cenário (logado False para cenários sem login) e retorna as métricas.
+        Com frio=True, os caches são limpos antes de cada requisição medida.
+        """
+        limpar_caches()
+        client = Client()
+        requisicao = getattr(client, metodo)
+
+        def preparar():
+            # Fora da medição: a sessão (o logout a apaga) e, no frio, os caches
+            if logado:
+                logar(client, usuario, logado)
+            if frio:
+                limpar_caches()
+
+        def executar():
+            response = requisicao(url, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            if response.status_code >= 400:
+                raise CommandError(f'{nome}: HTTP {response.status_code}')
+            if nome in DESTINOS_ESPERADOS and response.url != reverse(DESTINOS_ESPERADOS[nome]):
+                raise CommandError(f'{nome}: redirecionado para {response.url}')
+            return response
+
+        # Aquecimento (cache do usuário, templates compilados, corpo do relatório)
+        preparar()
+        executar()
+
+        latencias, consultas, tempos_sql = [], [], []
+        for _ in range(repeticoes):
+            preparar()
+            medidor = MedidorConsultas()
+            with connection.execute_wrapper(medidor):
+                inicio = time.perf_counter()
+                executar()
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(medidor.quantidade)
+            tempos_sql.append(medidor.tempo * 1000)
+
+        # Memória em uma execução separada: o tracemalloc deixa tudo mais lento
+        preparar()
+        tracemalloc.start()
+        executar()
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentil(latencias, 50), 2),
+            'p95_ms': round(percentil(latencias, 95), 2),
+            'consultas': max(consultas),
+            'sql_ms': round(percentil(tempos_sql, 50), 2),
+            'pico_memoria_kb': round(pico / 1024),
+        }
+
+    def _comparar(self, resultados, caminho, tolerancia):
+        with open(caminho, encoding='utf-8') as arquivo:
+            baseline = json.load(arquivo)
+
+        if baseline.get('banco') != resultados['banco']:
+            self.stdout.write(self.style.WARNING(
+                f'  ⚠ Baseline gerado com {baseline.get("banco")}, execução atual com {resultados["banco"]}'
+            ))
+
+        regressoes = []
+        for tamanho, cenarios in resultados['tamanhos'].items():
+            for nome, atual in cenarios.items():
+                anterior = baseline.get('tamanhos', {}).get(tamanho, {}).get(nome)
+                if anterior is None:
+                    continue
+                if atual['consultas'] > anterior['consultas']:
+                    regressoes.append(
+                        f'{tamanho}/{nome}: consultas {anterior["consultas"]} -> {atual["consultas"]}'
+                    )
+                for metrica, folga in FOLGA_METRICAS.items():
+                    if atual[metrica] > anterior[metrica] * (1 + tolerancia) + folga:
+                        regressoes.append(
+                            f'{tamanho}/{nome}: {metrica} {anterior[metrica]} -> {atual[metrica]}'
+                        )
+
+        if regressoes:
+            for regressao in regressoes:
+                self.stdout.write(self.style.ERROR(f'  ✗ {regressao}'))
+            raise CommandError(f'{len(regressoes)} regressões em relação ao baseline {caminho}')
+        self.stdout.write(self.style.SUCCESS(f'\n  ✓ Sem regressões em relação ao baseline {caminho}'))
+
+
+class _ArquivoCsv:
+    """
+    Arquivo CSV em memória reenviável: o test client lê o arquivo a cada
+    requisição, então cada leitura precisa começar do início.
+    """
+
+    def __init__(self, conteudo):
+        self.conteudo = conteudo.encode('utf-8')
+        self.name = 'benchmark.csv'
+
+    def read(self, *args):
+        return self.conteudo
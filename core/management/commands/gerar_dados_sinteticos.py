@@ -0,0 +1,232 @@
+"""
+Management command para gerar uma massa de dados sintética (testes de carga).
+Uso: python manage.py gerar_dados_sinteticos --usuarios 1000000 [--departamentos 50] [--perfis 3] [--fotos PASTA]
+
+Diferente do seed_database (6 personagens, um get_or_create e um hash de senha
+por usuário), este comando:
+    - calcula o hash da senha uma única vez e o reutiliza em todos os usuários;
+    - insere em lotes com bulk_create, ou com COPY no PostgreSQL;
+    - é incremental: --usuarios é o total desejado de usuários sintéticos
+      (e-mails sintetico.0000001@lumon.com, ...); rodar de novo só completa
+      o que falta, inclusive após uma interrupção;
+    - com --fotos, copia as fotos da pasta informada para o storage uma única
+      vez (com miniaturas) e as referencia nos usuários, sem duplicar arquivos.
+      Excluir um usuário sintético não remove a foto compartilhada: os signals
+      só removem uma foto que nenhum outro usuário referencia. A pasta é
+      obrigatória e não tem padrão: as fotos do seed_database
+      (static/img/users_photos) são dos personagens, não de usuários sintéticos.
+
+Inserções em massa não disparam signals; ao final o quadro de funcionários
+é recalculado.
+"""
+
+import itertools
+import os
+import random
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.fields.files import ImageFieldFile
+from core import quadro
+from core.fotos import gerar_miniaturas
+from core.importacao import copiar_para_tabela
+from core.models import Perfil, Departamento, Usuario
+
+PREFIXO_EMAIL = 'sintetico'
+
+PRIMEIROS_NOMES = [
+    'Mark', 'Helly', 'Irving', 'Dylan', 'Burt', 'Harmony', 'Seth', 'Petey', 'Ricken', 'Devon',
+    'Gemma', 'Natalie', 'Reghabi', 'Felicia', 'Gabby', 'Ana', 'João', 'Maria', 'José', 'Luíza',
+    'Carlos', 'Fernanda', 'Paulo', 'Beatriz', 'Rafael', 'Camila', 'Lucas', 'Juliana', 'Tiago', 'Márcia',
+]
+SOBRENOMES = [
+    'Scout', 'Riggs', 'Bailiff', 'George', 'Goodman', 'Cobel', 'Milchick', 'Kilmer', 'Hale', 'Eagan',
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Pereira', 'Costa', 'Rodrigues', 'Almeida', 'Nascimento', 'Lima',
+    'Araújo', 'Fernandes', 'Carvalho', 'Gomes', 'Martins', 'Rocha', 'Ribeiro', 'Alves', 'Monteiro', 'Mendes',
+]
+PERFIS_BASE = ['Gerente', 'Funcionário', 'Supervisor', 'Estagiário', 'Diretor']
+
+
+class Command(BaseCommand):
+    help = 'Gera usuários, departamentos e perfis sintéticos em massa para testes de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--usuarios', '--users',
+            type=int,
+            default=10000,
+            help='Total de usuários sintéticos desejado (padrão: 10000)'
+        )
+        parser.add_argument(
+            '--departamentos', '--departments',
+            type=int,
+            default=20,
+            help='Quantidade de departamentos (padrão: 20)'
+        )
+        parser.add_argument(
+            '--perfis', '--profiles',
+            type=int,
+            default=3,
+            help='Quantidade de perfis; o primeiro (Gerente) fica com ~5%% dos usuários (padrão: 3)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Usuários por lote de inserção (padrão: 5000)'
+        )
+        parser.add_argument(
+            '--senha',
+            default='1234',
+            help='Senha de todos os usuários sintéticos (padrão: 1234)'
+        )
+        parser.add_argument(
+            '--fotos',
+            default=None,
+            metavar='PASTA',
+            help='Pasta de fotos associadas aos usuários, por referência (sem padrão)'
+        )
+        parser.add_argument(
+            '--semente',
+            type=int,
+            default=42,
+            help='Semente do gerador aleatório, para massas reproduzíveis (padrão: 42)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        rng = random.Random(options['semente'])
+
+        perfis = self._criar_perfis(options['perfis'])
+        departamentos = self._criar_departamentos(options['departamentos'])
+        fotos = self._preparar_fotos(options['fotos']) if options['fotos'] else []
+
+        existentes = Usuario.objects.filter(email__startswith=f'{PREFIXO_EMAIL}.').count()
+        faltantes = max(options['usuarios'] - existentes, 0)
+        self.stdout.write(
+            f'Usuários sintéticos: {existentes} existentes, {faltantes} a criar '
+            f'(banco: {connection.vendor})'
+        )
+
+        if faltantes:
+            senha = make_password(options['senha'])
+            linhas = self._linhas(
+                range(existentes + 1, options['usuarios'] + 1),
+                senha, perfis, departamentos, fotos, rng
+            )
+            inserir = self._inserir_copy if connection.vendor == 'postgresql' else self._inserir_bulk
+            criados = 0
+            while True:
+                lote = list(itertools.islice(linhas, options['lote']))
+                if not lote:
+                    break
+                with transaction.atomic():
+                    inserir(lote)
+                criados += len(lote)
+                self.stdout.write(f'  {criados}/{faltantes} usuários inseridos', ending='\r')
+                self.stdout.flush()
+            self.stdout.write('')
+
+            if connection.vendor == 'postgresql':
+                # Atualizar as estatísticas (usadas pelo planner e por estimar_total)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Usuario._meta.db_table}')
+
+        self.stdout.write('Recalculando o quadro de funcionários...')
+        quadro.recalcular()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'  ✓ Concluído em {time.perf_counter() - inicio:.1f}s: '
+            f'{Usuario.objects.count()} usuários, {len(departamentos)} departamentos, {len(perfis)} perfis'
+        ))
+        self.stdout.write(f'  • Login: {PREFIXO_EMAIL}.0000001@lumon.com | Senha: {options["senha"]}')
+
+    def _criar_perfis(self, quantidade):
+        nomes = [
+            PERFIS_BASE[i] if i < len(PERFIS_BASE) else f'Perfil {i + 1}'
+            for i in range(max(quantidade, 1))
+        ]
+        Perfil.objects.bulk_create([Perfil(perfil=nome) for nome in nomes], ignore_conflicts=True)
+        por_nome = dict(Perfil.objects.filter(perfil__in=nomes).values_list('perfil', 'id'))
+        return [por_nome[nome] for nome in nomes]
+
+    def _criar_departamentos(self, quantidade):
+        dados = [
+            (f'Departamento Sintético {i:04d}', f'DS{i:04d}')
+            for i in range(1, max(quantidade, 1) + 1)
+        ]
+        Departamento.objects.bulk_create(
+            [Departamento(departamento=nome, sigla=sigla) for nome, sigla in dados],
+            ignore_conflicts=True
+        )
+        return list(
+            Departamento.objects.filter(departamento__in=[nome for nome, _ in dados])
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def _preparar_fotos(self, pasta):
+        """
+        Copia cada foto da pasta para o storage uma única vez, gera as
+        miniaturas e retorna a lista de (nome da foto, miniaturas).
+        """
+        if not os.path.isdir(pasta):
+            self.stdout.write(self.style.WARNING(f'  ⚠ Pasta de fotos não encontrada: {pasta}'))
+            return []
+
+        fotos = []
+        for arquivo in sorted(os.listdir(pasta)):
+            if not arquivo.lower().endswith(('.png', '.jpg', '.jpeg')):
+                continue
+            destino = f'usuarios/fotos/sinteticos/{arquivo}'
+            if not default_storage.exists(destino):
+                with open(os.path.join(pasta, arquivo), 'rb') as f:
+                    destino = default_storage.save(destino, File(f))
+            # Reaproveitar as miniaturas de uma execução anterior
+            miniaturas = Usuario.objects.filter(foto=destino).values_list('miniaturas', flat=True).first()
+            if not miniaturas:
+                miniaturas = gerar_miniaturas(ImageFieldFile(None, Usuario._meta.get_field('foto'), destino))
+            fotos.append((destino, miniaturas))
+
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {len(fotos)} fotos preparadas para referência'))
+        return fotos
+
+    def _linhas(self, indices, senha, perfis, departamentos, fotos, rng):
+        """
+        Gera as tuplas (nome, email, senha, foto, miniaturas, perfil_id, departamento_id).
+        """
+        gerente, outros = perfis[0], perfis[1:] or perfis
+        for i in indices:
+            nome = f'{rng.choice(PRIMEIROS_NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}'
+            perfil = gerente if i % 20 == 0 else rng.choice(outros)
+            foto, miniaturas = fotos[i % len(fotos)] if fotos else ('', {})
+            yield (
+                nome,
+                f'{PREFIXO_EMAIL}.{i:07d}@lumon.com',
+                senha,
+                foto,
+                miniaturas,
+                perfil,
+                rng.choice(departamentos),
+            )
+
+    def _inserir_bulk(self, lote):
+        Usuario.objects.bulk_create(
+            [
+                Usuario(
+                    nome=nome, email=email, senha=senha, foto=foto, miniaturas=miniaturas,
+                    id_perfil_id=perfil, id_departamento_id=departamento,
+                )
+                for nome, email, senha, foto, miniaturas, perfil, departamento in lote
+            ],
+            batch_size=len(lote),
+        )
+
+    def _inserir_copy(self, lote):
+        copiar_para_tabela(
+            Usuario._meta.db_table,
+            ('nome', 'email', 'senha', 'foto', 'miniaturas', 'id_perfil', 'id_departamento'),
+            lote,
+        )
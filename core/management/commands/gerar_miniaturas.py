@@ -0,0 +1,40 @@
+"""
+Management command para gerar as miniaturas das fotos já existentes.
+Uso: python manage.py gerar_miniaturas [--todas]
+
+Fotos enviadas a partir desta versão já recebem miniaturas no upload;
+este comando cobre as fotos antigas (ou carregadas com load_user_photos).
+"""
+
+from django.core.management.base import BaseCommand
+from core.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas (48/128/512 px, WebP e JPEG) das fotos dos usuários'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Regera também as miniaturas que já existem'
+        )
+
+    def handle(self, *args, **options):
+        usuarios = Usuario.objects.exclude(foto='').exclude(foto__isnull=True).order_by('id')
+
+        geradas = 0
+        for usuario in usuarios.iterator():
+            if options['todas']:
+                usuario.miniaturas = {}
+            elif usuario.miniaturas.get('origem') == usuario.foto.name:
+                continue
+
+            usuario.save(update_fields=['foto'])
+            if usuario.miniaturas:
+                geradas += 1
+                self.stdout.write(f'  ✓ {usuario.nome}')
+            else:
+                self.stdout.write(self.style.WARNING(f'  ✗ {usuario.nome}: foto não encontrada ou inválida'))
+
+        self.stdout.write(self.style.SUCCESS(f'\nMiniaturas geradas para {geradas} usuário(s)'))
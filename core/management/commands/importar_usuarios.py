@@ -0,0 +1,47 @@
+"""
+Management command para importar funcionários em massa a partir de um CSV.
+Uso: python manage.py importar_usuarios arquivo.csv [--atualizar] [--processos 8]
+
+Colunas: nome;email;senha;perfil;departamento (ver core/importacao.py).
+Linhas inválidas são listadas ao final, sem impedir a importação das demais.
+"""
+
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.importacao import importar_usuarios
+
+
+class Command(BaseCommand):
+    help = 'Importa funcionários em massa a partir de um arquivo CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo CSV (UTF-8)')
+        parser.add_argument(
+            '--atualizar',
+            action='store_true',
+            help='Atualiza os usuários cujo e-mail já existe (upsert), em vez de reportar erro'
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=os.cpu_count(),
+            help='Processos para calcular os hashes das senhas (padrão: número de CPUs)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            with open(options['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+                resultado = importar_usuarios(arquivo, options['atualizar'], options['processos'])
+        except OSError as e:
+            raise CommandError(f'Não foi possível ler o arquivo: {e}')
+
+        for numero, mensagem in resultado.erros:
+            self.stdout.write(self.style.WARNING(f'  ✗ Linha {numero}: {mensagem}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nImportação concluída em {time.perf_counter() - inicio:.1f}s: '
+            f'{resultado.inseridos} inseridos, {resultado.atualizados} atualizados, '
+            f'{len(resultado.erros)} linhas com erro'
+        ))
@@ -0,0 +1,157 @@
+"""
+Management command que mede se as páginas continuam respondendo durante uma
+rajada de logins, contra um servidor já em execução.
+Uso: python manage.py teste_carga_login [--url http://127.0.0.1:8000] [--rajada 16]
+     [--leitores 2] [--duracao 10] [--email sintetico.0000001@lumon.com] [--senha 1234]
+
+Os leitores fazem login uma vez e depois pedem --pagina em sequência. A
+medição tem duas fases de --duracao segundos: só os leitores, e os leitores
+com --rajada threads fazendo POST de login sem parar. Para cada fase exibe a
+latência p50/p95 das páginas; para a rajada, quantos logins entraram, quantos
+foram recusados (senha, limite de tentativas ou fila cheia) e quantos falharam.
+
+Para comparar a verificação de senha na thread e no pool de processos
+(core/autenticacao.py), rode o servidor ASGI com LOGIN_PROCESSOS=0 e depois
+com LOGIN_PROCESSOS=1, com LOGIN_LIMITE_ATIVO=False para que todos os logins
+cheguem ao hash:
+    LOGIN_PROCESSOS=1 LOGIN_LIMITE_ATIVO=False uvicorn config.asgi:application
+Usa apenas a biblioteca padrão (urllib), sem dependências extras.
+"""
+
+import http.cookiejar
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Usuario
+from .benchmark_views import percentil
+
+
+class _SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    """Devolve o 302 do login em vez de segui-lo (o destino indica o resultado)."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Navegador:
+    """Cliente HTTP com cookies próprios (sessão e csrftoken), um por thread."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _SemRedirecionamento
+        )
+
+    def get(self, caminho):
+        with self.abridor.open(self.url + caminho, timeout=60) as resposta:
+            resposta.read()
+            return resposta.status
+
+    def login(self, email, senha, perfil):
+        """Retorna o destino do redirecionamento do POST de login."""
+        if not any(cookie.name == 'csrftoken' for cookie in self.cookies):
+            self.get('/')
+        token = next(cookie.value for cookie in self.cookies if cookie.name == 'csrftoken')
+        dados = urllib.parse.urlencode({
+            'csrfmiddlewaretoken': token, 'email': email, 'senha': senha, 'perfil': perfil,
+        }).encode()
+        try:
+            with self.abridor.open(self.url + '/', dados, timeout=60) as resposta:
+                resposta.read()
+                return ''
+        except urllib.error.HTTPError as erro:
+            if erro.code != 302:
+                raise
+            return urllib.parse.urlparse(erro.headers.get('Location', '')).path
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência das páginas durante uma rajada de logins contra um servidor em execução'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor (padrão: http://127.0.0.1:8000)')
+        parser.add_argument('--pagina', default='/home/', help='Página pedida pelos leitores (padrão: /home/)')
+        parser.add_argument('--rajada', type=int, default=16, help='Threads fazendo login (padrão: 16)')
+        parser.add_argument('--leitores', type=int, default=2, help='Threads pedindo páginas (padrão: 2)')
+        parser.add_argument('--duracao', type=float, default=10, help='Segundos de cada fase (padrão: 10)')
+        parser.add_argument('--email', default='sintetico.0000001@lumon.com', help='Usuário dos logins')
+        parser.add_argument('--senha', default='1234', help='Senha do usuário (padrão: 1234)')
+        parser.add_argument('--perfil', type=int, help='Id do perfil (padrão: o do usuário no banco local)')
+
+    def handle(self, *args, **options):
+        perfil = options['perfil']
+        if perfil is None:
+            try:
+                perfil = Usuario.objects.get(email=options['email']).id_perfil_id
+            except Usuario.DoesNotExist:
+                raise CommandError(f'Usuário {options["email"]} não existe no banco local; informe --perfil')
+        credenciais = (options['email'], options['senha'], perfil)
+
+        leitores = []
+        for _ in range(options['leitores']):
+            navegador = Navegador(options['url'])
+            try:
+                destino = navegador.login(*credenciais)
+            except urllib.error.URLError as erro:
+                raise CommandError(f'Falha ao acessar {options["url"]}: {erro}')
+            if destino != '/home/':
+                raise CommandError('O login dos leitores falhou; verifique --email, --senha e --perfil')
+            leitores.append(navegador)
+
+        self.stdout.write(
+            f'{options["leitores"]} leitores em {options["pagina"]}, rajada de {options["rajada"]} '
+            f'threads de login, {options["duracao"]:.0f}s por fase\n'
+        )
+        self.stdout.write(f'{"Fase":<16} | {"Páginas":>8} | {"p50 (ms)":>9} | {"p95 (ms)":>9} | Logins')
+        self.stdout.write('-' * 78)
+
+        for fase, rajada in (('sem rajada', 0), ('com rajada', options['rajada'])):
+            latencias, logins = self._executar(leitores, rajada, credenciais, options)
+            if not latencias:
+                raise CommandError(f'Nenhuma página respondeu na fase "{fase}"')
+            resumo = ', '.join(f'{quantidade} {resultado}' for resultado, quantidade in sorted(logins.items()))
+            self.stdout.write(
+                f'{fase:<16} | {len(latencias):>8} | {percentil(latencias, 50):>9.1f} | '
+                f'{percentil(latencias, 95):>9.1f} | {resumo or "-"}'
+            )
+
+    def _executar(self, leitores, rajada, credenciais, options):
+        """
+        Retorna (latências das páginas em ms, contagem de logins por resultado).
+        """
+        fim = time.perf_counter() + options['duracao']
+        latencias = []
+        logins = {}
+        trava = threading.Lock()
+
+        def ler(navegador):
+            minhas = []
+            while time.perf_counter() < fim:
+                inicio = time.perf_counter()
+                navegador.get(options['pagina'])
+                minhas.append((time.perf_counter() - inicio) * 1000)
+            with trava:
+                latencias.extend(minhas)
+
+        def logar():
+            navegador = Navegador(options['url'])
+            while time.perf_counter() < fim:
+                try:
+                    destino = navegador.login(*credenciais)
+                    resultado = 'aceitos' if destino == '/home/' else 'recusados'
+                except (urllib.error.URLError, OSError):
+                    resultado = 'falhas'
+                with trava:
+                    logins[resultado] = logins.get(resultado, 0) + 1
+
+        threads = [threading.Thread(target=ler, args=(navegador,)) for navegador in leitores]
+        threads += [threading.Thread(target=logar) for _ in range(rajada)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencias, logins
@@ -0,0 +1,126 @@
+"""
+Management command que verifica os planos de execução das consultas de todas as telas.
+Uso: python manage.py verificar_planos [--usuarios 50000] [--detalhes] [--manter-banco]
+
+Gera a massa sintética em um banco de teste separado (como o benchmark_views),
+executa os cenários do benchmark_views com o test client, capturando os
+SELECTs de cada tela, e roda EXPLAIN em cada um (core/planos.py).
+O comando falha se alguma consulta dos CENARIOS_CRITICOS ler uma tabela
+grande (TABELAS_CRITICAS) por varredura sequencial, ou seja, se um caminho
+de acesso deixou de usar os índices de core/models.py.
+Os demais cenários são apenas listados (ex.: a busca por substring, que no
+SQLite não tem índice que a atenda).
+"""
+
+import io
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from core.planos import CapturaConsultas, explicar, formatar_plano, varreduras_sequenciais
+from .benchmark_views import ambiente_cenarios, cenarios, limpar_caches, logar
+
+CENARIOS_CRITICOS = (
+    'login_post',
+    'usuarios',
+    'usuarios_htmx',
+    'usuarios_pagina',
+    'relatorio_departamento',
+    'relatorio_todos',
+    'exportar_csv',
+)
+
+
+class Command(BaseCommand):
+    help = 'Roda EXPLAIN nas consultas de cada tela e falha se um caminho crítico varrer a tabela usuario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--usuarios',
+            type=int,
+            default=50000,
+            help='Usuários sintéticos no banco de teste (padrão: 50000)'
+        )
+        parser.add_argument(
+            '--detalhes',
+            action='store_true',
+            help='Exibe o SQL e o plano de cada consulta'
+        )
+        parser.add_argument(
+            '--manter-banco',
+            action='store_true',
+            help='Reaproveita o banco de teste (e a massa já gerada) entre execuções, no PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['manter_banco'])
+        try:
+            call_command('gerar_dados_sinteticos', usuarios=options['usuarios'], stdout=io.StringIO())
+            self._atualizar_estatisticas()
+            regressoes = self._verificar(options['detalhes'])
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=options['manter_banco'])
+            teardown_test_environment()
+
+        if regressoes:
+            for regressao in regressoes:
+                self.stdout.write(self.style.ERROR(f'  ✗ {regressao}'))
+            raise CommandError(f'{len(regressoes)} consultas críticas com varredura sequencial')
+        self.stdout.write(self.style.SUCCESS('\n  ✓ Todos os caminhos críticos usam índices'))
+
+    def _atualizar_estatisticas(self):
+        """
+        O planner decide pelas estatísticas. No PostgreSQL, o VACUUM também
+        marca as páginas como visíveis, o que permite o index-only scan.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('VACUUM ANALYZE usuario')
+            else:
+                cursor.execute('ANALYZE')
+
+    @ambiente_cenarios()
+    def _verificar(self, detalhes):
+        lista, usuario = cenarios()
+        regressoes = []
+
+        self.stdout.write(f'  {"Cenário":<26} | {"Consultas":>9} | Varredura sequencial')
+        self.stdout.write('  ' + '-' * 62)
+
+        for nome, url, metodo, kwargs, logado, _ in lista:
+            limpar_caches()
+            client = Client()
+            if logado:
+                logar(client, usuario, logado)
+
+            captura = CapturaConsultas()
+            with connection.execute_wrapper(captura):
+                response = getattr(client, metodo)(url, **kwargs)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            if response.status_code >= 400:
+                raise CommandError(f'{nome}: HTTP {response.status_code}')
+
+            critico = nome in CENARIOS_CRITICOS
+            tabelas = set()
+            for sql, params in captura.consultas:
+                plano = explicar(sql, params)
+                sequenciais = varreduras_sequenciais(plano)
+                tabelas.update(sequenciais)
+                if sequenciais and critico:
+                    regressoes.append(f'{nome}: {", ".join(sequenciais)} em {sql[:200]}')
+                if detalhes:
+                    self.stdout.write(f'\n    {sql}')
+                    for linha in formatar_plano(plano):
+                        self.stdout.write(f'      {linha}')
+
+            marca = '✗' if tabelas and critico else ' '
+            self.stdout.write(
+                f'{marca} {nome + ("" if critico else " (info)"):<26} | {len(captura.consultas):>9} | '
+                f'{", ".join(sorted(tabelas)) or "-"}'
+            )
+        return regressoes
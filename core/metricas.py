@@ -0,0 +1,91 @@
+"""
+Métricas da aplicação no formato do Prometheus - Sistema Lumon.
+
+As métricas por rota (nome da URL: login, usuarios, relatorio_usuarios_departamento...)
+são registradas pelo InstrumentacaoMiddleware; login e upload de fotos, pelas views.
+Tudo é exposto em /metrics (ver metricas_view).
+
+Com vários processos (gunicorn com N workers), cada processo tem os próprios
+contadores. Definindo PROMETHEUS_MULTIPROC_DIR no .env, o prometheus_client
+grava os valores em arquivos mmap nessa pasta e /metrics soma os arquivos de
+todos os processos, seja qual for o worker que atender o scrape.
+A pasta deve ser esvaziada a cada (re)início do servidor.
+"""
+
+from django.conf import settings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+ROTA_DESCONHECIDA = 'desconhecida'
+
+DURACAO_REQUISICAO = Histogram(
+    'lumon_http_request_duration_seconds',
+    'Duração das requisições por rota',
+    ['rota', 'metodo', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+TAMANHO_RESPOSTA = Histogram(
+    'lumon_http_response_size_bytes',
+    'Tamanho do corpo das respostas por rota (sem as respostas em streaming)',
+    ['rota'],
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+CONSULTAS_REQUISICAO = Histogram(
+    'lumon_db_queries_per_request',
+    'Consultas SQL por requisição, por rota',
+    ['rota'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+LOGINS = Counter(
+    'lumon_login',
+    'Tentativas de login por resultado',
+    ['resultado'],
+)
+FOTOS_ENVIADAS = Counter(
+    'lumon_foto_upload',
+    'Fotos de usuários enviadas',
+)
+FOTOS_BYTES = Counter(
+    'lumon_foto_upload_bytes',
+    'Bytes de fotos de usuários enviadas',
+)
+
+
+def registrar_requisicao(request, response, duracao, consultas):
+    """
+    Registra duração, tamanho da resposta e consultas da requisição.
+    A rota é o nome da URL (não o caminho), para não criar uma série por id.
+    """
+    correspondencia = getattr(request, 'resolver_match', None)
+    rota = (correspondencia and correspondencia.url_name) or ROTA_DESCONHECIDA
+
+    DURACAO_REQUISICAO.labels(rota, request.method, str(response.status_code)).observe(duracao)
+    CONSULTAS_REQUISICAO.labels(rota).observe(consultas)
+    if not response.streaming:
+        TAMANHO_RESPOSTA.labels(rota).observe(len(response.content))
+
+
+def registrar_login(resultado):
+    """
+    resultado: sucesso, senha_incorreta, usuario_nao_encontrado, campos_vazios,
+    limitado (limite de tentativas) ou sobrecarregado (fila de verificação cheia).
+    """
+    LOGINS.labels(resultado).inc()
+
+
+def registrar_foto(foto):
+    FOTOS_ENVIADAS.inc()
+    FOTOS_BYTES.inc(foto.size or 0)
+
+
+def gerar_metricas():
+    """
+    Retorna (conteúdo, content type) no formato texto do Prometheus.
+    """
+    if settings.METRICAS_MULTIPROCESSO_DIR:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
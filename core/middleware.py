@@ -0,0 +1,224 @@
+"""
+Middlewares do app core - Sistema Lumon.
+"""
+
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+from . import metricas
+from .cache import obter_usuario
+from .instrumentacao import Medicao, medicao_atual
+from .perfilador import PerfiladorAmostragem, salvar_perfil, token_valido
+from .roteador import replica_atual
+
+logger_lentidao = logging.getLogger('core.lentidao')
+
+
+def _usuario_da_sessao(request):
+    """
+    Resolve o usuário logado a partir da sessão.
+    Retorna None se não houver login ou se o usuário não existir mais.
+    """
+    usuario_id = request.session.get('usuario_id')
+    if usuario_id is None:
+        return None
+    return obter_usuario(usuario_id)
+
+
+class UsuarioLogadoMiddleware:
+    """
+    Define request.usuario com o usuário logado (autenticação personalizada).
+    O usuário só é resolvido quando acessado pela primeira vez, e a busca
+    passa pelo cache, evitando consultar a tabela usuario a cada página.
+    Deve vir depois do SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.usuario = SimpleLazyObject(lambda: _usuario_da_sessao(request))
+        return self.get_response(request)
+
+
+class ReplicaLeituraMiddleware:
+    """
+    Direciona as leituras de GET/HEAD para uma réplica (core/roteador.py),
+    sorteada uma vez por requisição para que a página inteira venha do mesmo banco.
+    Read-your-writes: depois de um POST (ou outro método que grava), a sessão
+    lê do primário por REPLICA_FIXACAO_SEGUNDOS, cobrindo o redirect que exibe
+    o registro criado/alterado enquanto a réplica ainda não o recebeu.
+    Deve vir depois do SessionMiddleware. Desligado se não houver DATABASE_REPLICAS.
+    """
+
+    CHAVE_SESSAO = 'ler_primario_ate'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response = self.get_response(request)
+            # Só usuários logados gravam (evita criar sessão para visitantes)
+            if 'usuario_id' in request.session:
+                request.session[self.CHAVE_SESSAO] = time.time() + settings.REPLICA_FIXACAO_SEGUNDOS
+            return response
+
+        if request.session.get(self.CHAVE_SESSAO, 0) > time.time():
+            return self.get_response(request)
+
+        replica = random.choice(settings.DATABASE_REPLICAS)
+        token = replica_atual.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_atual.reset(token)
+        if response.streaming:
+            # Exportações são geradas enquanto o servidor envia a resposta
+            response.streaming_content = _iterar_na_replica(response.streaming_content, replica)
+        return response
+
+
+def _iterar_na_replica(conteudo, replica):
+    """Consome o streaming com as leituras na réplica, um bloco por vez."""
+    iterador = iter(conteudo)
+    while True:
+        token = replica_atual.set(replica)
+        try:
+            bloco = next(iterador, None)
+        finally:
+            replica_atual.reset(token)
+        if bloco is None:
+            return
+        yield bloco
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede cada requisição: quantidade e tempo das consultas SQL (via
+    connection.execute_wrapper), tempo de renderização dos templates e tempo
+    total. Envia os tempos no cabeçalho Server-Timing, alimenta as métricas
+    por rota do Prometheus (core/metricas.py) e registra no logger
+    core.lentidao as requisições acima de REQUISICAO_LENTA_MS, com o SQL das
+    consultas mais demoradas.
+    Deve ser o primeiro middleware, para medir também sessão e mensagens.
+    Em respostas em streaming (exportações), mede apenas até o início do envio.
+    Desligado com INSTRUMENTACAO_ATIVA=False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTACAO_ATIVA:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limite_lenta = settings.REQUISICAO_LENTA_MS / 1000
+
+    def __call__(self, request):
+        medicao = Medicao()
+        token = medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(medicao.consultas))
+                response = self.get_response(request)
+        finally:
+            medicao_atual.reset(token)
+        total = time.perf_counter() - inicio
+
+        metricas.registrar_requisicao(request, response, total, medicao.consultas.quantidade)
+        response['Server-Timing'] = medicao.server_timing(total)
+        if total >= self.limite_lenta:
+            self._registrar_lenta(request, response, medicao, total)
+        return response
+
+    def _registrar_lenta(self, request, response, medicao, total):
+        """
+        Registra a requisição lenta como uma linha JSON (fácil de filtrar em
+        agregadores de log). O SQL vai sem os parâmetros, para não expor dados.
+        """
+        logger_lentidao.warning(json.dumps({
+            'evento': 'requisicao_lenta',
+            'metodo': request.method,
+            'caminho': request.path,
+            'status': response.status_code,
+            'usuario_id': request.session.get('usuario_id') if hasattr(request, 'session') else None,
+            'total_ms': round(total * 1000, 1),
+            'sql_ms': round(medicao.consultas.tempo * 1000, 1),
+            'consultas': medicao.consultas.quantidade,
+            'template_ms': round(medicao.tempo_template * 1000, 1),
+            'sql_mais_lentas': [
+                {'ms': round(duracao * 1000, 1), 'sql': sql[:2000]}
+                for duracao, sql in medicao.consultas.mais_lentas
+            ],
+        }, ensure_ascii=False))
+
+
+class PerfiladorMiddleware:
+    """
+    Executa a view sob o perfilador por amostragem (core/perfilador.py) quando
+    a requisição pede, e grava as pilhas em PERFILADOR_DIR:
+        - cabeçalho X-Lumon-Perfilar com um token assinado (gerado na tela de
+          perfis), para perfilar uma chamada de script/curl; ou
+        - sessão de um Gerente com o perfilamento ligado na tela de perfis.
+    As demais requisições só pagam a leitura do cabeçalho e da sessão.
+    Deve ser o último middleware: o process_view chama a própria view.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERFILADOR_ATIVO:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.intervalo = settings.PERFILADOR_INTERVALO_MS / 1000
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def _deve_perfilar(self, request):
+        token = request.headers.get('X-Lumon-Perfilar')
+        if token:
+            return token_valido(token)
+        return (
+            request.session.get('perfilar', False)
+            and request.session.get('usuario_perfil') == 'Gerente'
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self._deve_perfilar(request):
+            return None
+
+        inicio = time.perf_counter()
+        perfis = []
+        try:
+            if iscoroutinefunction(view_func):
+                response = async_to_sync(self._perfilar_corrotina)(perfis, view_func, request, view_args, view_kwargs)
+            else:
+                with PerfiladorAmostragem(self.intervalo) as perfil:
+                    perfis.append(perfil)
+                    response = view_func(request, *view_args, **view_kwargs)
+        finally:
+            # perfis só fica vazio se a corrotina falhar antes de iniciar a amostragem
+            nome = salvar_perfil(perfis[0], request, time.perf_counter() - inicio) if perfis else None
+        if nome:
+            response['X-Lumon-Perfil'] = nome
+        return response
+
+    async def _perfilar_corrotina(self, perfis, view_func, request, view_args, view_kwargs):
+        """
+        View assíncrona (login): o async_to_sync a executa em um loop de eventos
+        em outra thread, e não na thread desta requisição. A amostragem começa
+        dentro da corrotina, para amostrar a thread do loop; o tempo em await
+        (ex.: a verificação de senha no pool de processos) aparece como
+        AGUARDANDO (core/perfilador.py).
+        """
+        with PerfiladorAmostragem(self.intervalo) as perfil:
+            perfis.append(perfil)
+            return await view_func(request, *view_args, **view_kwargs)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_usuario_foto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['nome', 'id'], name='usuario_nome_id_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+"""
+Índices GIN de trigramas para a busca de funcionários (core/busca.py).
+Executada apenas no PostgreSQL; em outros bancos não faz nada.
+"""
+
+from django.db import migrations
+
+
+SQL_CRIAR = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    # unaccent() não é IMMUTABLE, por isso não pode ser usada em índices.
+    # O wrapper fixa o dicionário e pode ser indexado.
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    'CREATE INDEX IF NOT EXISTS usuario_nome_trgm_idx ON usuario '
+    'USING gin (f_unaccent(lower(nome)) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS usuario_email_trgm_idx ON usuario '
+    'USING gin (f_unaccent(lower(email)) gin_trgm_ops)',
+]
+
+SQL_REMOVER = [
+    'DROP INDEX IF EXISTS usuario_email_trgm_idx',
+    'DROP INDEX IF EXISTS usuario_nome_trgm_idx',
+    'DROP FUNCTION IF EXISTS f_unaccent(text)',
+]
+
+
+def _executar(comandos):
+    def executar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return executar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_usuario_nome_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(_executar(SQL_CRIAR), _executar(SQL_REMOVER)),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def popular_quadro(apps, schema_editor):
+    """Preenche o quadro com os usuários já cadastrados."""
+    Usuario = apps.get_model('core', 'Usuario')
+    QuadroFuncionarios = apps.get_model('core', 'QuadroFuncionarios')
+    contagens = (
+        Usuario.objects.values('id_departamento_id', 'id_perfil_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    QuadroFuncionarios.objects.bulk_create([
+        QuadroFuncionarios(
+            id_departamento_id=linha['id_departamento_id'],
+            id_perfil_id=linha['id_perfil_id'],
+            total=linha['total'],
+        )
+        for linha in contagens
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_busca_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuadroFuncionarios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de Funcionários')),
+                ('id_departamento', models.ForeignKey(db_column='id_departamento', on_delete=django.db.models.deletion.CASCADE, to='core.departamento', verbose_name='Departamento')),
+                ('id_perfil', models.ForeignKey(db_column='id_perfil', on_delete=django.db.models.deletion.CASCADE, to='core.perfil', verbose_name='Perfil')),
+            ],
+            options={
+                'verbose_name': 'Quadro de Funcionários',
+                'verbose_name_plural': 'Quadro de Funcionários',
+                'db_table': 'quadro_funcionarios',
+                'constraints': [models.UniqueConstraint(fields=('id_departamento', 'id_perfil'), name='quadro_departamento_perfil_uniq')],
+            },
+        ),
+        migrations.RunPython(popular_quadro, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_quadro_funcionarios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='miniaturas',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Miniaturas da Foto'),
+        ),
+    ]
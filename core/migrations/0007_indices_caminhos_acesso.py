@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_usuario_miniaturas'),
+    ]
+
+    operations = [
+        # Novos índices antes de remover os que eles substituem
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['nome', 'id'], include=('email', 'id_perfil', 'id_departamento'), name='usuario_nome_cobertura_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['id_departamento', 'nome', 'id'], include=('email', 'id_perfil'), name='usuario_depto_nome_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='usuario',
+            name='usuario_nome_id_idx',
+        ),
+        migrations.AlterField(
+            model_name='usuario',
+            name='id_departamento',
+            field=models.ForeignKey(db_column='id_departamento', db_index=False, on_delete=django.db.models.deletion.RESTRICT, to='core.departamento', verbose_name='Departamento'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def popular_totais(apps, schema_editor):
+    """Preenche o total de funcionários dos departamentos já cadastrados."""
+    Usuario = apps.get_model('core', 'Usuario')
+    Departamento = apps.get_model('core', 'Departamento')
+    totais = (
+        Usuario.objects.filter(id_departamento=OuterRef('pk'))
+        .order_by()
+        .values('id_departamento')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Departamento.objects.update(total_funcionarios=Coalesce(Subquery(totais), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_indices_caminhos_acesso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='departamento',
+            name='total_funcionarios',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total de Funcionários'),
+        ),
+        migrations.RunPython(popular_totais, migrations.RunPython.noop),
+    ]
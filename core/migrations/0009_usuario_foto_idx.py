@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_departamento_total_funcionarios'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['foto'], name='usuario_foto_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ import os
 import uuid
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
+from .fotos import gerar_miniaturas
+from .hashers import senha_hasheada
 
 
 def usuario_foto_path(instance, filename):
@@ -58,6 +60,14 @@ class Departamento(models.Model):
         blank=True,
         verbose_name='Sigla'
     )
+    # Mantido pelos signals de Usuario com UPDATE ... SET total = total + 1 (F()),
+    # para listar e bloquear exclusões sem contar a tabela usuario.
+    # Reconstruído por: python manage.py atualizar_quadro_funcionarios
+    total_funcionarios = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Total de Funcionários'
+    )
 
     class Meta:
         verbose_name = 'Departamento'
@@ -98,6 +108,12 @@ class Usuario(models.Model):
         blank=True,
         verbose_name='Foto'
     )
+    miniaturas = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Miniaturas da Foto'  # Gerado automaticamente (ver core/fotos.py)
+    )
     id_perfil = models.ForeignKey(
         Perfil,
         on_delete=models.RESTRICT,  # Não permite excluir perfil se houver usuários vinculados
@@ -108,6 +124,7 @@ class Usuario(models.Model):
         Departamento,
         on_delete=models.RESTRICT,  # Não permite excluir departamento se houver usuários vinculados
         db_column='id_departamento',
+        db_index=False,  # Coberto pelo índice usuario_depto_nome_idx (primeira coluna)
         verbose_name='Departamento'
     )
 
@@ -115,6 +132,26 @@ class Usuario(models.Model):
         verbose_name = 'Usuário'
         verbose_name_plural = 'Usuários'
         db_table = 'usuario'
+        # Caminhos de acesso verificados com EXPLAIN por: python manage.py verificar_planos
+        # As colunas em include (apenas PostgreSQL) permitem que o relatório
+        # leia somente o índice (index-only scan), sem visitar a tabela.
+        # O login (email, id_perfil) já usa o índice único de email.
+        indexes = [
+            # Listagem (paginação keyset) e relatório de todos: ORDER BY nome, id
+            models.Index(
+                fields=['nome', 'id'],
+                include=['email', 'id_perfil', 'id_departamento'],
+                name='usuario_nome_cobertura_idx',
+            ),
+            # Relatório e exportação por departamento: WHERE id_departamento = x ORDER BY nome, id
+            models.Index(
+                fields=['id_departamento', 'nome', 'id'],
+                include=['email', 'id_perfil'],
+                name='usuario_depto_nome_idx',
+            ),
+            # Antes de remover uma foto: outro usuário ainda a referencia? (core/signals.py)
+            models.Index(fields=['foto'], name='usuario_foto_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nome} ({self.email})"
@@ -131,16 +168,90 @@ class Usuario(models.Model):
         Método para verificar se a senha está correta.
         Uso: if usuario.verificar_senha('1234'):
         Retorna: True se a senha estiver correta, False caso contrário
+        Se o hash usa um algoritmo ou custo desatualizado (core/hashers.py), a senha
+        é regravada com o hasher atual em um único UPDATE da coluna senha.
         """
-        return check_password(senha_texto, self.senha)
+        def regravar(senha):
+            senha_antiga = self.senha
+            self.set_senha(senha)
+            Usuario.objects.filter(pk=self.pk, senha=senha_antiga).update(senha=self.senha)
+
+        return check_password(senha_texto, self.senha, setter=regravar)
 
     def save(self, *args, **kwargs):
         """
         Sobrescreve o método save para garantir que a senha seja sempre hasheada.
-        Se a senha não começar com 'pbkdf2_sha256$', significa que é uma senha em texto puro
-        e precisa ser hasheada.
+        Se a senha não for um hash de algum hasher de PASSWORD_HASHERS, é uma senha
+        em texto puro e precisa ser hasheada.
         """
-        # Verificar se a senha precisa ser hasheada (não começa com o prefixo do algoritmo)
-        if self.senha and not self.senha.startswith('pbkdf2_sha256$'):
+        if self.senha and not senha_hasheada(self.senha):
             self.senha = make_password(self.senha)
+
+        # Gerar as miniaturas se a foto mudou
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'foto' in update_fields:
+            if self.atualizar_miniaturas() and update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'miniaturas'}
+
         super().save(*args, **kwargs)
+
+    def atualizar_miniaturas(self):
+        """
+        Gera as miniaturas (48, 128 e 512 px) quando a foto atual ainda não as possui.
+        Uma foto recém-enviada é gravada no storage antes, para que as miniaturas
+        usem o nome definitivo gerado por usuario_foto_path.
+        Retorna True se o campo miniaturas foi alterado.
+        """
+        if not self.foto:
+            if self.miniaturas:
+                self.miniaturas = {}
+                return True
+            return False
+
+        if not self.foto._committed:
+            self.foto.save(self.foto.name, self.foto.file, save=False)
+
+        if self.miniaturas.get('origem') == self.foto.name:
+            return False
+
+        self.miniaturas = gerar_miniaturas(self.foto)
+        return True
+
+
+class QuadroFuncionarios(models.Model):
+    """
+    Resumo do quadro de funcionários: total de usuários por departamento e perfil.
+    Mantido atualizado pelos signals de Usuario (ver core/quadro.py), para que as
+    telas de headcount leiam poucas linhas em vez de contar a tabela usuario.
+    Pode ser reconstruído com: python manage.py atualizar_quadro_funcionarios
+    """
+    id_departamento = models.ForeignKey(
+        Departamento,
+        on_delete=models.CASCADE,
+        db_column='id_departamento',
+        verbose_name='Departamento'
+    )
+    id_perfil = models.ForeignKey(
+        Perfil,
+        on_delete=models.CASCADE,
+        db_column='id_perfil',
+        verbose_name='Perfil'
+    )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Total de Funcionários'
+    )
+
+    class Meta:
+        verbose_name = 'Quadro de Funcionários'
+        verbose_name_plural = 'Quadro de Funcionários'
+        db_table = 'quadro_funcionarios'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['id_departamento', 'id_perfil'],
+                name='quadro_departamento_perfil_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id_departamento} - {self.id_perfil}: {self.total}"
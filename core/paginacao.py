@@ -0,0 +1,177 @@
+"""
+Paginação por cursor (keyset / seek) do app core - Sistema Lumon.
+
+Em vez de OFFSET + COUNT(*), cada página é buscada a partir da última linha
+da página anterior: WHERE (nome, id) > (ultimo_nome, ultimo_id) ORDER BY nome, id.
+Com o índice em (nome, id), a página 1000 custa o mesmo que a página 1.
+
+O cursor enviado na querystring é opaco (JSON em base64), no formato
+[direcao, valor, id], onde valor é o campo de ordenação (nome por padrão):
+    ['>', 'Mark Scout', 7]  -> próxima página, depois de (Mark Scout, 7)
+    ['<', 'Mark Scout', 7]  -> página anterior, antes de (Mark Scout, 7)
+    ['<', None, None]       -> última página
+"""
+
+import base64
+import binascii
+import json
+from django.db import connection
+
+PROXIMA = '>'
+ANTERIOR = '<'
+
+
+def codificar_cursor(direcao, valor=None, id=None):
+    """
+    Gera o cursor opaco usado na querystring (?cursor=...).
+    """
+    dados = json.dumps([direcao, valor, id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Converte o cursor da querystring em (direcao, valor, id).
+    Retorna None se o cursor estiver vazio ou for inválido (volta para a primeira página).
+    """
+    if not cursor:
+        return None
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(cursor + preenchimento).decode('utf-8'))
+        direcao, valor, id = dados
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+
+    if direcao not in (PROXIMA, ANTERIOR):
+        return None
+    if (valor is None) != (id is None):
+        return None
+    if valor is not None:
+        if isinstance(valor, bool) or not isinstance(valor, (str, int, float)):
+            return None
+        if isinstance(id, bool) or not isinstance(id, int):
+            return None
+    return direcao, valor, id
+
+
+class PaginaKeyset:
+    """
+    Uma página de resultados paginada por cursor.
+    Expõe a mesma interface usada pelos templates (iteração, has_next,
+    has_previous, has_other_pages) e os cursores de navegação.
+    """
+
+    def __init__(self, itens, has_next, has_previous, campo='nome', total_estimado=None):
+        self.object_list = itens
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.campo = campo
+        self.total_estimado = total_estimado
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def cursor_proximo(self):
+        if not self.has_next:
+            return None
+        ultimo = self.object_list[-1]
+        return codificar_cursor(PROXIMA, getattr(ultimo, self.campo), ultimo.id)
+
+    @property
+    def cursor_anterior(self):
+        if not self.has_previous:
+            return None
+        primeiro = self.object_list[0]
+        return codificar_cursor(ANTERIOR, getattr(primeiro, self.campo), primeiro.id)
+
+    @property
+    def cursor_ultima(self):
+        return codificar_cursor(ANTERIOR)
+
+
+def _depois_de(queryset, campo, valor, id, decrescente):
+    """
+    Linhas que vêm depois de (valor, id) na ordenação da página.
+    Ex. (crescente): campo >= x AND NOT (campo = x AND id <= y),
+    assim a condição no campo continua usando o índice.
+    """
+    if decrescente:
+        queryset = queryset.filter(**{f'{campo}__lte': valor})
+    else:
+        queryset = queryset.filter(**{f'{campo}__gte': valor})
+    return queryset.exclude(**{campo: valor, 'id__lte': id})
+
+
+def _antes_de(queryset, campo, valor, id, decrescente):
+    """
+    Linhas que vêm antes de (valor, id) na ordenação da página.
+    """
+    if decrescente:
+        queryset = queryset.filter(**{f'{campo}__gte': valor})
+    else:
+        queryset = queryset.filter(**{f'{campo}__lte': valor})
+    return queryset.exclude(**{campo: valor, 'id__gte': id})
+
+
+def paginar_keyset(queryset, cursor, por_pagina, campo='nome', decrescente=False):
+    """
+    Retorna uma PaginaKeyset do queryset, ordenado por (campo, id).
+    Busca por_pagina + 1 linhas para saber se existe página seguinte,
+    sem precisar de COUNT(*).
+    O campo pode ser uma anotação (ex.: similaridade da busca, decrescente).
+    """
+    ordem = [f'-{campo}' if decrescente else campo, 'id']
+    ordem_inversa = [campo if decrescente else f'-{campo}', '-id']
+    posicao = decodificar_cursor(cursor)
+
+    if posicao is None:
+        # Primeira página
+        linhas = list(queryset.order_by(*ordem)[:por_pagina + 1])
+        return PaginaKeyset(linhas[:por_pagina], len(linhas) > por_pagina, False, campo)
+
+    direcao, valor, id = posicao
+
+    if direcao == PROXIMA:
+        linhas = list(
+            _depois_de(queryset, campo, valor, id, decrescente).order_by(*ordem)[:por_pagina + 1]
+        )
+        return PaginaKeyset(linhas[:por_pagina], len(linhas) > por_pagina, True, campo)
+
+    # ANTERIOR: percorre a ordenação de trás para frente e inverte o resultado
+    if valor is not None:
+        queryset = _antes_de(queryset, campo, valor, id, decrescente)
+    linhas = list(queryset.order_by(*ordem_inversa)[:por_pagina + 1])
+    itens = linhas[:por_pagina][::-1]
+    return PaginaKeyset(itens, valor is not None, len(linhas) > por_pagina, campo)
+
+
+def estimar_total(model):
+    """
+    Retorna o total aproximado de linhas da tabela do model, lido das
+    estatísticas do PostgreSQL (pg_class.reltuples), sem varrer a tabela.
+    Retorna None em outros bancos ou se a tabela ainda não foi analisada.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table],
+        )
+        linha = cursor.fetchone()
+
+    if linha is None or linha[0] < 0:
+        return None
+    return linha[0]
@@ -0,0 +1,164 @@
+"""
+Perfilador por amostragem (sampling profiler) de requisições - Sistema Lumon.
+
+Enquanto a view executa, uma thread auxiliar lê a pilha de chamadas da thread
+da requisição a cada PERFILADOR_INTERVALO_MS e conta quantas vezes cada pilha
+apareceu. O resultado é gravado no formato "collapsed stacks":
+    view (core/views.py:180);paginar_keyset (core/paginacao.py:90) 12
+que pode ser aberto diretamente no https://www.speedscope.app (flame graph)
+ou convertido com o flamegraph.pl.
+
+Diferente do cProfile, o custo não cresce com a quantidade de chamadas de
+função: a view roda normalmente e só é interrompida a cada amostra.
+O perfilamento é ativado por requisição (ver PerfiladorMiddleware).
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core import signing
+from django.utils.text import slugify
+
+SALT_TOKEN = 'core.perfilador'
+EXTENSAO = '.txt'
+# Pilha das amostras em que a corrotina perfilada está suspensa (await):
+# a thread do loop de eventos está fora do código perfilado
+AGUARDANDO = '(aguardando)'
+
+
+class PerfiladorAmostragem:
+    """
+    Context manager que amostra a pilha da thread atual.
+    Uso:
+        with PerfiladorAmostragem(0.005) as perfil:
+            ...
+        perfil.collapsed()
+    As pilhas começam no código executado dentro do with (frames externos,
+    como middlewares e o servidor, são descartados).
+    Dentro de uma corrotina, a thread amostrada é a do loop de eventos; as
+    amostras em que a corrotina está suspensa são contadas como AGUARDANDO.
+    """
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.amostras = Counter()
+        self._parar = threading.Event()
+        self._thread = None
+        self._alvo = None
+        self._frame_base = None
+
+    def __enter__(self):
+        self._alvo = threading.get_ident()
+        self._frame_base = sys._getframe(1)
+        self._thread = threading.Thread(target=self._amostrar, name='perfilador', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self._frame_base = None
+        return False
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self._alvo)
+            pilha = []
+            while frame is not None and frame is not self._frame_base:
+                pilha.append(_descrever(frame))
+                frame = frame.f_back
+            if pilha and frame is None:
+                # O with não está na pilha da thread: corrotina suspensa
+                pilha = [AGUARDANDO]
+            if pilha:
+                self.amostras[';'.join(reversed(pilha))] += 1
+
+    def collapsed(self):
+        """Pilhas no formato collapsed, da mais frequente para a menos frequente."""
+        return ''.join(f'{pilha} {total}\n' for pilha, total in self.amostras.most_common())
+
+
+def _descrever(frame):
+    """
+    Ex.: usuarios_view (core/views.py:180) - caminho relativo ao projeto,
+    ou os dois últimos níveis do caminho para bibliotecas.
+    """
+    codigo = frame.f_code
+    arquivo = codigo.co_filename
+    base = str(settings.BASE_DIR)
+    if arquivo.startswith(base):
+        arquivo = os.path.relpath(arquivo, base)
+    else:
+        arquivo = os.path.join(*arquivo.split(os.sep)[-2:])
+    return f'{codigo.co_name} ({arquivo}:{codigo.co_firstlineno})'
+
+
+def gerar_token():
+    """
+    Token assinado para o cabeçalho X-Lumon-Perfilar, válido por
+    PERFILADOR_VALIDADE_TOKEN segundos.
+    """
+    return signing.TimestampSigner(salt=SALT_TOKEN).sign('perfilar')
+
+
+def token_valido(token):
+    try:
+        signing.TimestampSigner(salt=SALT_TOKEN).unsign(token, max_age=settings.PERFILADOR_VALIDADE_TOKEN)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def salvar_perfil(perfil, request, duracao):
+    """
+    Grava as pilhas em PERFILADOR_DIR e remove os arquivos mais antigos
+    além de PERFILADOR_MAXIMO_ARQUIVOS. Retorna o nome do arquivo.
+    """
+    os.makedirs(settings.PERFILADOR_DIR, exist_ok=True)
+    nome = (
+        f'{time.strftime("%Y%m%d-%H%M%S")}_{request.method}_'
+        f'{slugify(request.path) or "raiz"}_{round(duracao * 1000)}ms_{uuid.uuid4().hex[:6]}{EXTENSAO}'
+    )
+    with open(os.path.join(settings.PERFILADOR_DIR, nome), 'w', encoding='utf-8') as arquivo:
+        arquivo.write(perfil.collapsed())
+
+    for antigo in listar_perfis()[settings.PERFILADOR_MAXIMO_ARQUIVOS:]:
+        os.remove(os.path.join(settings.PERFILADOR_DIR, antigo['nome']))
+    return nome
+
+
+def listar_perfis():
+    """
+    Lista os perfis gravados, do mais recente para o mais antigo.
+    Cada item: {'nome', 'tamanho', 'data'}.
+    """
+    if not os.path.isdir(settings.PERFILADOR_DIR):
+        return []
+
+    perfis = []
+    for entrada in os.scandir(settings.PERFILADOR_DIR):
+        if entrada.is_file() and entrada.name.endswith(EXTENSAO):
+            info = entrada.stat()
+            perfis.append({
+                'nome': entrada.name,
+                'tamanho': info.st_size,
+                'data': datetime.fromtimestamp(info.st_mtime, tz=timezone.utc),
+            })
+    perfis.sort(key=lambda p: p['data'], reverse=True)
+    return perfis
+
+
+def caminho_perfil(nome):
+    """
+    Caminho do arquivo de perfil, ou None se o nome for inválido
+    (ex.: tentativa de acessar arquivos fora de PERFILADOR_DIR).
+    """
+    if os.path.basename(nome) != nome or not nome.endswith(EXTENSAO):
+        return None
+    caminho = os.path.join(settings.PERFILADOR_DIR, nome)
+    return caminho if os.path.isfile(caminho) else None
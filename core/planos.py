@@ -0,0 +1,97 @@
+"""
+Verificação dos planos de execução (EXPLAIN) das consultas - Sistema Lumon.
+
+Usado pelo comando verificar_planos e pelos testes para garantir que os
+caminhos de acesso críticos (listagem, relatórios, login) continuam usando os
+índices de core/models.py, em vez de varrer a tabela inteira.
+Funciona com PostgreSQL (EXPLAIN FORMAT JSON) e SQLite (EXPLAIN QUERY PLAN).
+"""
+
+import json
+import re
+from django.db import connection
+
+# Tabelas grandes: varredura sequencial nelas é regressão
+TABELAS_CRITICAS = ('usuario',)
+
+# SQLite: "SCAN usuario" é varredura da tabela; "SCAN usuario USING INDEX x"
+# percorre o índice na ordem pedida (sem ordenar) e "SEARCH ..." usa o índice
+_SCAN_SQLITE = re.compile(r'^SCAN (\w+)$')
+
+
+class CapturaConsultas:
+    """
+    Guarda o SQL e os parâmetros dos SELECTs executados em uma conexão.
+    Uso:
+        captura = CapturaConsultas()
+        with connection.execute_wrapper(captura):
+            ...
+        captura.consultas  # [(sql, params), ...]
+    """
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            self.consultas.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explicar(sql, params):
+    """
+    Retorna o plano da consulta como uma lista de nós (dict):
+    {'nivel', 'operacao', 'tabela', 'indice', 'sequencial'}.
+    tabela e indice podem ser None; sequencial indica varredura da tabela inteira.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plano = cursor.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            return list(_nos_postgresql(plano[0]['Plan']))
+
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        niveis = {0: -1}
+        nos = []
+        for id, pai, _, detalhe in cursor.fetchall():
+            niveis[id] = niveis.get(pai, -1) + 1
+            varredura = _SCAN_SQLITE.match(detalhe)
+            nos.append({
+                'nivel': niveis[id],
+                'operacao': detalhe,
+                'tabela': varredura.group(1) if varredura else None,
+                'indice': None,
+                'sequencial': varredura is not None,
+            })
+        return nos
+
+
+def _nos_postgresql(no, nivel=0):
+    yield {
+        'nivel': nivel,
+        'operacao': no['Node Type'],
+        'tabela': no.get('Relation Name'),
+        'indice': no.get('Index Name'),
+        'sequencial': no['Node Type'] == 'Seq Scan',
+    }
+    for filho in no.get('Plans', []):
+        yield from _nos_postgresql(filho, nivel + 1)
+
+
+def varreduras_sequenciais(plano, tabelas=TABELAS_CRITICAS):
+    """Tabelas críticas lidas por varredura sequencial no plano."""
+    return sorted({no['tabela'] for no in plano if no['sequencial'] and no['tabela'] in tabelas})
+
+
+def formatar_plano(plano):
+    linhas = []
+    for no in plano:
+        texto = no['operacao']
+        if no['tabela'] and connection.vendor == 'postgresql':
+            texto += f' on {no["tabela"]}'
+        if no['indice']:
+            texto += f' using {no["indice"]}'
+        linhas.append('  ' * no['nivel'] + texto)
+    return linhas
@@ -0,0 +1,161 @@
+"""
+Quadro de funcionários (headcount) por departamento e perfil - Sistema Lumon.
+
+A tabela quadro_funcionarios guarda um contador por (departamento, perfil) e
+Departamento.total_funcionarios o total do departamento.
+Os signals de Usuario chamam ajustar() e ajustar_departamentos() ao criar,
+mover ou excluir usuários, com UPDATE ... SET total = total + 1 (F()), sem
+ler o valor antes.
+Inserções em massa (bulk_create, COPY) não disparam signals: nesses casos
+o quadro recebe o saldo das linhas gravadas (core/importacao.py) ou é
+reconstruído com recalcular().
+"""
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from .cache import TABELAS_VERSIONADAS, renovar_versao
+from .models import Departamento, QuadroFuncionarios, Usuario
+
+
+def ajustar(departamento_id, perfil_id, delta):
+    """
+    Soma delta (+1 ou -1, ou o saldo de uma importação) ao total de (departamento, perfil).
+    O total nunca fica negativo (como em ajustar_departamentos): uma divergência
+    (ex.: usuários inseridos em massa, sem signals) não pode impedir a exclusão
+    de um usuário e é corrigida por recalcular().
+    """
+    atualizados = QuadroFuncionarios.objects.filter(
+        id_departamento_id=departamento_id, id_perfil_id=perfil_id
+    ).update(total=Greatest(F('total') + delta, Value(0)))
+
+    if atualizados or delta < 0:
+        return
+
+    # Primeira pessoa nesse (departamento, perfil): criar a linha.
+    # Se outra requisição criou ao mesmo tempo, basta incrementar.
+    try:
+        with transaction.atomic():
+            QuadroFuncionarios.objects.create(
+                id_departamento_id=departamento_id, id_perfil_id=perfil_id, total=delta
+            )
+    except IntegrityError:
+        QuadroFuncionarios.objects.filter(
+            id_departamento_id=departamento_id, id_perfil_id=perfil_id
+        ).update(total=Greatest(F('total') + delta, Value(0)))
+
+
+def ajustar_departamentos(deltas):
+    """
+    Soma os deltas ({departamento_id: +1, -1 ou saldo}) ao total_funcionarios dos
+    departamentos em um único UPDATE (ao mover um usuário, origem e destino
+    mudam juntos). O total nunca fica negativo: uma divergência não pode
+    impedir a exclusão de um usuário e é corrigida por recalcular().
+    """
+    deltas = {departamento_id: delta for departamento_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Departamento.objects.filter(id__in=deltas).update(
+        total_funcionarios=Greatest(
+            F('total_funcionarios') + Case(
+                *[When(id=departamento_id, then=Value(delta)) for departamento_id, delta in deltas.items()],
+                default=Value(0),
+            ),
+            Value(0),
+        )
+    )
+    # A lista de departamentos em cache (e os ETags) incluem o total_funcionarios
+    renovar_versao('departamentos')
+
+
+def recalcular():
+    """
+    Reconstrói o quadro a partir da tabela usuario, em uma única transação,
+    e corrige o total_funcionarios dos departamentos que divergirem.
+    Leitores continuam vendo o quadro anterior até o commit.
+    Retorna (quantidade de linhas do quadro, departamentos corrigidos), onde
+    cada departamento corrigido é (departamento, total anterior, total correto).
+    Incrementa as versões de dados (core.cache.versoes) de todas as tabelas.
+    """
+    with transaction.atomic():
+        _travar_quadro()
+        # Contado dentro da transação, já com a trava: ajustes dos signals
+        # feitos entre a contagem e a gravação não se perdem
+        contagens = (
+            Usuario.objects.values('id_departamento_id', 'id_perfil_id')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        linhas = [
+            QuadroFuncionarios(
+                id_departamento_id=linha['id_departamento_id'],
+                id_perfil_id=linha['id_perfil_id'],
+                total=linha['total'],
+            )
+            for linha in contagens
+        ]
+
+        totais = {}
+        for linha in linhas:
+            totais[linha.id_departamento_id] = totais.get(linha.id_departamento_id, 0) + linha.total
+
+        QuadroFuncionarios.objects.all().delete()
+        QuadroFuncionarios.objects.bulk_create(linhas)
+        corrigidos = _corrigir_departamentos(totais)
+    # Chamado após inserções em massa, que não disparam signals
+    renovar_versao(*TABELAS_VERSIONADAS)
+    return len(linhas), corrigidos
+
+
+def _travar_quadro():
+    """
+    No PostgreSQL, trava a tabela do quadro contra escritas até o fim da
+    transação: os signals (UPDATE do quadro) esperam a reconstrução, e ela
+    espera as transações que já ajustaram o quadro, cujos usuários entram na
+    contagem. No SQLite as escritas já são serializadas pelo próprio banco.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {QuadroFuncionarios._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+
+
+def _corrigir_departamentos(totais):
+    """
+    Compara total_funcionarios com os totais contados e corrige os divergentes.
+    A correção recalcula a contagem no próprio UPDATE (subquery), para não
+    sobrescrever ajustes feitos pelos signals depois da contagem.
+    """
+    corrigidos = [
+        (departamento, departamento.total_funcionarios, totais.get(departamento.id, 0))
+        for departamento in Departamento.objects.order_by('departamento')
+        if departamento.total_funcionarios != totais.get(departamento.id, 0)
+    ]
+    if corrigidos:
+        contagem = (
+            Usuario.objects.filter(id_departamento=OuterRef('pk'))
+            .order_by()
+            .values('id_departamento')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        Departamento.objects.filter(id__in=[d.id for d, _, _ in corrigidos]).update(
+            total_funcionarios=Coalesce(Subquery(contagem), 0)
+        )
+    return corrigidos
+
+
+def quadro_do_departamento(departamento_id=None, using=None):
+    """
+    Retorna a lista de (perfil, total) de um departamento, ou de todos
+    os departamentos se departamento_id for None, ordenada por perfil.
+    using força o banco lido (ex.: o primário); None segue o roteador.
+    """
+    quadro = QuadroFuncionarios.objects.using(using).filter(total__gt=0)
+    if departamento_id is not None:
+        quadro = quadro.filter(id_departamento_id=departamento_id)
+
+    return list(
+        quadro.values_list('id_perfil__perfil')
+        .annotate(total=Sum('total'))
+        .order_by('id_perfil__perfil')
+    )
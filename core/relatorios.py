@@ -0,0 +1,121 @@
+"""
+Consultas dos relatórios do app core - Sistema Lumon.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .cache import obter_ou_gerar, obter_referencia_versionada, versoes
+from .models import Usuario
+from .quadro import quadro_do_departamento
+
+
+def consultar_usuarios_relatorio(departamento_id=None):
+    """
+    Retorna o queryset de linhas do relatório de usuários por departamento,
+    ordenado por nome.
+    Cada linha é uma namedtuple (nome, email, perfil, sigla, departamento),
+    muito mais leve que uma instância de Usuario com perfil e departamento,
+    e os três dados vêm da mesma consulta (JOIN).
+    Se departamento_id for None, retorna os usuários de todos os departamentos.
+    """
+    usuarios = Usuario.objects.all()
+    if departamento_id is not None:
+        usuarios = usuarios.filter(id_departamento_id=departamento_id)
+
+    return usuarios.annotate(
+        perfil=F('id_perfil__perfil'),
+        sigla=F('id_departamento__sigla'),
+        departamento=F('id_departamento__departamento'),
+    ).order_by('nome', 'id').values_list(
+        'nome', 'email', 'perfil', 'sigla', 'departamento', named=True
+    )
+
+
+def chave_relatorio(filtro, versoes_tabelas):
+    """
+    Formato: core:relatorio:<filtro>:<versões das tabelas>:<ETAG_VERSAO>
+    Qualquer escrita em usuários, perfis ou departamentos muda a chave:
+    corpos antigos apenas expiram.
+    """
+    return f'core:relatorio:{filtro}:{"-".join(map(str, versoes_tabelas))}:{settings.ETAG_VERSAO}'
+
+
+def _renderizar_corpo(departamento_id, departamentos):
+    """
+    Renderiza o corpo do relatório (relatorio_usuarios_departamento_corpo.html)
+    para o filtro recebido em ?departamento=.
+    Lido do primário: o corpo fica no cache sob as versões atuais das tabelas,
+    e uma réplica atrasada gravaria dados antigos na chave nova.
+    """
+    # Filtrar usuários: o queryset é avaliado uma única vez em uma lista de
+    # linhas compactas (namedtuples), usada para a tabela e para o total
+    if departamento_id and departamento_id != 'todos':
+        # Filtrar por departamento específico (título vem da lista já carregada)
+        departamento_selecionado = next(
+            (dept for dept in departamentos if str(dept.id) == departamento_id), None
+        )
+        if departamento_selecionado is not None:
+            usuarios_filtrados = list(consultar_usuarios_relatorio(departamento_selecionado.id).using(DEFAULT_DB_ALIAS))
+            titulo_relatorio = f"Funcionários do Departamento: {departamento_selecionado.departamento}"
+        else:
+            usuarios_filtrados = []
+            titulo_relatorio = "Departamento não encontrado"
+    elif departamento_id == 'todos':
+        # Mostrar todos os usuários
+        usuarios_filtrados = list(consultar_usuarios_relatorio().using(DEFAULT_DB_ALIAS))
+        titulo_relatorio = "Todos os Funcionários"
+    else:
+        # Nenhum departamento selecionado ainda
+        usuarios_filtrados = None
+        titulo_relatorio = None
+
+    # Quadro de funcionários por perfil (lido do resumo, sem contar usuários)
+    if usuarios_filtrados:
+        quadro_perfis = quadro_do_departamento(
+            departamento_selecionado.id if departamento_id != 'todos' else None,
+            using=DEFAULT_DB_ALIAS,
+        )
+    else:
+        quadro_perfis = []
+
+    return render_to_string('relatorio_usuarios_departamento_corpo.html', {
+        'departamentos': departamentos,
+        'usuarios_filtrados': usuarios_filtrados,
+        'departamento_selecionado': departamento_id,
+        'titulo_relatorio': titulo_relatorio,
+        'total_usuarios': len(usuarios_filtrados) if usuarios_filtrados is not None else 0,
+        'quadro_perfis': quadro_perfis
+    })
+
+
+def corpo_relatorio(departamento_id):
+    """
+    Retorna o corpo renderizado do relatório, igual para todos os usuários.
+    Fica no cache 'relatorios' por filtro (vazio, 'todos' ou id de departamento
+    existente) e versões das tabelas, por RELATORIO_CACHE_TIMEOUT segundos; uma
+    única requisição renderiza cada versão, e as demais aguardam até
+    RELATORIO_TRAVA_SEGUNDOS (obter_ou_gerar) antes de renderizar sem cache.
+    Filtros inválidos são renderizados sem cache, para que valores arbitrários
+    na URL não criem chaves.
+    """
+    # A chave usa a versão da lista de departamentos em uso (a cópia local pode
+    # estar alguns segundos atrás da versão atual), e não a versão mais recente
+    versao_departamentos, departamentos = obter_referencia_versionada('departamentos')
+    if departamento_id not in ('', 'todos') and all(str(dept.id) != departamento_id for dept in departamentos):
+        return mark_safe(_renderizar_corpo(departamento_id, departamentos))
+
+    corpo = obter_ou_gerar(
+        caches['relatorios'],
+        chave_relatorio(departamento_id or 'inicial', versoes('usuarios', 'perfis') + [versao_departamentos]),
+        lambda: _renderizar_corpo(departamento_id, departamentos),
+        settings.RELATORIO_CACHE_TIMEOUT,
+        trava=settings.RELATORIO_TRAVA_SEGUNDOS,
+        espera=settings.RELATORIO_TRAVA_SEGUNDOS,
+    )
+    if corpo is None:
+        corpo = _renderizar_corpo(departamento_id, departamentos)
+    return mark_safe(corpo)
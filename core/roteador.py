@@ -0,0 +1,50 @@
+"""
+Roteamento de leituras para réplicas do banco - Sistema Lumon.
+
+Gravações vão sempre para o primário ('default'). Leituras vão para uma
+réplica (DATABASE_REPLICAS) apenas dentro de requisições de leitura marcadas
+pelo ReplicaLeituraMiddleware; fora delas (POST, management commands, shell,
+signals) tudo é lido do primário. Assim, só as telas de consulta (exportações,
+departamentos, login GET) dividem a carga, e nenhuma gravação decide nada com
+base em dados de uma réplica atrasada. As páginas com ETag (listagem de
+usuários e relatório) também leem do primário: o ETag vem das versões atuais
+(core.decorators.etag_por_versao).
+"""
+
+from contextvars import ContextVar
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Réplica escolhida para a requisição atual, ou None para ler do primário
+replica_atual = ContextVar('replica_atual', default=None)
+
+# Apps sempre lidos do primário: a sessão acabou de ser gravada no login
+APPS_PRIMARIO = {'sessions'}
+
+
+class RoteadorReplicas:
+    """
+    Router do Django (DATABASE_ROUTERS) para primário + réplicas.
+    As réplicas têm os mesmos dados do primário, então relações entre objetos
+    lidos de bancos diferentes são permitidas, e as migrations só rodam no primário.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = replica_atual.get()
+        if (
+            replica is None
+            or model._meta.app_label in APPS_PRIMARIO
+            # Dentro de uma transação, a leitura precisa enxergar o que ela gravou
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # Explícito: sem isso o Django gravaria no banco de onde o objeto foi lido
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
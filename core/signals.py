@@ -3,53 +3,199 @@ Signals do Django para o app core.
 Usado para executar ações automáticas quando eventos ocorrem nos models.
 """
 
-import os
-from django.db.models.signals import pre_delete, pre_save
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Usuario
+from . import quadro
+from .cache import invalidar_usuario, renovar_versao
+from .fotos import remover_miniaturas
+from .models import Departamento, Perfil, Usuario
 
 
-@receiver(pre_delete, sender=Usuario)
-def deletar_foto_usuario(sender, instance, **kwargs):
+def _nome_foto(valor):
     """
-    Signal que é executado ANTES de deletar um usuário.
-    Remove o arquivo de foto do sistema de arquivos se existir.
+    Retorna o nome (caminho relativo) da foto a partir do valor do campo,
+    que pode ser uma string, um FieldFile ou None.
+    """
+    return getattr(valor, 'name', valor) or ''
+
+
+def _remover_foto_apos_commit(nome_foto, miniaturas):
+    """
+    Agenda a remoção da foto e das miniaturas para depois do commit.
+    Se a transação for desfeita, os arquivos continuam no storage.
+    Uma foto ainda referenciada por outro usuário (ex.: as fotos compartilhadas
+    de gerar_dados_sinteticos) é mantida, com as miniaturas; o mesmo vale para
+    miniaturas regeradas de um usuário que outros ainda usam.
     """
-    if instance.foto:
-        # Verificar se o arquivo existe
-        if os.path.isfile(instance.foto.path):
+    def remover():
+        # Lido do primário (índice usuario_foto_idx): em uma réplica atrasada a
+        # linha excluída ainda apareceria, e a foto só deixaria de ser removida
+        usuarios = Usuario.objects.using(DEFAULT_DB_ALIAS)
+        if nome_foto and usuarios.filter(foto=nome_foto).exists():
+            return
+        if nome_foto:
             try:
-                os.remove(instance.foto.path)
-                print(f'Foto removida: {instance.foto.path}')
+                default_storage.delete(nome_foto)
+                print(f'Foto removida: {nome_foto}')
             except Exception as e:
                 print(f'Erro ao remover foto: {e}')
+        if not miniaturas:
+            return
+        # Miniaturas compartilhadas têm a mesma origem (filtro pelo índice da foto)
+        referencias = usuarios.filter(miniaturas=miniaturas)
+        if miniaturas.get('origem'):
+            referencias = referencias.filter(foto=miniaturas['origem'])
+        if not referencias.exists():
+            remover_miniaturas(miniaturas)
+
+    transaction.on_commit(remover)
+
+
+@receiver(pre_delete, sender=Usuario)
+def deletar_foto_usuario(sender, instance, **kwargs):
+    """
+    Signal que é executado ANTES de deletar um usuário.
+    Remove a foto e as miniaturas do storage, após o commit da exclusão.
+    """
+    if instance.foto or instance.miniaturas:
+        _remover_foto_apos_commit(instance.foto.name, instance.miniaturas)
 
 
 @receiver(pre_save, sender=Usuario)
-def deletar_foto_antiga_ao_atualizar(sender, instance, **kwargs):
+def deletar_foto_antiga_ao_atualizar(sender, instance, update_fields=None, **kwargs):
     """
     Signal que é executado ANTES de salvar/atualizar um usuário.
-    Se a foto foi alterada, remove a foto antiga do sistema de arquivos.
+    Se a foto foi alterada, remove a foto antiga (e suas miniaturas) após o commit.
+    A foto original vem do post_init (guardar_valores_originais), sem SELECT no banco.
     """
-    if not instance.pk:
+    if instance._state.adding:
         # Se é um novo registro, não há foto antiga para deletar
         return
 
-    try:
-        # Buscar o registro antigo no banco
-        usuario_antigo = Usuario.objects.get(pk=instance.pk)
-
-        # Verificar se tinha foto antiga
-        if usuario_antigo.foto:
-            # Verificar se a foto foi alterada
-            if instance.foto != usuario_antigo.foto:
-                # A foto foi alterada, deletar a antiga
-                if os.path.isfile(usuario_antigo.foto.path):
-                    try:
-                        os.remove(usuario_antigo.foto.path)
-                        print(f'Foto antiga removida: {usuario_antigo.foto.path}')
-                    except Exception as e:
-                        print(f'Erro ao remover foto antiga: {e}')
-    except Usuario.DoesNotExist:
-        # Usuário não existe ainda, é uma criação
-        pass
+    if 'foto' not in instance.__dict__ or (update_fields is not None and 'foto' not in update_fields):
+        # A foto não está sendo salva (campo adiado ou fora do update_fields)
+        return
+
+    if instance._foto_original is None or instance._miniaturas_original is None:
+        # Instância carregada sem a foto (only/defer): buscar apenas o necessário
+        original = Usuario.objects.filter(pk=instance.pk).values('foto', 'miniaturas').first()
+        if original is None:
+            return
+        instance._foto_original = original['foto']
+        instance._miniaturas_original = original['miniaturas']
+
+    foto_antiga = _nome_foto(instance._foto_original)
+    miniaturas_antigas = instance._miniaturas_original
+    if foto_antiga == _nome_foto(instance.__dict__.get('foto')):
+        foto_antiga = ''
+    if miniaturas_antigas == instance.__dict__.get('miniaturas'):
+        miniaturas_antigas = {}
+
+    if foto_antiga or miniaturas_antigas:
+        _remover_foto_apos_commit(foto_antiga, miniaturas_antigas)
+
+
+@receiver(post_save, sender=Usuario)
+def atualizar_foto_original(sender, instance, **kwargs):
+    """
+    Signal que é executado DEPOIS de salvar um usuário.
+    A foto salva passa a ser a original para o próximo save da mesma instância.
+    """
+    instance._foto_original = instance.__dict__.get('foto')
+    instance._miniaturas_original = instance.__dict__.get('miniaturas')
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    """
+    Signal que é executado DEPOIS de salvar ou deletar um usuário.
+    Remove o usuário do cache, para que a navbar reflita nome e foto atuais.
+    """
+    invalidar_usuario(instance.pk)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def renovar_versao_usuarios(sender, **kwargs):
+    """
+    Signal que é executado DEPOIS de salvar ou deletar um usuário.
+    Incrementa a versão dos usuários, invalidando os ETags da listagem e do relatório.
+    """
+    renovar_versao('usuarios')
+
+
+def _quadro_atual(instance):
+    """
+    Retorna (departamento_id, perfil_id) do usuário sem acessar campos adiados
+    (ex.: carregados com only()), o que faria uma consulta extra.
+    """
+    return instance.__dict__.get('id_departamento_id'), instance.__dict__.get('id_perfil_id')
+
+
+@receiver(post_init, sender=Usuario)
+def guardar_valores_originais(sender, instance, **kwargs):
+    """
+    Signal que é executado ao instanciar um usuário (inclusive vindo do banco).
+    Guarda departamento e perfil originais para o quadro de funcionários, e
+    foto e miniaturas originais para detectar a troca de foto no pre_save sem
+    consultar o banco. Campos adiados (only/defer) ficam None.
+    """
+    instance._quadro_original = _quadro_atual(instance)
+    instance._foto_original = instance.__dict__.get('foto')
+    instance._miniaturas_original = instance.__dict__.get('miniaturas')
+
+
+@receiver(post_save, sender=Usuario)
+def atualizar_quadro_ao_salvar(sender, instance, created, **kwargs):
+    """
+    Signal que é executado DEPOIS de salvar um usuário.
+    Atualiza o quadro de funcionários (e o total do departamento) se o usuário
+    foi criado ou mudou de departamento/perfil.
+    """
+    atual = _quadro_atual(instance)
+    original = instance._quadro_original
+    if created:
+        quadro.ajustar(*atual, 1)
+        quadro.ajustar_departamentos({atual[0]: 1})
+    elif atual != original and None not in original:
+        quadro.ajustar(*original, -1)
+        quadro.ajustar(*atual, 1)
+        if atual[0] != original[0]:
+            quadro.ajustar_departamentos({original[0]: -1, atual[0]: 1})
+    instance._quadro_original = atual
+
+
+@receiver(post_delete, sender=Usuario)
+def atualizar_quadro_ao_deletar(sender, instance, **kwargs):
+    """
+    Signal que é executado DEPOIS de deletar um usuário.
+    Retira o usuário do quadro de funcionários e do total do departamento.
+    """
+    if None not in instance._quadro_original:
+        quadro.ajustar(*instance._quadro_original, -1)
+        quadro.ajustar_departamentos({instance._quadro_original[0]: -1})
+
+
+@receiver(post_save, sender=Perfil)
+@receiver(post_delete, sender=Perfil)
+def invalidar_cache_perfis(sender, **kwargs):
+    """
+    Signal que é executado DEPOIS de salvar ou deletar um perfil.
+    Incrementa a versão dos perfis: invalida a lista em cache
+    (core.cache.obter_referencia) e os ETags das páginas que os exibem.
+    """
+    renovar_versao('perfis')
+
+
+@receiver(post_save, sender=Departamento)
+@receiver(post_delete, sender=Departamento)
+def invalidar_cache_departamentos(sender, **kwargs):
+    """
+    Signal que é executado DEPOIS de salvar ou deletar um departamento.
+    Incrementa a versão dos departamentos (lista em cache e ETags). Mudanças
+    do total_funcionarios (UPDATE, sem signal) são versionadas pelo core/quadro.py.
+    """
+    renovar_versao('departamentos')
@@ -0,0 +1,62 @@
+"""
+Template tags para exibir as fotos dos usuários - Sistema Lumon.
+Uso:
+    {% load fotos %}
+    {% avatar usuario 48 "w-12 h-12 rounded-full object-cover" %}
+"""
+
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from core.fotos import TAMANHOS_MINIATURA
+
+register = template.Library()
+
+
+def _srcset(miniaturas, formato):
+    return format_html_join(
+        ', ', '{} {}w',
+        (
+            (default_storage.url(miniaturas[str(tamanho)][formato]), tamanho)
+            for tamanho in TAMANHOS_MINIATURA
+            if str(tamanho) in miniaturas
+        )
+    )
+
+
+@register.simple_tag
+def avatar(usuario, tamanho, classes=''):
+    """
+    Exibe a foto do usuário no tamanho (em px) informado.
+    Com miniaturas, gera um <picture> com srcset em WebP e JPEG, e o navegador
+    baixa apenas a menor versão adequada à tela (ex.: 48 px, ou 128 px em telas retina).
+    Sem foto, exibe o avatar padrão; sem miniaturas, a foto original.
+    """
+    if not usuario.foto:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}">',
+            static('img/avatar_default.svg'), usuario.nome, classes
+        )
+
+    miniaturas = usuario.miniaturas or {}
+    if miniaturas.get('origem') != usuario.foto.name:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            usuario.foto.url, usuario.nome, classes
+        )
+
+    # Versão JPEG padrão: a menor que cobre o tamanho exibido
+    padrao = next(
+        (t for t in TAMANHOS_MINIATURA if t >= tamanho and str(t) in miniaturas),
+        TAMANHOS_MINIATURA[-1]
+    )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" width="{}" height="{}" alt="{}" class="{}" loading="lazy">'
+        '</picture>',
+        _srcset(miniaturas, 'webp'), tamanho,
+        default_storage.url(miniaturas[str(padrao)]['jpg']), _srcset(miniaturas, 'jpg'), tamanho,
+        tamanho, tamanho, usuario.nome, classes
+    )
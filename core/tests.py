@@ -1,3 +1,1834 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pickle
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from unittest import mock, skipIf, skipUnless
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from . import autenticacao, quadro
+from .busca import buscar_usuarios, normalizar_termo
+from .cache import (
+    chave_referencia, chave_usuario, chave_versao, limpar_referencias_locais, obter_ou_gerar,
+    obter_referencia, versoes,
+)
+from .exportacao import TAMANHO_BLOCO, gerar_xlsx
+from .fotos import TAMANHOS_MINIATURA
+from .importacao import importar_usuarios
+from .limitador import _consumir
+from .middleware import ReplicaLeituraMiddleware
+from .perfilador import AGUARDANDO, gerar_token, listar_perfis
+from .planos import CapturaConsultas, explicar, varreduras_sequenciais
+from .roteador import RoteadorReplicas, replica_atual
+from .models import Usuario, Perfil, Departamento, QuadroFuncionarios
+from .relatorios import chave_relatorio, consultar_usuarios_relatorio, corpo_relatorio
+
+
+class LumonTestCase(TestCase):
+    """
+    Base dos testes: cria perfis, departamentos e um usuário logado.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gerente = Perfil.objects.create(perfil='Gerente')
+        cls.funcionario = Perfil.objects.create(perfil='Funcionário')
+        cls.mdr = Departamento.objects.create(departamento='Refinamento de Macrodados', sigla='MDR')
+        cls.od = Departamento.objects.create(departamento='Ótica e Design', sigla='O&D')
+        cls.senha_hash = make_password('1234')
+        cls.mark = Usuario.objects.create(
+            nome='Mark Scout',
+            email='mark@lumon.com',
+            senha=cls.senha_hash,
+            id_perfil=cls.gerente,
+            id_departamento=cls.mdr,
+        )
+
+    def setUp(self):
+        cache.clear()
+        caches['relatorios'].clear()
+        limpar_referencias_locais()
+
+    def logar(self, usuario=None):
+        """Coloca o usuário na sessão do client, sem passar pelo hash de senha."""
+        usuario = usuario or self.mark
+        session = self.client.session
+        session['usuario_id'] = usuario.id
+        session['usuario_nome'] = usuario.nome
+        session.save()
+
+
+class UsuarioLogadoTests(LumonTestCase):
+    """Testes do UsuarioLogadoMiddleware e do decorator login_obrigatorio."""
+
+    paginas = [
+        reverse('home'),
+        reverse('departamentos'),
+        reverse('usuarios'),
+        reverse('relatorio_usuarios_departamento') + '?departamento=todos',
+    ]
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def test_sem_login_redireciona(self):
+        for url in self.paginas:
+            response = self.client.get(url)
+            self.assertRedirects(response, reverse('login'))
+
+    def test_cache_quente_remove_consulta_de_identidade(self):
+        self.logar()
+        for url in self.paginas:
+            self.client.get(url)  # aquece o cache de perfis e departamentos
+            cache.delete(chave_usuario(self.mark.id))
+            frias = self._queries(url)
+            quentes = self._queries(url)
+            self.assertEqual(len(quentes), len(frias) - 1, url)
+
+    def test_home_com_cache_quente_nao_consulta_usuario(self):
+        self.logar()
+        self.client.get(reverse('home'))
+        sqls = self._queries(reverse('home'))
+        self.assertFalse(any('"usuario"' in sql for sql in sqls), sqls)
+
+    def test_cache_guarda_a_projecao_sem_a_senha(self):
+        self.logar()
+        self.client.get(reverse('home'))
+        em_cache = cache.get(chave_usuario(self.mark.id))
+        self.assertEqual(
+            (em_cache.nome, em_cache.perfil, em_cache.id_perfil_id, em_cache.id_departamento_id),
+            ('Mark Scout', 'Gerente', self.gerente.id, self.mdr.id),
+        )
+        self.assertFalse(hasattr(em_cache, 'senha'))
+        self.assertNotIn(self.senha_hash.encode(), pickle.dumps(em_cache))
+
+        # Também no login, que grava o usuário no cache
+        cache.clear()
+        with override_settings(LOGIN_PROCESSOS=0):
+            self.client.post(reverse('login'), {'email': 'mark@lumon.com', 'senha': '1234', 'perfil': self.gerente.id})
+        self.assertNotIn(self.senha_hash.encode(), pickle.dumps(cache.get(chave_usuario(self.mark.id))))
+
+    def test_signal_invalida_cache_ao_salvar(self):
+        self.logar()
+        self.client.get(reverse('home'))
+        self.assertIsNotNone(cache.get(chave_usuario(self.mark.id)))
+
+        self.mark.nome = 'Mark S.'
+        self.mark.save()
+        self.assertIsNone(cache.get(chave_usuario(self.mark.id)))
+        self.assertContains(self.client.get(reverse('home')), 'Mark S.')
+
+    def test_usuario_excluido_invalida_sessao(self):
+        outro = Usuario.objects.create(
+            nome='Helly Riggs',
+            email='helly@lumon.com',
+            senha=self.senha_hash,
+            id_perfil=self.funcionario,
+            id_departamento=self.mdr,
+        )
+        self.logar(outro)
+        self.client.get(reverse('home'))
+        outro.delete()
+
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('login'))
+        self.assertNotIn('usuario_id', self.client.session)
+
+
+class PaginacaoKeysetTests(LumonTestCase):
+    """Testes da paginação por cursor da listagem de usuários."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Dois usuários com o mesmo nome para testar o desempate por id
+        nomes = ['Ana', 'Bruno', 'Carla', 'Carla', 'Diego', 'Elisa',
+                 'Fábio', 'Gabi', 'Hugo', 'Iris', 'João']
+        Usuario.objects.bulk_create([
+            Usuario(
+                nome=nome,
+                email=f'u{i}@lumon.com',
+                senha=cls.senha_hash,
+                id_perfil=cls.funcionario,
+                id_departamento=cls.mdr,
+            )
+            for i, nome in enumerate(nomes)
+        ])
+        cls.ordenados = list(Usuario.objects.order_by('nome', 'id').values_list('id', flat=True))
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+
+    def _pagina(self, **params):
+        response = self.client.get(reverse('usuarios'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_percorre_todas_as_paginas_para_frente_e_para_tras(self):
+        vistos = []
+        pagina = self._pagina()
+        self.assertFalse(pagina.has_previous)
+        paginas = [pagina]
+        while True:
+            vistos += [u.id for u in pagina]
+            if not pagina.has_next:
+                break
+            pagina = self._pagina(cursor=pagina.cursor_proximo)
+            paginas.append(pagina)
+        self.assertEqual(vistos, self.ordenados)
+
+        # Voltando a partir da última página, cada página anterior é idêntica
+        for esperada in reversed(paginas[:-1]):
+            pagina = self._pagina(cursor=pagina.cursor_anterior)
+            self.assertEqual([u.id for u in pagina], [u.id for u in esperada])
+        self.assertFalse(pagina.has_previous)
+
+    def test_ultima_pagina(self):
+        pagina = self._pagina(cursor=self._pagina().cursor_ultima)
+        self.assertEqual([u.id for u in pagina], self.ordenados[-5:])
+        self.assertFalse(pagina.has_next)
+        self.assertTrue(pagina.has_previous)
+
+    def test_cursor_respeita_filtro_por_nome(self):
+        pagina = self._pagina(nome='a')
+        ids = [u.id for u in pagina]
+        pagina = self._pagina(nome='a', cursor=pagina.cursor_proximo)
+        ids += [u.id for u in pagina]
+        esperados = list(
+            Usuario.objects.filter(nome__icontains='a').order_by('nome', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, esperados)
+
+    def test_cursor_invalido_volta_para_primeira_pagina(self):
+        pagina = self._pagina(cursor='nao-e-um-cursor')
+        self.assertEqual([u.id for u in pagina], self.ordenados[:5])
+
+    def test_sem_count_nem_offset(self):
+        cursor = self._pagina().cursor_proximo
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('usuarios'), {'cursor': cursor})
+        for query in ctx.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+
+class BuscaUsuariosTests(LumonTestCase):
+    """Testes da busca de funcionários (core/busca.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i, nome in enumerate(['Óscar Ótica', 'Oscar Silva', 'Helena Moura']):
+            Usuario.objects.create(
+                nome=nome,
+                email=f'busca{i}@lumon.com',
+                senha=cls.senha_hash,
+                id_perfil=cls.funcionario,
+                id_departamento=cls.od,
+            )
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+
+    def _nomes(self, termo):
+        response = self.client.get(reverse('usuarios'), {'nome': termo})
+        return [u.nome for u in response.context['page_obj']]
+
+    def test_normalizar_termo(self):
+        self.assertEqual(normalizar_termo('Ótica e Design'), 'otica e design')
+
+    def test_busca_por_email(self):
+        self.assertEqual(self._nomes('busca2@'), ['Helena Moura'])
+
+    @skipIf(connection.vendor == 'postgresql', 'fallback usado apenas fora do PostgreSQL')
+    def test_fallback_por_substring(self):
+        self.assertEqual(self._nomes('Oscar'), ['Oscar Silva'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'requer PostgreSQL (pg_trgm e unaccent)')
+class BuscaTrigramaPostgresTests(BuscaUsuariosTests):
+    """Testes da busca por similaridade, executados apenas no PostgreSQL."""
+
+    def test_ignora_acentos_e_maiusculas(self):
+        self.assertEqual(self._nomes('otica'), ['Óscar Ótica'])
+
+    def test_ordena_por_similaridade(self):
+        self.assertEqual(self._nomes('oscar silva')[0], 'Oscar Silva')
+
+    def test_tolera_erro_de_digitacao(self):
+        self.assertIn('Helena Moura', self._nomes('helena mora'))
+
+    def test_consulta_usa_indice_trigrama(self):
+        queryset, _, _ = buscar_usuarios(Usuario.objects.all(), 'oscar')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plano = queryset.explain()
+        self.assertIn('usuario_nome_trgm_idx', plano)
+
+
+class UsuariosHtmxTests(LumonTestCase):
+    """Testes das respostas parciais (HTMX) da listagem de usuários."""
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+        # Aquecer o cache do usuário logado
+        self.client.get(reverse('home'))
+
+    def test_requisicao_htmx_devolve_apenas_a_listagem(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('usuarios'), {'nome': 'Mark'}, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'usuarios_lista.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertNotContains(response, '<nav')
+        self.assertContains(response, 'Mark Scout')
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse(any('FROM "perfil"' in sql or 'FROM "departamento"' in sql for sql in sqls), sqls)
+        self.assertIn('HX-Request', response['Vary'])
+
+    def test_parcial_e_menor_e_faz_menos_consultas(self):
+        with CaptureQueriesContext(connection) as completa:
+            pagina = self.client.get(reverse('usuarios'))
+        with CaptureQueriesContext(connection) as parcial:
+            fragmento = self.client.get(reverse('usuarios'), HTTP_HX_REQUEST='true')
+        self.assertLess(len(fragmento.content), len(pagina.content) // 2)
+        self.assertEqual(len(parcial), len(completa) - 2)
+
+    def test_restauracao_de_historico_devolve_pagina_completa(self):
+        response = self.client.get(
+            reverse('usuarios'),
+            HTTP_HX_REQUEST='true',
+            HTTP_HX_HISTORY_RESTORE_REQUEST='true',
+        )
+        self.assertTemplateUsed(response, 'base.html')
+
+
+class ExportacaoRelatorioTests(LumonTestCase):
+    """Testes da exportação em streaming do relatório (CSV e XLSX)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Usuario.objects.create(
+            nome='Burt <Goodman> & Cia',
+            email='burt@lumon.com',
+            senha=cls.senha_hash,
+            id_perfil=cls.gerente,
+            id_departamento=cls.od,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+
+    def _exportar(self, **params):
+        response = self.client.get(reverse('exportar_usuarios_departamento'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_de_todos(self):
+        response, conteudo = self._exportar(departamento='todos', formato='csv')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        linhas = conteudo.decode('utf-8-sig').splitlines()
+        self.assertEqual(linhas[0], 'Nome do Funcionário;E-mail;Perfil (Cargo);Departamento')
+        self.assertEqual(linhas[1:], [
+            'Burt <Goodman> & Cia;burt@lumon.com;Gerente;O&D',
+            'Mark Scout;mark@lumon.com;Gerente;MDR',
+        ])
+
+    def test_csv_por_departamento(self):
+        _, conteudo = self._exportar(departamento=self.mdr.id, formato='csv')
+        self.assertEqual(len(conteudo.decode('utf-8-sig').splitlines()), 2)
+
+    def test_xlsx_valido(self):
+        _, conteudo = self._exportar(departamento='todos', formato='xlsx')
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as arquivo:
+            self.assertIsNone(arquivo.testzip())
+            planilha = ElementTree.fromstring(arquivo.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        linhas = [
+            [t.text for t in row.findall('.//s:t', ns)]
+            for row in planilha.findall('.//s:row', ns)
+        ]
+        self.assertEqual(linhas[1], ['Burt <Goodman> & Cia', 'burt@lumon.com', 'Gerente', 'O&D'])
+        self.assertEqual(len(linhas), 3)
+
+    def test_xlsx_grande_e_enviado_em_varios_blocos(self):
+        linhas = (
+            [uuid.uuid4().hex, f'{uuid.uuid4().hex}@lumon.com', 'Funcionário', 'MDR']
+            for _ in range(5 * TAMANHO_BLOCO)
+        )
+        blocos = [bloco for bloco in gerar_xlsx(linhas) if bloco]
+        self.assertGreater(len(blocos), 3)
+        with zipfile.ZipFile(io.BytesIO(b''.join(blocos))) as arquivo:
+            self.assertIsNone(arquivo.testzip())
+
+    async def test_asgi_usa_iterador_assincrono(self):
+        self.async_client.cookies = self.client.cookies
+        for formato in ('csv', 'xlsx'):
+            response = await self.async_client.get(
+                reverse('exportar_usuarios_departamento'), {'departamento': 'todos', 'formato': formato}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            conteudo = b''.join([parte async for parte in response.streaming_content])
+            if formato == 'csv':
+                self.assertEqual(len(conteudo.decode('utf-8-sig').splitlines()), 3)
+            else:
+                with zipfile.ZipFile(io.BytesIO(conteudo)) as arquivo:
+                    self.assertIsNone(arquivo.testzip())
+
+    def test_parametros_invalidos(self):
+        response = self.client.get(reverse('exportar_usuarios_departamento'), {'departamento': 'x'})
+        self.assertRedirects(response, reverse('relatorio_usuarios_departamento'))
+
+
+class RelatorioUsuariosDepartamentoTests(LumonTestCase):
+    """Testes do relatório de usuários por departamento."""
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+        # Aquecer o cache do usuário logado
+        self.client.get(reverse('home'))
+
+    def _relatorio(self, departamento):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('relatorio_usuarios_departamento'), {'departamento': departamento})
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def test_departamento_usa_lista_carregada_e_nao_conta(self):
+        response, sqls = self._relatorio(str(self.mdr.id))
+        self.assertEqual(
+            response.context['titulo_relatorio'],
+            'Funcionários do Departamento: Refinamento de Macrodados'
+        )
+        self.assertEqual(response.context['total_usuarios'], 1)
+        self.assertFalse(any('COUNT(' in sql.upper() for sql in sqls), sqls)
+        self.assertEqual(sum('FROM "departamento"' in sql for sql in sqls), 1, sqls)
+        self.assertEqual(sum('FROM "usuario"' in sql for sql in sqls), 1, sqls)
+
+    def test_linhas_compactas_renderizadas_uma_vez(self):
+        response, _ = self._relatorio('todos')
+        linha = response.context['usuarios_filtrados'][0]
+        self.assertEqual(linha.nome, 'Mark Scout')
+        self.assertEqual(linha.perfil, 'Gerente')
+        self.assertEqual(linha.sigla, 'MDR')
+        self.assertContains(response, 'mark@lumon.com', count=1)
+
+    def test_departamento_inexistente(self):
+        response, _ = self._relatorio('999')
+        self.assertEqual(response.context['titulo_relatorio'], 'Departamento não encontrado')
+        self.assertEqual(response.context['usuarios_filtrados'], [])
+
+
+class QuadroFuncionariosTests(LumonTestCase):
+    """Testes do quadro de funcionários mantido pelos signals."""
+
+    def _quadro(self):
+        return {
+            (q.id_departamento_id, q.id_perfil_id): q.total
+            for q in QuadroFuncionarios.objects.filter(total__gt=0)
+        }
+
+    def _novo(self, **kwargs):
+        dados = {
+            'nome': 'Irving Bailiff',
+            'email': 'irving@lumon.com',
+            'senha': self.senha_hash,
+            'id_perfil': self.funcionario,
+            'id_departamento': self.mdr,
+        }
+        dados.update(kwargs)
+        return Usuario.objects.create(**dados)
+
+    def test_criar_mover_e_excluir(self):
+        irving = self._novo()
+        self.assertEqual(self._quadro(), {
+            (self.mdr.id, self.gerente.id): 1,
+            (self.mdr.id, self.funcionario.id): 1,
+        })
+
+        # Mudar de departamento (instância carregada do banco)
+        irving = Usuario.objects.get(id=irving.id)
+        irving.id_departamento = self.od
+        irving.save()
+        self.assertEqual(self._quadro(), {
+            (self.mdr.id, self.gerente.id): 1,
+            (self.od.id, self.funcionario.id): 1,
+        })
+
+        # Salvar sem mudar departamento/perfil não altera o quadro
+        irving.nome = 'Irving B.'
+        irving.save()
+        self.assertEqual(self._quadro()[(self.od.id, self.funcionario.id)], 1)
+
+        irving.delete()
+        self.assertEqual(self._quadro(), {(self.mdr.id, self.gerente.id): 1})
+
+    def test_recalcular_corrige_insercoes_em_massa(self):
+        Usuario.objects.bulk_create([
+            Usuario(nome=f'U{i}', email=f'massa{i}@lumon.com', senha=self.senha_hash,
+                    id_perfil=self.funcionario, id_departamento=self.od)
+            for i in range(3)
+        ])
+        self.assertNotIn((self.od.id, self.funcionario.id), self._quadro())
+        call_command('atualizar_quadro_funcionarios', stdout=io.StringIO())
+        self.assertEqual(self._quadro()[(self.od.id, self.funcionario.id)], 3)
+        self.assertEqual(Departamento.objects.get(id=self.od.id).total_funcionarios, 3)
+
+    def _totais_departamentos(self):
+        return dict(Departamento.objects.values_list('id', 'total_funcionarios'))
+
+    def test_total_do_departamento(self):
+        self.assertEqual(self._totais_departamentos(), {self.mdr.id: 1, self.od.id: 0})
+        irving = self._novo()
+        self.assertEqual(self._totais_departamentos(), {self.mdr.id: 2, self.od.id: 0})
+
+        irving = Usuario.objects.get(id=irving.id)
+        irving.id_departamento = self.od
+        irving.save()
+        self.assertEqual(self._totais_departamentos(), {self.mdr.id: 1, self.od.id: 1})
+
+        # Trocar apenas o perfil não altera os totais dos departamentos
+        irving.id_perfil = self.gerente
+        with CaptureQueriesContext(connection) as consultas:
+            irving.save()
+        self.assertFalse([q for q in consultas if 'UPDATE "departamento"' in q['sql']])
+
+        irving.delete()
+        self.assertEqual(self._totais_departamentos(), {self.mdr.id: 1, self.od.id: 0})
+
+    def test_excluir_departamento_com_funcionarios_sem_delete(self):
+        self.logar()
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(reverse('departamentos'), {'acao': 'excluir', 'id': self.mdr.id}, follow=True)
+        self.assertContains(response, 'possui funcionários')
+        self.assertFalse([q for q in consultas if q['sql'].startswith('DELETE')])
+        self.assertTrue(Departamento.objects.filter(id=self.mdr.id).exists())
+
+        self.client.post(reverse('departamentos'), {'acao': 'excluir', 'id': self.od.id})
+        self.assertFalse(Departamento.objects.filter(id=self.od.id).exists())
+
+    def test_recalcular_corrige_total_divergente(self):
+        Departamento.objects.filter(id=self.mdr.id).update(total_funcionarios=7)
+        saida = io.StringIO()
+        call_command('atualizar_quadro_funcionarios', stdout=saida)
+        self.assertIn('7 -> 1', saida.getvalue())
+        self.assertEqual(self._totais_departamentos(), {self.mdr.id: 1, self.od.id: 0})
+
+    def test_total_nunca_negativo(self):
+        Departamento.objects.filter(id=self.mdr.id).update(total_funcionarios=0)
+        QuadroFuncionarios.objects.update(total=0)
+        self.mark.delete()
+        self.assertEqual(self._totais_departamentos()[self.mdr.id], 0)
+        self.assertEqual(QuadroFuncionarios.objects.get(id_departamento=self.mdr, id_perfil=self.gerente).total, 0)
+
+    def test_telas_leem_o_quadro(self):
+        self._novo()
+        self.logar()
+        response = self.client.get(reverse('departamentos'))
+        totais = {d.id: d.total_funcionarios for d in response.context['departamentos']}
+        self.assertEqual(totais, {self.mdr.id: 2, self.od.id: 0})
+
+        response = self.client.get(reverse('relatorio_usuarios_departamento'), {'departamento': 'todos'})
+        self.assertEqual(response.context['quadro_perfis'], [('Funcionário', 1), ('Gerente', 1)])
+        response = self.client.get(reverse('relatorio_usuarios_departamento'), {'departamento': self.mdr.id})
+        self.assertEqual(response.context['quadro_perfis'], [('Funcionário', 1), ('Gerente', 1)])
+
+
+class MiniaturasFotoTests(LumonTestCase):
+    """Testes das miniaturas geradas no upload da foto."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def _png(self, cor='red', tamanho=(800, 600)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGBA', tamanho, cor).save(buffer, format='PNG')
+        return SimpleUploadedFile('foto.png', buffer.getvalue(), content_type='image/png')
+
+    def _arquivos(self, miniaturas):
+        return [
+            caminho
+            for chave, formatos in miniaturas.items() if chave != 'origem'
+            for caminho in formatos.values()
+        ]
+
+    def test_upload_gera_miniaturas(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+
+        miniaturas = Usuario.objects.get(id=self.mark.id).miniaturas
+        self.assertEqual(miniaturas['origem'], self.mark.foto.name)
+        self.assertEqual(set(miniaturas) - {'origem'}, {str(t) for t in TAMANHOS_MINIATURA})
+        for caminho in self._arquivos(miniaturas):
+            self.assertTrue(default_storage.exists(caminho), caminho)
+
+        from PIL import Image
+        with default_storage.open(miniaturas['128']['webp']) as arquivo:
+            self.assertEqual(Image.open(arquivo).size, (128, 128))
+        # Recorte quadrado no maior tamanho que a foto (800x600) comporta
+        with default_storage.open(miniaturas['512']['jpg']) as arquivo:
+            self.assertEqual(Image.open(arquivo).size, (512, 512))
+
+    def test_upload_corrompido_mantem_a_foto_sem_miniaturas(self):
+        self.logar()
+        corrompida = SimpleUploadedFile('foto.png', b'\x89PNG\r\n\x1a\n' + b'\x00' * 64, content_type='image/png')
+        with self.assertLogs('core.fotos', 'WARNING'):
+            response = self.client.post(reverse('usuarios'), {
+                'acao': 'alterar', 'id': self.mark.id, 'nome': 'Mark Scout', 'email': 'mark@lumon.com',
+                'perfil': self.gerente.id, 'departamento': self.mdr.id, 'foto': corrompida,
+            })
+        self.assertRedirects(response, reverse('usuarios'), fetch_redirect_response=False)
+        self.mark.refresh_from_db()
+        self.assertTrue(default_storage.exists(self.mark.foto.name))
+        self.assertEqual(self.mark.miniaturas, {})
+
+    def test_imagem_acima_do_limite_de_pixels(self):
+        from PIL import Image
+        self.mark.foto = self._png()
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), self.assertLogs('core.fotos', 'WARNING') as logs:
+            self.mark.save()
+        self.assertIn('DecompressionBombError', logs.output[0])
+        self.assertEqual(self.mark.miniaturas, {})
+
+    def test_erros_de_decodificacao_nao_impedem_o_save(self):
+        for erro in (ValueError('modo invalido'), SyntaxError('broken PNG file')):
+            with self.subTest(erro=type(erro).__name__):
+                self.mark.foto = self._png()
+                with mock.patch('core.fotos.Image.open', side_effect=erro), self.assertLogs('core.fotos', 'WARNING'):
+                    self.mark.save()
+                self.assertEqual(self.mark.miniaturas, {})
+
+    def test_trocar_e_excluir_remove_miniaturas(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+        antigas = self._arquivos(self.mark.miniaturas)
+
+        foto_antiga = self.mark.foto.name
+
+        # Arquivos antigos só são removidos após o commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mark.foto = self._png('blue')
+            self.mark.save()
+            self.assertTrue(default_storage.exists(foto_antiga))
+        novas = self._arquivos(self.mark.miniaturas)
+        self.assertFalse(default_storage.exists(foto_antiga))
+        self.assertTrue(all(not default_storage.exists(c) for c in antigas))
+        self.assertTrue(all(default_storage.exists(c) for c in novas))
+
+        foto = self.mark.foto.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mark.delete()
+        self.assertFalse(default_storage.exists(foto))
+        self.assertTrue(all(not default_storage.exists(c) for c in novas))
+
+    def test_foto_compartilhada_so_e_removida_sem_referencias(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+        foto, miniaturas = self.mark.foto.name, self._arquivos(self.mark.miniaturas)
+        # Como em gerar_dados_sinteticos --fotos: mesma foto, sem signals
+        Usuario.objects.bulk_create([Usuario(
+            nome='Sintético', email='sintetico.0000001@lumon.com', senha=self.senha_hash,
+            foto=foto, miniaturas=self.mark.miniaturas, id_perfil=self.funcionario, id_departamento=self.mdr,
+        )])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mark.delete()
+        self.assertTrue(default_storage.exists(foto))
+        self.assertTrue(all(default_storage.exists(c) for c in miniaturas))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.get(email='sintetico.0000001@lumon.com').delete()
+        self.assertFalse(default_storage.exists(foto))
+        self.assertTrue(all(not default_storage.exists(c) for c in miniaturas))
+
+    def test_miniaturas_compartilhadas_so_sao_removidas_sem_referencias(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+        foto, antigas = self.mark.foto.name, self._arquivos(self.mark.miniaturas)
+        Usuario.objects.bulk_create([Usuario(
+            nome='Sintético', email='sintetico.0000001@lumon.com', senha=self.senha_hash,
+            foto=foto, miniaturas=self.mark.miniaturas, id_perfil=self.funcionario, id_departamento=self.mdr,
+        )])
+
+        # Como em gerar_miniaturas --todas: regerar para um dos usuários
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mark.miniaturas = {}
+            self.mark.save()
+        novas = self._arquivos(self.mark.miniaturas)
+        self.assertNotEqual(novas, antigas)
+        self.assertTrue(all(default_storage.exists(c) for c in antigas + novas))
+
+        sintetico = Usuario.objects.get(email='sintetico.0000001@lumon.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            sintetico.miniaturas = {}
+            sintetico.save()
+        self.assertTrue(all(not default_storage.exists(c) for c in antigas))
+        self.assertTrue(all(default_storage.exists(c) for c in novas + self._arquivos(sintetico.miniaturas)))
+
+    def test_atualizar_sem_trocar_foto_nao_consulta_o_banco(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+
+        usuario = Usuario.objects.get(id=self.mark.id)
+        usuario.nome = 'Mark S.'
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as ctx:
+                usuario.save()
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(selects, [])
+        # Nenhuma remoção de arquivo agendada (apenas a versão de dados é renovada)
+        remocoes = [c for c in callbacks if c.__qualname__.startswith('_remover_foto_apos_commit')]
+        self.assertEqual(remocoes, [])
+
+    def test_troca_desfeita_nao_remove_a_foto(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+        foto_antiga = self.mark.foto.name
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                self.mark.foto = self._png('blue')
+                self.mark.save()
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertTrue(default_storage.exists(foto_antiga))
+
+    def test_salvar_sem_trocar_foto_nao_regera(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+        miniaturas = self.mark.miniaturas
+
+        usuario = Usuario.objects.get(id=self.mark.id)
+        usuario.nome = 'Mark S.'
+        usuario.save()
+        self.assertEqual(usuario.miniaturas, miniaturas)
+        self.assertTrue(default_storage.exists(miniaturas['48']['jpg']))
+
+    def test_template_usa_srcset(self):
+        template = Template('{% load fotos %}{% avatar usuario 48 "w-12" %}')
+
+        html = template.render(Context({'usuario': self.mark}))
+        self.assertIn('img/avatar_default.svg', html)
+
+        self.mark.foto = self._png()
+        self.mark.save()
+        html = template.render(Context({'usuario': self.mark}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('_48.webp 48w', html)
+        self.assertIn('_128.jpg 128w', html)
+        self.assertIn('sizes="48px"', html)
+        self.assertNotIn(self.mark.foto.url + '"', html)
+
+    def test_comando_gera_miniaturas_de_fotos_antigas(self):
+        self.mark.foto = self._png()
+        self.mark.save()
+        Usuario.objects.filter(id=self.mark.id).update(miniaturas={})
+
+        call_command('gerar_miniaturas', stdout=io.StringIO())
+        miniaturas = Usuario.objects.get(id=self.mark.id).miniaturas
+        self.assertEqual(miniaturas['origem'], self.mark.foto.name)
+        self.assertTrue(default_storage.exists(miniaturas['512']['webp']))
+
+
+class GeradorDadosSinteticosTests(LumonTestCase):
+    """Testes do comando gerar_dados_sinteticos."""
+
+    def _gerar(self, **opcoes):
+        call_command('gerar_dados_sinteticos', stdout=io.StringIO(), **opcoes)
+
+    def test_gera_em_lotes_com_hash_unico(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._gerar(usuarios=250, departamentos=4, perfis=2, lote=100)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "usuario"')]
+        self.assertEqual(len(inserts), 3)
+
+        sinteticos = Usuario.objects.filter(email__startswith='sintetico.')
+        self.assertEqual(sinteticos.count(), 250)
+        self.assertEqual(sinteticos.values('senha').distinct().count(), 1)
+        self.assertTrue(sinteticos.first().verificar_senha('1234'))
+        self.assertEqual(sinteticos.values('id_departamento').distinct().count(), 4)
+
+        total_quadro = sum(QuadroFuncionarios.objects.values_list('total', flat=True))
+        self.assertEqual(total_quadro, Usuario.objects.count())
+
+    def test_incremental(self):
+        self._gerar(usuarios=30)
+        self._gerar(usuarios=30)
+        self._gerar(usuarios=50)
+        emails = Usuario.objects.filter(email__startswith='sintetico.').values_list('email', flat=True)
+        self.assertEqual(len(emails), 50)
+        self.assertIn('sintetico.0000050@lumon.com', emails)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportacaoUsuariosTests(LumonTestCase):
+    """Testes da importação de funcionários em massa (CSV)."""
+
+    def _csv(self, *linhas, cabecalho='nome;email;senha;perfil;departamento'):
+        return io.StringIO('\n'.join((cabecalho,) + linhas) + '\n')
+
+    def test_importa_linhas_validas_e_reporta_erros(self):
+        arquivo = self._csv(
+            'Helly Riggs;helly@lumon.com;abc;Funcionário;MDR',
+            'Sem Perfil;semperfil@lumon.com;abc;Estagiário;MDR',
+            'Mark Duplicado;mark@lumon.com;abc;Gerente;MDR',
+            'E-mail Ruim;nao-e-email;abc;Gerente;MDR',
+            ';;;;',
+            'Dylan George;dylan@lumon.com;;Funcionário;MDR',
+            'Burt Goodman;burt@lumon.com;xyz;gerente;Ótica e Design',
+            'Burt de Novo;burt@lumon.com;xyz;Gerente;O&D',
+        )
+        resultado = importar_usuarios(arquivo)
+
+        self.assertEqual((resultado.inseridos, resultado.atualizados), (2, 0))
+        self.assertEqual([numero for numero, _ in resultado.erros], [3, 4, 5, 7, 9])
+        burt = Usuario.objects.get(email='burt@lumon.com')
+        self.assertEqual((burt.id_perfil, burt.id_departamento), (self.gerente, self.od))
+        self.assertTrue(burt.verificar_senha('xyz'))
+        self.assertEqual(
+            QuadroFuncionarios.objects.get(id_departamento=self.od, id_perfil=self.gerente).total, 1
+        )
+
+    def test_upsert_pelo_email(self):
+        resultado = importar_usuarios(
+            self._csv('Mark S.;mark@lumon.com;nova;Funcionário;O&D'), atualizar=True
+        )
+        self.assertEqual((resultado.inseridos, resultado.atualizados), (0, 1))
+        self.mark.refresh_from_db()
+        self.assertEqual((self.mark.nome, self.mark.id_departamento), ('Mark S.', self.od))
+        self.assertTrue(self.mark.verificar_senha('nova'))
+        self.assertEqual(Usuario.objects.count(), 1)
+
+    def test_quadro_recebe_o_saldo_sem_recalcular(self):
+        with mock.patch('core.quadro.recalcular') as recalcular:
+            importar_usuarios(self._csv(
+                'Mark S.;mark@lumon.com;nova;Funcionário;O&D',
+                'Helly Riggs;helly@lumon.com;abc;Funcionário;MDR',
+                'Irving Bailiff;irving@lumon.com;abc;Funcionário;MDR',
+            ), atualizar=True)
+        recalcular.assert_not_called()
+        quadro_atual = {
+            (q.id_departamento_id, q.id_perfil_id): q.total for q in QuadroFuncionarios.objects.filter(total__gt=0)
+        }
+        self.assertEqual(quadro_atual, {(self.mdr.id, self.funcionario.id): 2, (self.od.id, self.funcionario.id): 1})
+        self.assertEqual(
+            dict(Departamento.objects.values_list('id', 'total_funcionarios')), {self.mdr.id: 2, self.od.id: 1}
+        )
+        # Confere com a reconstrução a partir da tabela de usuários
+        self.assertEqual(quadro.recalcular()[1], [])
+
+    def test_conflito_ignorado_nao_conta_como_inserido(self):
+        def cadastro_durante_o_hash(senhas, processos):
+            # Outro cadastro grava um dos e-mails enquanto as senhas são calculadas
+            Usuario.objects.create(
+                nome='Helly R.', email='helly@lumon.com', senha=self.senha_hash,
+                id_perfil=self.gerente, id_departamento=self.od,
+            )
+            return [make_password(senha) for senha in senhas]
+
+        with mock.patch('core.importacao._hash_senhas', cadastro_durante_o_hash):
+            resultado = importar_usuarios(self._csv(
+                'Helly Riggs;helly@lumon.com;abc;Funcionário;MDR',
+                'Irving Bailiff;irving@lumon.com;abc;Funcionário;MDR',
+            ))
+        self.assertEqual((resultado.inseridos, resultado.atualizados), (1, 0))
+        self.assertEqual(Usuario.objects.get(email='helly@lumon.com').nome, 'Helly R.')
+        self.assertEqual(quadro.recalcular()[1], [])
+
+    def test_hash_em_paralelo(self):
+        linhas = [f'Usuário {i};importado{i}@lumon.com;senha{i};Funcionário;MDR' for i in range(60)]
+        resultado = importar_usuarios(self._csv(*linhas), processos=2)
+        self.assertEqual(resultado.inseridos, 60)
+        usuario = Usuario.objects.get(email='importado59@lumon.com')
+        # Os processos (spawn) recebem os hashers deste processo, e não os do settings
+        self.assertTrue(usuario.senha.startswith('md5$'))
+        self.assertTrue(usuario.verificar_senha('senha59'))
+
+    @override_settings(IMPORTACAO_PROCESSOS=1)
+    def test_tela_respeita_importacao_processos(self):
+        linhas = [f'Usuário {i};importado{i}@lumon.com;senha{i};Funcionário;MDR' for i in range(60)]
+        with mock.patch('core.importacao.criar_pool_hash') as criar_pool:
+            self.assertEqual(importar_usuarios(self._csv(*linhas)).inseridos, 60)
+        criar_pool.assert_not_called()
+
+    def test_colunas_ausentes(self):
+        resultado = importar_usuarios(self._csv('Helly;helly@lumon.com', cabecalho='nome,email'))
+        self.assertEqual(resultado.total_gravados, 0)
+        self.assertIn('senha', resultado.erros[0][1])
+
+    def test_upload_pela_tela(self):
+        self.logar()
+        conteudo = '\ufeffnome;email;senha;perfil;departamento\nHelly Riggs;helly@lumon.com;abc;Funcionário;MDR\n'
+        response = self.client.post(reverse('importar_usuarios'), {
+            'arquivo': SimpleUploadedFile('funcionarios.csv', conteudo.encode('utf-8'), content_type='text/csv'),
+        }, follow=True)
+        self.assertRedirects(response, reverse('usuarios'))
+        self.assertTrue(Usuario.objects.filter(email='helly@lumon.com').exists())
+        self.assertIn('1 funcionários inseridos', [str(m) for m in response.context['messages']][0])
+
+
+class BenchmarkViewsTests(TestCase):
+    """Testes da comparação com o baseline do comando benchmark_views."""
+
+    def _resultado(self, **metricas):
+        dados = {'p50_ms': 10, 'p95_ms': 20, 'consultas': 4, 'sql_ms': 1, 'pico_memoria_kb': 200}
+        dados.update(metricas)
+        return {'banco': connection.vendor, 'tamanhos': {'1000': {'usuarios': dados}}}
+
+    def _comparar(self, baseline, atual):
+        from .management.commands.benchmark_views import Command
+        descritor, caminho = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, caminho)
+        with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo:
+            json.dump(baseline, arquivo)
+        Command(stdout=io.StringIO())._comparar(atual, caminho, 0.25)
+
+    def test_percentil(self):
+        from .management.commands.benchmark_views import percentil
+        valores = list(range(1, 101))
+        self.assertEqual(percentil(valores, 50), 50)
+        self.assertEqual(percentil(valores, 95), 95)
+        self.assertEqual(percentil([7], 95), 7)
+
+    def test_variacao_dentro_da_tolerancia(self):
+        self._comparar(self._resultado(), self._resultado(p95_ms=24, pico_memoria_kb=250))
+
+    def test_cenarios_cobrem_todas_as_urls(self):
+        from .management.commands.benchmark_views import ambiente_cenarios, cenarios, logar
+        from .urls import urlpatterns
+        call_command('gerar_dados_sinteticos', usuarios=2, stdout=io.StringIO())
+        with ambiente_cenarios():
+            lista, usuario = cenarios()
+            self.assertEqual(
+                {resolve(url).url_name for _, url, *_ in lista}, {padrao.name for padrao in urlpatterns}
+            )
+            for nome, url, metodo, kwargs, logado, _ in lista:
+                if logado == 'gerente':
+                    client = Client()
+                    logar(client, usuario, logado)
+                    self.assertEqual(getattr(client, metodo)(url, **kwargs).status_code, 200, nome)
+
+    def test_regressoes_falham(self):
+        for metricas in ({'consultas': 5}, {'p95_ms': 40}, {'pico_memoria_kb': 2000}):
+            with self.assertRaises(CommandError):
+                self._comparar(self._resultado(), self._resultado(**metricas))
+
+
+@override_settings(LOGIN_PROCESSOS=0)
+class BenchmarkSessoesTests(LumonTestCase):
+    """
+    Teste de fumaça do comando benchmark_sessoes. Senha verificada em thread:
+    um pool criado aqui manteria o hasher MD5 do comando para os demais testes.
+    """
+
+    def test_mede_todos_os_modos(self):
+        from .management.commands.benchmark_sessoes import MODOS
+        # O comando cria e destrói o próprio banco de teste; aqui o banco já existe
+        comando = 'core.management.commands.benchmark_sessoes'
+        with mock.patch(f'{comando}.setup_test_environment'), \
+                mock.patch(f'{comando}.teardown_test_environment'), \
+                mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            saida = io.StringIO()
+            call_command('benchmark_sessoes', fluxos=2, stdout=saida)
+        for nome, _, _ in MODOS:
+            self.assertIn(nome, saida.getvalue())
+
+
+class BenchmarkConexoesTests(TransactionTestCase):
+    """Testes do comando benchmark_conexoes (fecha a conexão: fora de transação)."""
+
+    @skipIf(connection.vendor == 'postgresql', 'Exige banco diferente do PostgreSQL')
+    def test_exige_postgresql(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_conexoes', stdout=io.StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Exige PostgreSQL')
+    def test_restaura_configuracao(self):
+        original = dict(connection.settings_dict)
+        saida = io.StringIO()
+        call_command(
+            'benchmark_conexoes', threads=2, requisicoes=3, modos=['sem_persistencia', 'persistente'], stdout=saida
+        )
+        self.assertIn('persistente', saida.getvalue())
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], original['CONN_MAX_AGE'])
+        self.assertEqual(connection.settings_dict['OPTIONS'], original['OPTIONS'])
+
+
+class PlanosConsultasTests(LumonTestCase):
+    """
+    Testes da verificação de planos (core/planos.py). Com poucas linhas o
+    PostgreSQL preferiria varrer a tabela, então a varredura é desestimulada
+    para verificar apenas se existe um índice para cada caminho.
+    """
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def _varreduras(self, queryset):
+        captura = CapturaConsultas()
+        with connection.execute_wrapper(captura):
+            list(queryset)
+        return [varreduras_sequenciais(explicar(sql, params)) for sql, params in captura.consultas]
+
+    def test_caminhos_criticos_usam_indices(self):
+        consultas = [
+            consultar_usuarios_relatorio(self.mdr.id),
+            consultar_usuarios_relatorio(),
+            Usuario.objects.filter(email='mark@lumon.com', id_perfil=self.gerente),
+            Usuario.objects.order_by('nome', 'id')[:6],
+        ]
+        for queryset in consultas:
+            self.assertEqual(self._varreduras(queryset), [[]])
+
+    def test_detecta_varredura_sequencial(self):
+        self.assertEqual(self._varreduras(Usuario.objects.filter(senha__contains='x')), [['usuario']])
+
+
+class SessoesTests(LumonTestCase):
+    """Testes dos modos de armazenamento de sessão e mensagens (SESSAO_ARMAZENAMENTO)."""
+
+    def _login(self):
+        return self.client.post(reverse('login'), {
+            'email': 'mark@lumon.com', 'senha': '1234', 'perfil': self.gerente.id,
+        }, follow=True)
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.cache',
+        MESSAGE_STORAGE='django.contrib.messages.storage.cookie.CookieStorage',
+    )
+    def test_sessao_em_cache_sem_tabela_de_sessoes(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._login()
+        self.assertEqual([str(m) for m in response.context['messages']], ['Bem-vindo(a), Mark Scout!'])
+        self.assertFalse([q for q in consultas if 'django_session' in q['sql']])
+
+        response = self.client.get(reverse('logout'), follow=True)
+        self.assertEqual(response.redirect_chain[-1][0], reverse('login'))
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_db_le_a_sessao_do_cache(self):
+        self._login()
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('home'))
+        self.assertFalse([q for q in consultas if 'django_session' in q['sql']])
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class ConfiguracaoTests(SimpleTestCase):
+    """Testes das configurações lidas do ambiente (config/settings.py)."""
+
+    def _carregar(self, **variaveis):
+        with mock.patch.dict(os.environ, {
+            'CACHE_BACKEND': 'locmem', 'RELATORIO_CACHE_BACKEND': 'locmem',
+            'SESSAO_CACHE_BACKEND': 'locmem', 'SESSAO_ARMAZENAMENTO': 'db', 'WEB_CONCURRENCY': '1',
+            'DB_ENGINE': 'postgresql', 'SERVIDOR_ASGI': 'False',
+            **variaveis,
+        }):
+            return runpy.run_path(str(settings.BASE_DIR / 'config' / 'settings.py'))
+
+    def test_backends_configuraveis(self):
+        caches_configurados = self._carregar(CACHE_BACKEND='redis', RELATORIO_CACHE_BACKEND='arquivo')['CACHES']
+        self.assertEqual(caches_configurados['default']['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(caches_configurados['default']['LOCATION'], 'redis://127.0.0.1:6379/0')
+        self.assertEqual(
+            caches_configurados['relatorios']['LOCATION'], str(settings.BASE_DIR / 'cache' / 'relatorios')
+        )
+
+    def test_varios_workers_exigem_caches_compartilhados(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'CACHE_BACKEND, RELATORIO_CACHE_BACKEND'):
+            self._carregar(WEB_CONCURRENCY='2')
+        with self.assertRaisesMessage(ImproperlyConfigured, 'SESSAO_CACHE_BACKEND'):
+            self._carregar(
+                WEB_CONCURRENCY='2', CACHE_BACKEND='redis', RELATORIO_CACHE_BACKEND='redis',
+                SESSAO_ARMAZENAMENTO='cache',
+            )
+        self._carregar(WEB_CONCURRENCY='2', CACHE_BACKEND='redis', RELATORIO_CACHE_BACKEND='arquivo')
+
+    def test_asgi_usa_pool_sem_conexoes_persistentes(self):
+        wsgi = self._carregar()['DATABASES']['default']
+        self.assertEqual(wsgi['CONN_MAX_AGE'], 60)
+        self.assertNotIn('pool', wsgi['OPTIONS'])
+
+        asgi = self._carregar(SERVIDOR_ASGI='True')['DATABASES']['default']
+        self.assertEqual(asgi['CONN_MAX_AGE'], 0)
+        self.assertIn('pool', asgi['OPTIONS'])
+
+
+class CacheReferenciaTests(LumonTestCase):
+    """Testes do cache de perfis e departamentos (core.cache.obter_referencia)."""
+
+    paginas = [
+        reverse('login'),
+        reverse('departamentos'),
+        reverse('usuarios'),
+        reverse('relatorio_usuarios_departamento') + '?departamento=todos',
+    ]
+
+    def _tabelas_consultadas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {tabela for tabela in ('perfil', 'departamento') for q in consultas if f'FROM "{tabela}"' in q['sql']}
+
+    def test_paginas_nao_consultam_tabelas_de_referencia(self):
+        self.logar()
+        for url in self.paginas:
+            self.client.get(url)
+        for url in self.paginas:
+            self.assertEqual(self._tabelas_consultadas(url), set(), url)
+
+        # Sem a cópia local, a versão é confirmada no cache compartilhado
+        limpar_referencias_locais()
+        self.assertEqual(self._tabelas_consultadas(reverse('usuarios')), set())
+
+    def test_signals_invalidam_perfis_e_departamentos(self):
+        self.logar()
+        self.client.get(reverse('departamentos'))
+        self.client.post(reverse('departamentos'), {'acao': 'criar', 'departamento': 'Bem-Estar', 'sigla': 'WB'})
+        self.assertContains(self.client.get(reverse('departamentos')), 'Bem-Estar')
+
+        Perfil.objects.create(perfil='Supervisor')
+        self.assertIn('Supervisor', [p.perfil for p in obter_referencia('perfis')])
+
+    def test_total_funcionarios_invalida_departamentos(self):
+        self.assertEqual({d.id: d.total_funcionarios for d in obter_referencia('departamentos')}[self.od.id], 0)
+        Usuario.objects.create(
+            nome='Irving Bailiff', email='irving@lumon.com', senha=self.senha_hash,
+            id_perfil=self.funcionario, id_departamento=self.od,
+        )
+        self.assertEqual({d.id: d.total_funcionarios for d in obter_referencia('departamentos')}[self.od.id], 1)
+
+    def test_versao_renovada_apos_o_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Perfil.objects.create(perfil='Supervisor')
+        versao = cache.get(chave_versao('perfis'))
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(chave_versao('perfis')), versao)
+
+    @override_settings(REFERENCIA_CACHE_LOCAL_SEGUNDOS=0)
+    def test_trava_evita_recarga_simultanea(self):
+        antigos = obter_referencia('perfis')
+        cache.set(chave_versao('perfis'), 'nova', None)
+
+        # Outro processo está carregando a versão nova: continua com a cópia antiga
+        cache.add(chave_referencia('perfis', 'nova') + ':trava', 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(obter_referencia('perfis'), antigos)
+
+        cache.delete(chave_referencia('perfis', 'nova') + ':trava')
+        with self.assertNumQueries(1):
+            obter_referencia('perfis')
+        with self.assertNumQueries(0):
+            obter_referencia('perfis')
+        self.assertIsNotNone(cache.get(chave_referencia('perfis', 'nova')))
+
+
+class EtagVersoesTests(LumonTestCase):
+    """Testes do GET condicional (core.decorators.etag_por_versao)."""
+
+    url_relatorio = reverse('relatorio_usuarios_departamento') + '?departamento=todos'
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+
+    def _etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_304_sem_orm_e_sem_templates(self):
+        for url in (reverse('usuarios'), self.url_relatorio):
+            etag = self._etag(url)
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.templates, [])
+            self.assertEqual([q['sql'] for q in consultas if 'django_session' not in q['sql']], [])
+            self.assertIn('private', response['Cache-Control'])
+            self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_escritas_mudam_o_etag(self):
+        etag = self._etag(reverse('usuarios'))
+        self.mark.nome = 'Mark S.'
+        self.mark.save()
+        response = self.client.get(reverse('usuarios'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Mark S.')
+
+        etag = response['ETag']
+        Perfil.objects.create(perfil='Supervisor')
+        self.assertNotEqual(self._etag(reverse('usuarios')), etag)
+
+        etag = self._etag(self.url_relatorio)
+        Departamento.objects.filter(pk=self.od.pk).update(sigla='OD')  # sem signal
+        self.assertEqual(self._etag(self.url_relatorio), etag)
+        quadro.recalcular()  # reconstrução após escritas em massa
+        self.assertNotEqual(self._etag(self.url_relatorio), etag)
+
+    def test_etag_depende_dos_parametros_do_usuario_e_do_htmx(self):
+        etag = self._etag(reverse('usuarios'))
+        self.assertNotEqual(self._etag(reverse('usuarios') + '?nome=mark'), etag)
+        self.assertNotEqual(self.client.get(reverse('usuarios'), HTTP_HX_REQUEST='true')['ETag'], etag)
+
+        outro = Usuario.objects.create(
+            nome='Helly Riggs', email='helly@lumon.com', senha=self.senha_hash,
+            id_perfil=self.funcionario, id_departamento=self.mdr,
+        )
+        etag = self._etag(reverse('usuarios'))
+        self.logar(outro)
+        self.assertEqual(self.client.get(reverse('usuarios'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_usa_a_versao_da_copia_local(self):
+        etag = self._etag(reverse('usuarios'))
+        # Outro processo criou um perfil: a cópia local (ainda válida) continua em uso
+        cache.incr(chave_versao('perfis'))
+        self.assertEqual(self.client.get(reverse('usuarios'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        limpar_referencias_locais()
+        self.assertEqual(self.client.get(reverse('usuarios'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pagina_lida_do_primario(self):
+        # Alias inexistente: qualquer leitura roteada para a réplica falharia.
+        # Fora do bloco atômico do TestCase, para que o roteador escolha a réplica
+        token = replica_atual.set('replica_atrasada')
+        self.addCleanup(replica_atual.reset, token)
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            for url in (reverse('usuarios'), self.url_relatorio):
+                self.assertContains(self.client.get(url), 'Mark Scout')
+
+    def test_mensagem_pendente_renderiza_a_pagina(self):
+        etag = self._etag(reverse('usuarios'))
+        self.client.post(reverse('usuarios'), {'acao': 'excluir', 'id': 0})
+        response = self.client.get(reverse('usuarios'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(list(response.context['messages']))
+        self.assertEqual(self.client.get(reverse('usuarios'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class CacheRelatorioTests(LumonTestCase):
+    """Testes do corpo do relatório em cache (core.relatorios.corpo_relatorio)."""
+
+    url = reverse('relatorio_usuarios_departamento') + '?departamento=todos'
+    corpo = 'relatorio_usuarios_departamento_corpo.html'
+
+    def setUp(self):
+        super().setUp()
+        self.logar()
+
+    def _consultas_relatorio(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in consultas if 'INNER JOIN "departamento"' in q['sql']]
+
+    def test_corpo_compartilhado_entre_usuarios(self):
+        helly = Usuario.objects.create(
+            nome='Helly Riggs', email='helly@lumon.com', senha=self.senha_hash,
+            id_perfil=self.funcionario, id_departamento=self.od,
+        )
+        response, consultas = self._consultas_relatorio(self.url)
+        self.assertTemplateUsed(response, self.corpo)
+        self.assertEqual(len(consultas), 1)
+
+        self.logar(helly)
+        response, consultas = self._consultas_relatorio(self.url)
+        self.assertTemplateNotUsed(response, self.corpo)
+        self.assertEqual(consultas, [])
+        # Navbar do usuário atual, corpo do cache
+        self.assertContains(response, 'Olá Helly Riggs')
+        self.assertNotContains(response, 'Olá Mark Scout')
+        self.assertContains(response, 'Mark Scout')
+
+    def test_escrita_renderiza_de_novo(self):
+        self.client.get(self.url)
+        self.mark.nome = 'Mark S.'
+        self.mark.save()
+        response, consultas = self._consultas_relatorio(self.url)
+        self.assertTemplateUsed(response, self.corpo)
+        self.assertEqual(len(consultas), 1)
+        self.assertContains(response, 'Mark S.')
+
+        # Cada filtro tem a sua entrada
+        url_mdr = reverse('relatorio_usuarios_departamento') + f'?departamento={self.mdr.id}'
+        self.assertTemplateUsed(self.client.get(url_mdr), self.corpo)
+        self.assertTemplateNotUsed(self.client.get(url_mdr), self.corpo)
+        self.assertTemplateNotUsed(self.client.get(self.url), self.corpo)
+
+    def test_corpo_lido_do_primario(self):
+        # Alias inexistente: qualquer leitura roteada para a réplica falharia.
+        # Fora do bloco atômico do TestCase, para que o roteador escolha a réplica
+        token = replica_atual.set('replica_atrasada')
+        self.addCleanup(replica_atual.reset, token)
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            for filtro in ('todos', str(self.mdr.id)):
+                self.assertIn('Mark Scout', corpo_relatorio(filtro))
+
+    def test_filtro_invalido_nao_fica_em_cache(self):
+        for valor in ('999', 'abc'):
+            url = reverse('relatorio_usuarios_departamento') + f'?departamento={valor}'
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertTemplateUsed(response, self.corpo)
+                self.assertEqual(response.context['titulo_relatorio'], 'Departamento não encontrado')
+
+    def test_trava_aguarda_quem_renderiza(self):
+        backend = caches['relatorios']
+        gerar = mock.Mock(return_value='novo')
+        backend.add('chave:trava', 1)
+        self.assertIsNone(obter_ou_gerar(backend, 'chave', gerar, 60, trava=5, espera=0))
+
+        threading.Timer(0.1, backend.set, ('chave', 'pronto')).start()
+        self.assertEqual(obter_ou_gerar(backend, 'chave', gerar, 60, trava=5, espera=5), 'pronto')
+        gerar.assert_not_called()
+
+        backend.delete('chave:trava')
+        self.assertEqual(obter_ou_gerar(backend, 'chave2', gerar, 60, trava=5, espera=5), 'novo')
+        self.assertIsNone(backend.get('chave2:trava'))
+
+    @override_settings(RELATORIO_TRAVA_SEGUNDOS=0)
+    def test_espera_esgotada_renderiza_sem_cache(self):
+        chave = chave_relatorio('todos', versoes('usuarios', 'perfis', 'departamentos'))
+        caches['relatorios'].add(chave + ':trava', 1)
+        for _ in range(2):
+            response = self.client.get(self.url)
+            self.assertTemplateUsed(response, self.corpo)
+            self.assertContains(response, 'Mark Scout')
+        self.assertIsNone(caches['relatorios'].get(chave))
+
+    def test_backend_arquivo(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        configuracao = {
+            **settings.CACHES,
+            'relatorios': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': pasta},
+        }
+        with override_settings(CACHES=configuracao):
+            self.assertTemplateUsed(self.client.get(self.url), self.corpo)
+            response = self.client.get(self.url)
+            self.assertTemplateNotUsed(response, self.corpo)
+            self.assertContains(response, 'Olá Mark Scout')
+            self.assertTrue(os.listdir(pasta))
+
+
+@override_settings(LOGIN_PROCESSOS=0, LOGIN_LIMITE_IP=(100, 60.0), LOGIN_LIMITE_EMAIL=(2, 1.0))
+class LoginAssincronoTests(LumonTestCase):
+    """Testes do login assíncrono: limite de tentativas e verificação de senha fora da requisição."""
+
+    def _login(self, senha='1234', email='mark@lumon.com', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {
+            'email': email, 'senha': senha, 'perfil': self.gerente.id,
+        }, REMOTE_ADDR=ip, follow=True)
+
+    def _mensagens(self, response):
+        return [str(m) for m in response.context['messages']]
+
+    def test_login_com_verificacao_em_thread(self):
+        response = self._login()
+        self.assertEqual(response.redirect_chain[-1][0], reverse('home'))
+        self.assertEqual(self.client.session['usuario_id'], self.mark.id)
+        self.assertEqual(cache.get(chave_usuario(self.mark.id)).id, self.mark.id)
+
+    @override_settings(LOGIN_PROCESSOS=1)
+    def test_login_com_verificacao_no_pool_de_processos(self):
+        response = self._login()
+        self.assertEqual(response.redirect_chain[-1][0], reverse('home'))
+        self.assertEqual(self._mensagens(self._login(senha='errada')), ['Senha incorreta.'])
+
+    def test_tentativas_acima_do_limite_nao_chegam_ao_hash(self):
+        with mock.patch('core.views.autenticacao.verificar_senha', wraps=autenticacao.verificar_senha) as verificar:
+            for _ in range(2):
+                self._login(senha='errada')
+            # Mesmo com a senha certa, o e-mail esgotou o balde
+            response = self._login(ip='10.0.0.2')
+        self.assertEqual(verificar.call_count, 2)
+        self.assertIn('Muitas tentativas de login', self._mensagens(response)[0])
+        self.assertNotIn('usuario_id', self.client.session)
+
+    def test_limite_por_ip_vale_para_qualquer_email(self):
+        with override_settings(LOGIN_LIMITE_IP=(1, 1.0)):
+            self._login(email='helly@lumon.com')
+            response = self._login()
+        self.assertIn('Muitas tentativas de login', self._mensagens(response)[0])
+
+    @override_settings(LOGIN_LIMITE_ATIVO=False)
+    def test_limite_desativado(self):
+        for _ in range(3):
+            self._login(senha='errada')
+        self.assertEqual(self._login().redirect_chain[-1][0], reverse('home'))
+
+    @override_settings(LOGIN_FILA_MAXIMA=0)
+    def test_fila_cheia_recusa_sem_verificar(self):
+        response = self._login()
+        self.assertIn('Muitos logins simultâneos', self._mensagens(response)[0])
+        self.assertNotIn('usuario_id', self.client.session)
+
+    def test_token_bucket_repoe_pela_taxa(self):
+        estado, espera = _consumir(None, 100.0, 2, 1.0)
+        self.assertEqual((estado, espera), ((1, 100.0), 0))
+        estado, espera = _consumir(estado, 100.0, 2, 1.0)
+        estado, espera = _consumir(estado, 100.0, 2, 1.0)
+        self.assertEqual(espera, 1.0)
+        # Meio segundo depois, meio token: espera o outro meio
+        estado, espera = _consumir(estado, 100.5, 2, 1.0)
+        self.assertEqual(espera, 0.5)
+        # A reposição não passa da capacidade
+        estado, espera = _consumir(estado, 200.0, 2, 1.0)
+        self.assertEqual((estado, espera), ((1, 200.0), 0))
+
+
+@override_settings(LOGIN_PROCESSOS=0, LOGIN_LIMITE_ATIVO=False)
+class PoliticaHashSenhaTests(LumonTestCase):
+    """Testes da política de hash (core/hashers.py) e da regravação do hash no login."""
+
+    def _login(self):
+        return self.client.post(reverse('login'), {
+            'email': 'mark@lumon.com', 'senha': '1234', 'perfil': self.gerente.id,
+        }, follow=True)
+
+    def _hash_antigo(self):
+        with override_settings(SENHA_PBKDF2_ITERACOES=1000):
+            Usuario.objects.filter(pk=self.mark.pk).update(senha=make_password('1234'))
+
+    def test_login_regrava_hash_com_custo_antigo_em_um_update(self):
+        self._hash_antigo()
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._login()
+        self.assertEqual(response.redirect_chain[-1][0], reverse('home'))
+        updates = [q['sql'] for q in consultas if q['sql'].startswith('UPDATE "usuario"')]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith('UPDATE "usuario" SET "senha"'))
+
+        senha = Usuario.objects.get(pk=self.mark.pk).senha
+        self.assertTrue(senha.startswith('pbkdf2_sha256$1000000$'))
+        self.assertTrue(check_password('1234', senha))
+
+    def test_login_com_hash_atual_nao_regrava(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self._login()
+        self.assertFalse([q for q in consultas if q['sql'].startswith('UPDATE "usuario"')])
+        self.assertEqual(Usuario.objects.get(pk=self.mark.pk).senha, self.senha_hash)
+
+    def test_senha_errada_nao_regrava(self):
+        self._hash_antigo()
+        antiga = Usuario.objects.get(pk=self.mark.pk).senha
+        self.client.post(reverse('login'), {'email': 'mark@lumon.com', 'senha': 'x', 'perfil': self.gerente.id})
+        self.assertEqual(Usuario.objects.get(pk=self.mark.pk).senha, antiga)
+
+    @override_settings(SENHA_HASHER='scrypt', PASSWORD_HASHERS=[
+        'core.hashers.ScryptLumonHasher', 'core.hashers.PBKDF2LumonHasher',
+    ])
+    def test_troca_de_algoritmo_migra_no_login(self):
+        self._login()
+        senha = Usuario.objects.get(pk=self.mark.pk).senha
+        self.assertTrue(senha.startswith('scrypt$16384$'))
+
+        # O modelo também regrava, e o save não hasheia de novo um hash scrypt
+        usuario = Usuario.objects.get(pk=self.mark.pk)
+        with override_settings(SENHA_SCRYPT_N=2**15):
+            self.assertTrue(usuario.verificar_senha('1234'))
+        usuario.save()
+        self.assertTrue(Usuario.objects.get(pk=self.mark.pk).senha.startswith('scrypt$32768$'))
+
+    def test_save_hasheia_apenas_texto_puro(self):
+        usuario = Usuario(
+            nome='Dylan George', email='dylan@lumon.com', senha='segredo',
+            id_perfil=self.funcionario, id_departamento=self.mdr,
+        )
+        usuario.save()
+        self.assertTrue(check_password('segredo', usuario.senha))
+        hash_salvo = usuario.senha
+        usuario.save()
+        self.assertEqual(usuario.senha, hash_salvo)
+
+        usuario.senha = make_password(None)  # senha inutilizável
+        usuario.save()
+        self.assertTrue(usuario.senha.startswith('!'))
+
+    def test_benchmark_hashers(self):
+        saida = io.StringIO()
+        call_command(
+            'benchmark_hashers', repeticoes=2, alvo_ms=10000, pbkdf2_iteracoes=[1000], scrypt_n=[1024],
+            argon2_memoria=[1024], stdout=saida,
+        )
+        self.assertIn('SENHA_HASHER=pbkdf2_sha256 SENHA_PBKDF2_ITERACOES=1000', saida.getvalue())
+        self.assertIn('SENHA_HASHER=scrypt SENHA_SCRYPT_N=1024', saida.getvalue())
+
+
+class InstrumentacaoTests(LumonTestCase):
+    """Testes do InstrumentacaoMiddleware (Server-Timing e log de requisições lentas)."""
+
+    def _server_timing(self, response):
+        metricas = {}
+        for item in response['Server-Timing'].split(', '):
+            nome, *atributos = item.split(';')
+            metricas[nome] = dict(a.split('=', 1) for a in atributos)
+        return metricas
+
+    def test_cabecalho_server_timing(self):
+        self.logar()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('usuarios'))
+        metricas = self._server_timing(response)
+
+        self.assertEqual(set(metricas), {'sql', 'tpl', 'app', 'total'})
+        self.assertEqual(metricas['sql']['desc'], f'"{len(ctx.captured_queries)} consultas"')
+        self.assertGreater(float(metricas['tpl']['dur']), 0)
+        soma = sum(float(metricas[m]['dur']) for m in ('sql', 'tpl', 'app'))
+        self.assertAlmostEqual(soma, float(metricas['total']['dur']), delta=0.2)
+
+    def test_requisicao_rapida_nao_gera_log(self):
+        with self.assertNoLogs('core.lentidao'):
+            self.client.get(reverse('login'))
+
+    @override_settings(REQUISICAO_LENTA_MS=0)
+    def test_requisicao_lenta_registra_sql(self):
+        self.logar()
+        with self.assertLogs('core.lentidao', 'WARNING') as logs:
+            self.client.get(reverse('usuarios'))
+        registro = json.loads(logs.records[0].getMessage())
+
+        self.assertEqual((registro['caminho'], registro['status']), ('/usuarios/', 200))
+        self.assertEqual(registro['usuario_id'], self.mark.id)
+        self.assertLessEqual(len(registro['sql_mais_lentas']), 3)
+        self.assertTrue(all(c['sql'].startswith('SELECT') for c in registro['sql_mais_lentas']))
+
+
+class PerfiladorTests(LumonTestCase):
+    """Testes do perfilador por amostragem sob demanda."""
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        ajuste = override_settings(PERFILADOR_DIR=pasta, PERFILADOR_INTERVALO_MS=1)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def logar(self, usuario=None, perfil='Gerente', **extras):
+        super().logar(usuario)
+        session = self.client.session
+        session['usuario_perfil'] = perfil
+        session.update(extras)
+        session.save()
+
+    def test_requisicao_comum_nao_e_perfilada(self):
+        self.logar()
+        response = self.client.get(reverse('usuarios'))
+        self.assertNotIn('X-Lumon-Perfil', response)
+        self.assertEqual(listar_perfis(), [])
+
+    def test_sessao_de_gerente_perfila(self):
+        self.logar(perfilar=True)
+        response = self.client.get(reverse('relatorio_usuarios_departamento'), {'departamento': 'todos'})
+        nome = response['X-Lumon-Perfil']
+        self.assertEqual([p['nome'] for p in listar_perfis()], [nome])
+
+        response = self.client.get(reverse('baixar_perfil', args=[nome]))
+        conteudo = b''.join(response.streaming_content).decode()
+        # Pilhas collapsed começando na view (sem os middlewares)
+        for linha in conteudo.splitlines():
+            pilha, total = linha.rsplit(' ', 1)
+            self.assertTrue(int(total) > 0)
+            self.assertNotIn('middleware', pilha.split(';')[0])
+
+    def test_sessao_de_funcionario_nao_perfila(self):
+        self.logar(perfil='Funcionário', perfilar=True)
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('X-Lumon-Perfil', response)
+        response = self.client.get(reverse('perfis'))
+        self.assertRedirects(response, reverse('home'))
+
+    def test_cabecalho_assinado(self):
+        response = self.client.get(reverse('login'), headers={'X-Lumon-Perfilar': gerar_token()})
+        self.assertIn('X-Lumon-Perfil', response)
+        response = self.client.get(reverse('login'), headers={'X-Lumon-Perfilar': 'perfilar:forjado'})
+        self.assertNotIn('X-Lumon-Perfil', response)
+
+    def test_view_assincrona_amostra_thread_do_loop(self):
+        async def verificar_lento(senha, codificada):
+            # Trabalho de CPU na própria corrotina (thread do loop de eventos)
+            fim = time.perf_counter() + 0.05
+            while time.perf_counter() < fim:
+                pass
+            return True, None
+
+        with mock.patch('core.autenticacao.verificar_senha', verificar_lento):
+            response = self.client.post(
+                reverse('login'),
+                {'email': 'mark@lumon.com', 'senha': '1234', 'perfil': self.gerente.id},
+                headers={'X-Lumon-Perfilar': gerar_token()},
+            )
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+        response = self.client.get(reverse('baixar_perfil', args=[response['X-Lumon-Perfil']]))
+        pilhas = [linha.rsplit(' ', 1)[0] for linha in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertTrue(any(p.startswith('login_view') and 'verificar_lento' in p for p in pilhas))
+        self.assertTrue(all(p.startswith('login_view') or p == AGUARDANDO for p in pilhas))
+
+    def test_tela_liga_desliga_e_protege_download(self):
+        self.logar()
+        self.client.post(reverse('perfis'), {'acao': 'ativar'})
+        self.assertTrue(self.client.session['perfilar'])
+        response = self.client.get(reverse('perfis'))
+        self.assertContains(response, 'X-Lumon-Perfilar:')
+        self.client.post(reverse('perfis'), {'acao': 'desativar'})
+        self.assertNotIn('perfilar', self.client.session)
+
+        response = self.client.get(reverse('baixar_perfil', args=['..%2Fsettings.txt']))
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricasTests(LumonTestCase):
+    """Testes das métricas expostas em /metrics."""
+
+    def _coletar(self):
+        from prometheus_client.parser import text_string_to_metric_families
+        response = self.client.get(reverse('metricas'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        amostras = {}
+        for familia in text_string_to_metric_families(response.content.decode()):
+            for amostra in familia.samples:
+                amostras[(amostra.name, tuple(sorted(amostra.labels.items())))] = amostra.value
+        return amostras
+
+    def _valor(self, amostras, nome, **labels):
+        return amostras.get((nome, tuple(sorted(labels.items()))), 0)
+
+    def test_metricas_por_rota(self):
+        antes = self._coletar()
+        self.logar()
+        self.client.get(reverse('usuarios'))
+        self.client.get(reverse('usuarios'))
+        self.client.get('/nao-existe/')
+        depois = self._coletar()
+
+        contagem = 'lumon_http_request_duration_seconds_count'
+        rota_usuarios = {'rota': 'usuarios', 'metodo': 'GET', 'status': '200'}
+        self.assertEqual(
+            self._valor(depois, contagem, **rota_usuarios) - self._valor(antes, contagem, **rota_usuarios), 2
+        )
+        rota_404 = {'rota': 'desconhecida', 'metodo': 'GET', 'status': '404'}
+        self.assertEqual(self._valor(depois, contagem, **rota_404) - self._valor(antes, contagem, **rota_404), 1)
+        self.assertGreater(
+            self._valor(depois, 'lumon_http_response_size_bytes_sum', rota='usuarios'),
+            self._valor(antes, 'lumon_http_response_size_bytes_sum', rota='usuarios'),
+        )
+        self.assertGreaterEqual(
+            self._valor(depois, 'lumon_db_queries_per_request_sum', rota='usuarios')
+            - self._valor(antes, 'lumon_db_queries_per_request_sum', rota='usuarios'),
+            2,
+        )
+
+    def test_contadores_de_login(self):
+        antes = self._coletar()
+        self.client.post(reverse('login'), {'email': 'mark@lumon.com', 'senha': 'errada', 'perfil': self.gerente.id})
+        self.client.post(reverse('login'), {'email': 'ninguem@lumon.com', 'senha': 'x', 'perfil': self.gerente.id})
+        depois = self._coletar()
+        for resultado in ('senha_incorreta', 'usuario_nao_encontrado'):
+            self.assertEqual(
+                self._valor(depois, 'lumon_login_total', resultado=resultado)
+                - self._valor(antes, 'lumon_login_total', resultado=resultado),
+                1,
+            )
+
+    @override_settings(METRICAS_TOKEN='segredo')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        response = self.client.get(reverse('metricas'), headers={'Authorization': 'Bearer segredo'})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicasLeituraTests(SimpleTestCase):
+    """Testes do roteador de réplicas e da fixação no primário após POST."""
+
+    def setUp(self):
+        self.roteador = RoteadorReplicas()
+        self.factory = RequestFactory()
+
+    def _na_replica(self):
+        token = replica_atual.set('replica1')
+        self.addCleanup(replica_atual.reset, token)
+
+    def _middleware(self, resposta=None):
+        """Middleware cuja view anota a réplica usada em self.usada."""
+        def view(request):
+            self.usada = replica_atual.get()
+            return resposta or HttpResponse()
+        return ReplicaLeituraMiddleware(view)
+
+    def _request(self, metodo='get', sessao=None):
+        request = getattr(self.factory, metodo)('/usuarios/')
+        request.session = {} if sessao is None else sessao
+        return request
+
+    def test_fora_de_requisicao_le_do_primario(self):
+        self.assertEqual(self.roteador.db_for_read(Usuario), 'default')
+
+    def test_leitura_na_replica(self):
+        self._na_replica()
+        self.assertEqual(self.roteador.db_for_read(Usuario), 'replica1')
+        self.assertEqual(self.roteador.db_for_read(Session), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.roteador.db_for_read(Usuario), 'default')
+
+    def test_gravacao_e_migrations_no_primario(self):
+        self._na_replica()
+        lido_da_replica = Usuario(id=1)
+        lido_da_replica._state.db = 'replica1'
+        self.assertEqual(self.roteador.db_for_write(Usuario, instance=lido_da_replica), 'default')
+        self.assertTrue(self.roteador.allow_migrate('default', 'core'))
+        self.assertFalse(self.roteador.allow_migrate('replica1', 'core'))
+
+    def test_get_usa_replica(self):
+        self._middleware()(self._request())
+        self.assertEqual(self.usada, 'replica1')
+        self.assertIsNone(replica_atual.get())
+
+    def test_post_fixa_sessao_no_primario(self):
+        sessao = {'usuario_id': 1}
+        middleware = self._middleware()
+        middleware(self._request('post', sessao))
+        self.assertIsNone(self.usada)
+        self.assertIn(ReplicaLeituraMiddleware.CHAVE_SESSAO, sessao)
+
+        middleware(self._request(sessao=sessao))
+        self.assertIsNone(self.usada)
+
+        sessao[ReplicaLeituraMiddleware.CHAVE_SESSAO] = 0
+        middleware(self._request(sessao=sessao))
+        self.assertEqual(self.usada, 'replica1')
+
+    def test_post_de_visitante_nao_cria_sessao(self):
+        sessao = {}
+        self._middleware()(self._request('post', sessao))
+        self.assertEqual(sessao, {})
+
+    def test_streaming_consumido_na_replica(self):
+        resposta = StreamingHttpResponse(replica_atual.get() or 'primario' for _ in range(2))
+        response = self._middleware(resposta)(self._request())
+        self.assertEqual(b''.join(response.streaming_content), b'replica1replica1')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_desligado_sem_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaLeituraMiddleware(lambda request: HttpResponse())
+
+
+# Réplica de verdade: a de DB_REPLICAS ou o alias espelho criado nos testes (settings.py)
+REPLICA_TESTE = (settings.DATABASE_REPLICAS or ['replica_teste'])[0]
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA_TESTE])
+class ReplicasBancoTests(TransactionTestCase):
+    """
+    Roteamento com um segundo banco (espelho do primário em TEST['MIRROR']).
+    TransactionTestCase: dentro do bloco atômico de um TestCase o roteador lê
+    sempre do primário, para enxergar as próprias gravações.
+    """
+
+    databases = {'default', REPLICA_TESTE}
+    url_exportar = reverse('exportar_usuarios_departamento') + '?departamento=todos&formato=csv'
+
+    def setUp(self):
+        cache.clear()
+        limpar_referencias_locais()
+        gerente = Perfil.objects.create(perfil='Gerente')
+        mdr = Departamento.objects.create(departamento='Refinamento de Macrodados', sigla='MDR')
+        self.mark, self.helly = (
+            Usuario.objects.create(
+                nome=nome, email=email, senha=make_password('1234'), id_perfil=gerente, id_departamento=mdr,
+            )
+            for nome, email in (('Mark Scout', 'mark@lumon.com'), ('Helly Riggs', 'helly@lumon.com'))
+        )
+        session = self.client.session
+        session['usuario_id'] = self.mark.id
+        session.save()
+
+    def _consultas(self, requisicao):
+        """Executa a requisição e retorna as consultas de (primário, réplica), sem as de sessão."""
+        with CaptureQueriesContext(connections['default']) as primario, \
+                CaptureQueriesContext(connections[REPLICA_TESTE]) as replica:
+            response = requisicao()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return tuple(
+            [q['sql'] for q in consultas if 'django_session' not in q['sql']]
+            for consultas in (primario, replica)
+        )
+
+    def test_queryset_escolhe_o_banco(self):
+        token = replica_atual.set(REPLICA_TESTE)
+        self.addCleanup(replica_atual.reset, token)
+        self.assertEqual(Usuario.objects.all().db, REPLICA_TESTE)
+        self.assertEqual(Usuario.objects.select_for_update().db, 'default')
+        self.assertEqual(Session.objects.all().db, 'default')
+        with CaptureQueriesContext(connections[REPLICA_TESTE]) as replica:
+            self.assertEqual(Usuario.objects.get(id=self.mark.id)._state.db, REPLICA_TESTE)
+            with transaction.atomic():
+                self.assertEqual(Usuario.objects.get(id=self.mark.id)._state.db, 'default')
+                Usuario.objects.filter(id=self.mark.id).update(nome='Mark S.')
+        self.assertEqual(len(replica), 1)
+
+    def test_get_na_replica_e_fixacao_apos_post(self):
+        # Consulta da exportação (o usuário logado é sempre lido do primário, core/cache.py)
+        exportacao = 'INNER JOIN "departamento"'
+        primario, replica = self._consultas(lambda: self.client.get(self.url_exportar))
+        self.assertTrue(any(exportacao in sql for sql in replica))
+        self.assertFalse(any(exportacao in sql for sql in primario))
+
+        primario, replica = self._consultas(
+            lambda: self.client.post(reverse('usuarios'), {'acao': 'excluir', 'id': self.helly.id})
+        )
+        self.assertTrue(any(sql.startswith('DELETE') for sql in primario))
+        self.assertEqual(replica, [])
+
+        # Read-your-writes: a requisição seguinte da sessão lê do primário
+        primario, replica = self._consultas(lambda: self.client.get(self.url_exportar))
+        self.assertTrue(any(exportacao in sql for sql in primario))
+        self.assertEqual(replica, [])
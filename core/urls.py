@@ -15,7 +15,16 @@ urlpatterns = [
     # Cadastros
     path('departamentos/', views.departamentos_view, name='departamentos'),
     path('usuarios/', views.usuarios_view, name='usuarios'),
+    path('usuarios/importar/', views.importar_usuarios_view, name='importar_usuarios'),
 
     # Relatórios
     path('relatorios/usuarios-departamento/', views.relatorio_usuarios_departamento_view, name='relatorio_usuarios_departamento'),
+    path('relatorios/usuarios-departamento/exportar/', views.exportar_usuarios_departamento_view, name='exportar_usuarios_departamento'),
+
+    # Métricas do Prometheus (sem barra final, como o Prometheus espera)
+    path('metrics', views.metricas_view, name='metricas'),
+
+    # Desempenho (gerentes)
+    path('perfis/', views.perfis_view, name='perfis'),
+    path('perfis/<str:nome>/', views.baixar_perfil_view, name='baixar_perfil'),
 ]
@@ -1,12 +1,44 @@
+import io
+import math
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.utils.cache import patch_vary_headers
+from . import autenticacao, metricas
 from .models import Usuario, Perfil, Departamento
+from .busca import buscar_usuarios
+from .cache import aarmazenar_usuario, aobter_referencia, obter_referencia
+from .decorators import etag_por_versao, gerente_obrigatorio, login_obrigatorio
+from .exportacao import gerar_csv, gerar_xlsx, iterar_assincrono, linhas_relatorio
+from .importacao import importar_usuarios
+from .paginacao import estimar_total, paginar_keyset
+from .perfilador import caminho_perfil, gerar_token, listar_perfis
+from .relatorios import consultar_usuarios_relatorio, corpo_relatorio
 
+# Erros de importação exibidos na tela (a lista completa sai no comando)
+MAXIMO_ERROS_IMPORTACAO = 10
 
-def login_view(request):
+
+def _requisicao_htmx_parcial(request):
+    """
+    Indica se a requisição foi feita pelo HTMX e espera apenas um fragmento.
+    A restauração de histórico do HTMX (HX-History-Restore-Request) precisa
+    da página completa.
+    """
+    return (
+        request.headers.get('HX-Request') == 'true'
+        and request.headers.get('HX-History-Restore-Request') != 'true'
+    )
+
+
+async def login_view(request):
     """
     TELA 1: Tela de autenticação
     Permite que o usuário faça login no sistema com email, senha e perfil.
+    View assíncrona: o limite de tentativas é verificado antes de qualquer
+    consulta, e a senha é verificada no pool de processos (core/autenticacao.py).
     """
     if request.method == 'POST':
         email = request.POST.get('email')
@@ -15,32 +47,53 @@ def login_view(request):
 
         # Validar campos obrigatórios
         if not email or not senha or not perfil_id:
+            metricas.registrar_login('campos_vazios')
             messages.error(request, 'Todos os campos são obrigatórios.')
             return redirect('login')
 
+        # Limite de tentativas por IP e por e-mail (força bruta não chega ao hash)
+        espera = await autenticacao.espera_limite_login(request.META.get('REMOTE_ADDR', ''), email)
+        if espera:
+            metricas.registrar_login('limitado')
+            messages.error(request, f'Muitas tentativas de login. Tente novamente em {math.ceil(espera)} segundos.')
+            return redirect('login')
+
         try:
             # Buscar usuário pelo email e perfil
-            usuario = Usuario.objects.get(email=email, id_perfil_id=perfil_id)
+            usuario = await Usuario.objects.select_related('id_perfil').aget(email=email, id_perfil_id=perfil_id)
 
             # Verificar senha
-            if usuario.verificar_senha(senha):
+            valida, novo_hash = await autenticacao.verificar_senha(senha, usuario.senha)
+            if valida:
+                if novo_hash:
+                    # Hash com algoritmo ou custo antigo: regravado com a política atual
+                    await Usuario.objects.filter(pk=usuario.pk, senha=usuario.senha).aupdate(senha=novo_hash)
+                    usuario.senha = novo_hash
                 # Login bem-sucedido - armazenar na sessão
-                request.session['usuario_id'] = usuario.id
-                request.session['usuario_nome'] = usuario.nome
-                request.session['usuario_email'] = usuario.email
-                request.session['usuario_perfil'] = usuario.id_perfil.perfil
+                await request.session.aset('usuario_id', usuario.id)
+                await request.session.aset('usuario_nome', usuario.nome)
+                await request.session.aset('usuario_email', usuario.email)
+                await request.session.aset('usuario_perfil', usuario.id_perfil.perfil)
+                await aarmazenar_usuario(usuario)
+                metricas.registrar_login('sucesso')
                 messages.success(request, f'Bem-vindo(a), {usuario.nome}!')
                 return redirect('home')
             else:
+                metricas.registrar_login('senha_incorreta')
                 messages.error(request, 'Senha incorreta.')
                 return redirect('login')
 
         except Usuario.DoesNotExist:
+            metricas.registrar_login('usuario_nao_encontrado')
             messages.error(request, 'Usuário não encontrado com este email e perfil.')
             return redirect('login')
+        except autenticacao.LoginSobrecarregado:
+            metricas.registrar_login('sobrecarregado')
+            messages.error(request, 'Muitos logins simultâneos. Tente novamente em instantes.')
+            return redirect('login')
 
     # GET - Exibir formulário de login
-    perfis = Perfil.objects.all()
+    perfis = await aobter_referencia('perfis')
     return render(request, 'login.html', {'perfis': perfis})
 
 
@@ -53,23 +106,13 @@ def logout_view(request):
     return redirect('login')
 
 
+@login_obrigatorio
 def home_view(request):
     """
     TELA 2: Menu principal
     Página inicial após o login, exibe a logo da Lumon.
     """
-    # Verificar se usuário está logado
-    if 'usuario_id' not in request.session:
-        messages.warning(request, 'Você precisa fazer login primeiro.')
-        return redirect('login')
-
-    # Buscar dados completos do usuário
-    try:
-        usuario = Usuario.objects.get(id=request.session['usuario_id'])
-    except Usuario.DoesNotExist:
-        request.session.flush()
-        messages.error(request, 'Sessão inválida. Faça login novamente.')
-        return redirect('login')
+    usuario = request.usuario
 
     context = {
         'usuario': usuario,
@@ -78,23 +121,13 @@ def home_view(request):
     return render(request, 'home.html', context)
 
 
+@login_obrigatorio
 def departamentos_view(request):
     """
     TELA 3: Cadastro de Departamentos
     CRUD completo de departamentos com listagem, criação, edição e exclusão.
     """
-    # Verificar se usuário está logado
-    if 'usuario_id' not in request.session:
-        messages.warning(request, 'Você precisa fazer login primeiro.')
-        return redirect('login')
-
-    # Buscar usuário logado
-    try:
-        usuario = Usuario.objects.get(id=request.session['usuario_id'])
-    except Usuario.DoesNotExist:
-        request.session.flush()
-        messages.error(request, 'Sessão inválida. Faça login novamente.')
-        return redirect('login')
+    usuario = request.usuario
 
     # Processar ações
     if request.method == 'POST':
@@ -146,8 +179,13 @@ def departamentos_view(request):
             dept_id = request.POST.get('id')
             try:
                 dept = Departamento.objects.get(id=dept_id)
-                dept.delete()
-                messages.success(request, 'Departamento excluído com sucesso!')
+                # O total mantido pelos signals evita tentar um DELETE que o
+                # RESTRICT recusaria; o RESTRICT continua como garantia final
+                if dept.total_funcionarios:
+                    messages.error(request, 'Não é possível excluir um departamento que possui funcionários.')
+                else:
+                    dept.delete()
+                    messages.success(request, 'Departamento excluído com sucesso!')
             except Departamento.DoesNotExist:
                 messages.error(request, 'Departamento não encontrado.')
             except Exception as e:
@@ -156,8 +194,9 @@ def departamentos_view(request):
 
         return redirect('departamentos')
 
-    # GET - Listar departamentos
-    departamentos = Departamento.objects.all().order_by('departamento')
+    # GET - Listar departamentos com o total de funcionários (Departamento.total_funcionarios),
+    # do cache de referência
+    departamentos = obter_referencia('departamentos')
 
     context = {
         'usuario': usuario,
@@ -167,23 +206,14 @@ def departamentos_view(request):
     return render(request, 'departamentos.html', context)
 
 
+@login_obrigatorio
+@etag_por_versao('usuarios', 'perfis', 'departamentos')
 def usuarios_view(request):
     """
     TELA 4: Cadastro de Usuários
     CRUD completo de usuários com upload de foto, ForeignKey e validações.
     """
-    # Verificar se usuário está logado
-    if 'usuario_id' not in request.session:
-        messages.warning(request, 'Você precisa fazer login primeiro.')
-        return redirect('login')
-
-    # Buscar usuário logado
-    try:
-        usuario_logado = Usuario.objects.get(id=request.session['usuario_id'])
-    except Usuario.DoesNotExist:
-        request.session.flush()
-        messages.error(request, 'Sessão inválida. Faça login novamente.')
-        return redirect('login')
+    usuario_logado = request.usuario
 
     # Processar ações
     if request.method == 'POST':
@@ -218,6 +248,8 @@ def usuarios_view(request):
                         id_departamento=departamento,
                         foto=foto if foto else None
                     )
+                    if foto:
+                        metricas.registrar_foto(foto)
                     messages.success(request, 'Funcionário registrado com sucesso!')
                 except (Perfil.DoesNotExist, Departamento.DoesNotExist):
                     messages.error(request, 'Perfil ou departamento inválido.')
@@ -261,6 +293,8 @@ def usuarios_view(request):
                             user.foto = foto
 
                         user.save()
+                        if foto:
+                            metricas.registrar_foto(foto)
                         messages.success(request, 'Funcionário atualizado com sucesso!')
                 except Usuario.DoesNotExist:
                     messages.error(request, 'Usuário não encontrado.')
@@ -281,25 +315,34 @@ def usuarios_view(request):
 
         return redirect('usuarios')
 
-    # GET - Listar usuários com filtro e paginação
-    from django.core.paginator import Paginator
-
-    # Filtro por nome
+    # GET - Listar usuários com filtro e paginação por cursor
+    # Busca por nome ou e-mail (similaridade no PostgreSQL, substring nos demais bancos)
     nome_filtro = request.GET.get('nome', '').strip()
     usuarios = Usuario.objects.select_related('id_perfil', 'id_departamento').all()
+    campo, decrescente = 'nome', False
 
     if nome_filtro:
-        usuarios = usuarios.filter(nome__icontains=nome_filtro)
+        usuarios, campo, decrescente = buscar_usuarios(usuarios, nome_filtro)
 
-    usuarios = usuarios.order_by('nome')
+    # Paginação keyset em (campo, id), 5 por página, sem OFFSET nem COUNT(*)
+    page_obj = paginar_keyset(usuarios, request.GET.get('cursor'), 5, campo, decrescente)
 
-    # Paginação (5 por página)
-    paginator = Paginator(usuarios, 5)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Total aproximado apenas para a listagem sem filtro
+    if not nome_filtro:
+        page_obj.total_estimado = estimar_total(Usuario)
 
-    perfis = Perfil.objects.all().order_by('perfil')
-    departamentos = Departamento.objects.all().order_by('departamento')
+    # Requisição HTMX de filtro/paginação: devolver apenas a listagem,
+    # sem navbar, scripts, modais e sem consultar perfis e departamentos
+    if _requisicao_htmx_parcial(request):
+        response = render(request, 'usuarios_lista.html', {
+            'page_obj': page_obj,
+            'nome_filtro': nome_filtro
+        })
+        patch_vary_headers(response, ['HX-Request'])
+        return response
+
+    perfis = obter_referencia('perfis')
+    departamentos = obter_referencia('departamentos')
 
     context = {
         'usuario': usuario_logado,
@@ -309,65 +352,149 @@ def usuarios_view(request):
         'departamentos': departamentos,
         'nome_filtro': nome_filtro
     }
-    return render(request, 'usuarios.html', context)
+    response = render(request, 'usuarios.html', context)
+    patch_vary_headers(response, ['HX-Request'])
+    return response
 
 
+@login_obrigatorio
+@etag_por_versao('usuarios', 'perfis', 'departamentos')
 def relatorio_usuarios_departamento_view(request):
     """
     TELA 5: Relatório de Usuários por Departamento
     Exibe relatório filtrado de usuários por departamento.
     Objetivo didático: Ensinar QuerySets com filter().
     """
-    # Verificar se usuário está logado
-    if 'usuario_id' not in request.session:
-        messages.warning(request, 'Você precisa fazer login primeiro.')
-        return redirect('login')
+    # Obter departamento selecionado (se houver)
+    departamento_id = request.GET.get('departamento', '')
 
-    # Buscar usuário logado
-    try:
-        usuario_logado = Usuario.objects.get(id=request.session['usuario_id'])
-    except Usuario.DoesNotExist:
-        request.session.flush()
-        messages.error(request, 'Sessão inválida. Faça login novamente.')
-        return redirect('login')
+    # O corpo (filtro, tabela e quadro) é o mesmo para todos e vem do cache de
+    # relatórios; navbar e mensagens do base.html são renderizadas a cada requisição
+    context = {
+        'usuario': request.usuario,
+        'user_authenticated': True,
+        'corpo_relatorio': corpo_relatorio(departamento_id),
+    }
+    return render(request, 'relatorio_usuarios_departamento.html', context)
 
-    # Obter departamento selecionado (se houver)
+
+@login_obrigatorio
+def exportar_usuarios_departamento_view(request):
+    """
+    Exporta o relatório de usuários por departamento em CSV ou XLSX.
+    O arquivo é gerado em streaming, lendo os usuários do banco em blocos,
+    para que a memória não cresça com o tamanho do relatório (no servidor
+    ASGI, por um iterador assíncrono; ver core/exportacao.py).
+    Parâmetros: ?departamento=<id|todos>&formato=<csv|xlsx>
+    """
     departamento_id = request.GET.get('departamento', '')
+    formato = request.GET.get('formato', 'csv')
 
-    # Listar todos os departamentos para o select
-    departamentos = Departamento.objects.all().order_by('departamento')
+    if formato not in ('csv', 'xlsx') or not (departamento_id == 'todos' or departamento_id.isdigit()):
+        messages.error(request, 'Parâmetros de exportação inválidos.')
+        return redirect('relatorio_usuarios_departamento')
 
-    # Filtrar usuários
-    if departamento_id and departamento_id != 'todos':
-        # Filtrar por departamento específico
-        try:
-            usuarios_filtrados = Usuario.objects.filter(
-                id_departamento_id=departamento_id
-            ).select_related('id_perfil', 'id_departamento').order_by('nome')
-
-            departamento_selecionado = Departamento.objects.get(id=departamento_id)
-            titulo_relatorio = f"Funcionários do Departamento: {departamento_selecionado.departamento}"
-        except Departamento.DoesNotExist:
-            usuarios_filtrados = Usuario.objects.none()
-            titulo_relatorio = "Departamento não encontrado"
-    elif departamento_id == 'todos':
-        # Mostrar todos os usuários
-        usuarios_filtrados = Usuario.objects.select_related(
-            'id_perfil', 'id_departamento'
-        ).all().order_by('nome')
-        titulo_relatorio = "Todos os Funcionários"
+    usuarios = consultar_usuarios_relatorio(None if departamento_id == 'todos' else departamento_id)
+    linhas = linhas_relatorio(usuarios)
+    nome_arquivo = f'usuarios_departamento_{departamento_id}.{formato}'
+
+    if formato == 'csv':
+        conteudo, content_type = gerar_csv(linhas), 'text/csv; charset=utf-8'
     else:
-        # Nenhum departamento selecionado ainda
-        usuarios_filtrados = None
-        titulo_relatorio = None
+        conteudo = gerar_xlsx(linhas)
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    if isinstance(request, ASGIRequest):
+        conteudo = iterar_assincrono(conteudo)
+
+    response = StreamingHttpResponse(conteudo, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+
+@login_obrigatorio
+def importar_usuarios_view(request):
+    """
+    Importa funcionários em massa a partir de um CSV enviado pela tela de usuários.
+    Colunas: nome;email;senha;perfil;departamento (ver core/importacao.py).
+    As linhas válidas são gravadas; as inválidas são listadas nas mensagens.
+    """
+    if request.method != 'POST':
+        return redirect('usuarios')
+
+    arquivo = request.FILES.get('arquivo')
+    if not arquivo:
+        messages.error(request, 'Selecione um arquivo CSV para importar.')
+        return redirect('usuarios')
+
+    try:
+        texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+        resultado = importar_usuarios(texto, atualizar=request.POST.get('atualizar') == 'on')
+    except UnicodeDecodeError:
+        messages.error(request, 'O arquivo deve estar codificado em UTF-8.')
+        return redirect('usuarios')
+
+    if resultado.total_gravados:
+        messages.success(
+            request,
+            f'Importação concluída: {resultado.inseridos} funcionários inseridos, '
+            f'{resultado.atualizados} atualizados.'
+        )
+    for numero, mensagem in resultado.erros[:MAXIMO_ERROS_IMPORTACAO]:
+        messages.warning(request, f'Linha {numero}: {mensagem}')
+    if len(resultado.erros) > MAXIMO_ERROS_IMPORTACAO:
+        messages.warning(
+            request,
+            f'... e mais {len(resultado.erros) - MAXIMO_ERROS_IMPORTACAO} linhas com erro. '
+            'Use o comando importar_usuarios para ver a lista completa.'
+        )
+    return redirect('usuarios')
+
+
+@gerente_obrigatorio
+def perfis_view(request):
+    """
+    Perfis de desempenho (flame graphs) gravados pelo PerfiladorMiddleware.
+    Permite ligar/desligar o perfilamento das próximas requisições do gerente
+    e exibe um token para perfilar chamadas com o cabeçalho X-Lumon-Perfilar.
+    """
+    if request.method == 'POST':
+        if request.POST.get('acao') == 'ativar':
+            request.session['perfilar'] = True
+            messages.success(request, 'Perfilamento ativado para as suas próximas requisições.')
+        else:
+            request.session.pop('perfilar', None)
+            messages.info(request, 'Perfilamento desativado.')
+        return redirect('perfis')
 
     context = {
-        'usuario': usuario_logado,
+        'usuario': request.usuario,
         'user_authenticated': True,
-        'departamentos': departamentos,
-        'usuarios_filtrados': usuarios_filtrados,
-        'departamento_selecionado': departamento_id,
-        'titulo_relatorio': titulo_relatorio,
-        'total_usuarios': usuarios_filtrados.count() if usuarios_filtrados is not None else 0
+        'perfis': listar_perfis(),
+        'perfilando': request.session.get('perfilar', False),
+        'token': gerar_token(),
+        'validade_token': settings.PERFILADOR_VALIDADE_TOKEN // 60,
     }
-    return render(request, 'relatorio_usuarios_departamento.html', context)
+    return render(request, 'perfis.html', context)
+
+
+@gerente_obrigatorio
+def baixar_perfil_view(request, nome):
+    """
+    Download de um perfil (collapsed stacks), para abrir no speedscope.app.
+    """
+    caminho = caminho_perfil(nome)
+    if caminho is None:
+        raise Http404('Perfil não encontrado.')
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=nome, content_type='text/plain')
+
+
+def metricas_view(request):
+    """
+    Métricas no formato texto do Prometheus (ver core/metricas.py).
+    Sem login; protegida por token se METRICAS_TOKEN estiver definido.
+    """
+    if settings.METRICAS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICAS_TOKEN}':
+        return HttpResponse('Não autorizado.', status=401, content_type='text/plain; charset=utf-8')
+
+    conteudo, content_type = metricas.gerar_metricas()
+    return HttpResponse(conteudo, content_type=content_type)